@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2014 deanishe@deanishe.net
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+
+"""bench_fuzzy.py [<repeat>]
+
+Compare the regex-based `MATCH_ALLCHARS` rule with the bounded-cost
+`MATCH_FUZZY` scorer on the post titles in `fixtures/hot-python.json`.
+
+Queries are abbreviations built from the first letters of two words
+of each title, e.g. "tosl" for "... converts Jupyter notebooks to
+slides". Reports time per query over all titles, ranking quality (mean
+reciprocal rank of the title each query was built from, with the other
+rules enabled as they are in the workflow) and the worst case for each
+rule, where the query's characters are all present in the title, but
+not in order.
+
+"""
+
+from __future__ import print_function, absolute_import
+
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../src'))
+
+import reddit  # noqa: E402
+from workflow import (Workflow3, MATCH_ALL,  # noqa: E402
+                      MATCH_ALLCHARS, MATCH_FUZZY)
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures/hot-python.json')
+
+
+def load_titles():
+    """Post titles from fixture."""
+    with open(FIXTURE) as fp:
+        data = json.load(fp)
+
+    return [reddit.parse_post(d).title for d in data['data']['children']]
+
+
+def abbreviations(titles, size):
+    """Return ``(query, title)`` pairs.
+
+    Query is the first ``size`` letters of the second and last words
+    of title (ignoring short words).
+
+    """
+    queries = []
+    for title in titles:
+        words = [w for w in re.findall(r'[a-z]+', title.lower())
+                 if len(w) > 3]
+        if len(words) > 2:
+            queries.append((words[1][:size] + words[-1][:size], title))
+
+    return queries
+
+
+def rank(wf, query, title, titles, match_on):
+    """Return position of ``title`` in ``titles`` filtered by ``query``."""
+    results = wf.filter(query, titles, match_on=match_on)
+    if title in results:
+        return results.index(title) + 1
+
+    return None
+
+
+def quality(wf, queries, titles, match_on):
+    """Return mean reciprocal rank and number of top hits."""
+    ranks = [rank(wf, q, t, titles, match_on) for q, t in queries]
+    mrr = sum(1.0 / r for r in ranks if r) / len(ranks)
+    return mrr, ranks.count(1)
+
+
+def speed(wf, queries, titles, match_on, repeat):
+    """Return milliseconds per query over all ``titles``."""
+    def run():
+        for q, _ in queries:
+            for t in titles:
+                wf._filter_item(t, q, match_on, True)
+
+    t = timeit.timeit(run, number=repeat)
+    return t / repeat / len(queries) * 1000
+
+
+def worst_case(wf, match_on, length=40, query=u'aaaab'):
+    """Return milliseconds to reject a title that almost matches."""
+    value = u'b' + u'a' * length
+    wf._search_pattern_cache.clear()
+    t = timeit.timeit(lambda: wf._filter_item(value, query, match_on, False),
+                      number=1)
+    return t * 1000
+
+
+def main():
+    """Run benchmark."""
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    wf = Workflow3()
+    titles = load_titles()
+    print('{} titles'.format(len(titles)))
+    print('{:<10} {:>5} {:>10} {:>7} {:>7} {:>12}'.format(
+          'rule', 'query', 'ms/query', 'MRR', 'top-1', 'worst (ms)'))
+
+    for size in (2, 3):
+        queries = abbreviations(titles, size)
+        for label, rule, rules in (
+                ('allchars', MATCH_ALLCHARS, MATCH_ALL),
+                ('fuzzy', MATCH_FUZZY, reddit.POST_MATCH)):
+            ms = speed(wf, queries, titles, rule, repeat)
+            mrr, top = quality(wf, queries, titles, rules)
+            worst = worst_case(wf, rule)
+            print('{:<10} {:>5d} {:>10.3f} {:>7.3f} {:>3d}/{:<3d} '
+                  '{:>12.3f}'.format(label, size * 2, ms, mrr, top,
+                                     len(queries), worst))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2014 deanishe@deanishe.net
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+
+"""bench_records.py [<count>]
+
+Compare size and load time of cached posts in the old format (list of
+dicts) and the compact, versioned format (tuples turned into `Post`
+objects on load). Both hold the same fields.
+
+"records" is `unpack_records()`, which creates `Post` tuples
+directly. "init" creates them by calling `Post(*t)`, as records from
+older versions are.
+
+"""
+
+from __future__ import print_function, absolute_import
+
+import cPickle
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../src'))
+
+import reddit  # noqa: E402
+
+
+def api_post(i):
+    """Fake API response for a post."""
+    permalink = '/r/python/comments/{0:x}/post_number_{0}/'.format(i)
+    if i % 3:
+        url = 'https://example.com/articles/{}.html'.format(i)
+    else:  # self post
+        url = reddit.POST_URL.format(permalink=permalink)
+
+    return {'data': {
+        'title': 'Post number {} &amp; some more words'.format(i),
+        'url': url,
+        'author': 'user{}'.format(i),
+        'subreddit': 'python',
+        'score': i * 7,
+        'created_utc': time.time() - i * 300,
+        'permalink': permalink,
+        'num_comments': i * 3,
+        'domain': 'example.com' if i % 3 else 'self.python',
+        'link_flair_text': 'Discussion' if i % 2 else None,
+        'over_18': False,
+    }}
+
+
+def as_dict(post):
+    """Convert `Post` to a dict with the same fields."""
+    return dict(zip(post._fields, post))
+
+
+def bench(label, data, load, number=200):
+    """Print size and load time of pickled ``data``."""
+    s = cPickle.dumps(data, cPickle.HIGHEST_PROTOCOL)
+    t = timeit.timeit(lambda: load(cPickle.loads(s)), number=number)
+    print('{:<8} {:>9,d} bytes  {:>7.3f} ms/load'.format(
+          label, len(s), t / number * 1000))
+
+
+def main():
+    """Run benchmark."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    posts = [reddit.parse_post(api_post(i)) for i in range(count)]
+    print('{} posts'.format(count))
+    bench('dicts', [as_dict(p) for p in posts], lambda d: d)
+    bench('records', reddit.pack_records(posts),
+          lambda d: reddit.unpack_records(d, reddit.Post))
+    bench('init', reddit.pack_records(posts),
+          lambda d: [reddit.Post(*t) for t in d['records']])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2014 deanishe@deanishe.net
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+
+"""imports.py [options]
+
+Measure the start-up cost every run of the workflow pays: how long
+importing `reddit.py` takes and which modules it loads. Fails (exits
+with status 1) if the import takes longer than <ms>, or if it loads
+any of the modules that should only be imported when they're used
+(see `LAZY`).
+
+Python 2 has no `-X importtime`, so imports are timed by a wrapper
+around `__import__`, in a fresh interpreter for each run. The fastest
+of <repeat> runs is reported. An import's own time excludes the
+modules it imports in turn. A first, untimed run writes `.pyc` files
+(as a normal run of the workflow does), so compiling isn't counted.
+
+Usage:
+    imports.py [-n <repeat>] [-b <ms>] [-t <n>]
+    imports.py --child
+    imports.py -h
+
+Options:
+    -n, --repeat <repeat>  Number of runs [default: 5]
+    -b, --budget <ms>      Max. import time in milliseconds
+                           [default: 20]
+    -t, --top <n>          Show the <n> slowest imports [default: 15]
+    --child                Import `reddit.py` and print timings as JSON
+    -h, --help             Show this help text
+
+"""
+
+from __future__ import print_function, absolute_import
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.abspath(os.path.join(HERE, '../src'))
+
+# Modules the keystroke path doesn't need. They must not be imported
+# along with `reddit.py`. (`workflow.background` is imported for
+# `is_running()`, so it mustn't import `subprocess` or `pickle` itself.)
+LAZY = [
+    'HTMLParser',
+    'cProfile',
+    'csv',
+    'datetime',
+    'gzip',
+    'mimetypes',
+    'pickle',
+    'plistlib',
+    'pstats',
+    'shutil',
+    'subprocess',
+    'tarfile',
+    'tempfile',
+    'urllib2',
+    'uuid',
+    'workflow.notify',
+    'workflow.update',
+    'workflow.web',
+    'xml.etree.ElementTree',
+    'xml.etree.cElementTree',
+]
+
+
+def measure():
+    """Import `reddit.py` and return timings."""
+    import __builtin__
+
+    real_import = __builtin__.__import__
+    imports = []
+    stack = [0.0]
+
+    def timed_import(name, globals=None, locals=None, fromlist=None,
+                     level=-1):
+        loaded = len(sys.modules)
+        stack.append(0.0)
+        start = time.time()
+        try:
+            return real_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.time() - start
+            children = stack.pop()
+            stack[-1] += elapsed
+            if len(sys.modules) != loaded:  # not already imported
+                imports.append((name, (elapsed - children) * 1000,
+                                elapsed * 1000))
+
+    before = set(sys.modules)
+    sys.path.insert(0, SRC)
+    os.chdir(SRC)
+    __builtin__.__import__ = timed_import
+    start = time.time()
+    try:
+        import reddit  # noqa: F401
+    finally:
+        total = (time.time() - start) * 1000
+        __builtin__.__import__ = real_import
+
+    modules = sorted([m for m in set(sys.modules) - before
+                      if sys.modules[m] is not None])
+    return {'total': total, 'imports': imports, 'modules': modules}
+
+
+def run_child():
+    """Run `measure()` in a new interpreter."""
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    output = subprocess.check_output([sys.executable, __file__, '--child'],
+                                     env=env)
+    return json.loads(output)
+
+
+def main():
+    """Run script."""
+    sys.path.insert(0, SRC)
+    from docopt import docopt
+    args = docopt(__doc__)
+
+    if args['--child']:
+        print(json.dumps(measure()))
+        return 0
+
+    repeat = int(args['--repeat'])
+    budget = float(args['--budget'])
+    top = int(args['--top'])
+
+    run_child()  # compile modules
+    runs = [run_child() for _ in range(repeat)]
+    best = min(runs, key=lambda r: r['total'])
+
+    print('slowest imports (own ms, total ms):')
+    for name, own, total in sorted(best['imports'],
+                                   key=lambda t: -t[1])[:top]:
+        print('  {:<32} {:8.2f} {:8.2f}'.format(name, own, total))
+    print()
+
+    print('{} module(s) loaded in {:.1f} ms (best of {}, budget {:.0f} ms)'
+          .format(len(best['modules']), best['total'], repeat, budget))
+
+    problems = []
+    if best['total'] > budget:
+        problems.append('import took {:.1f} ms, budget is {:.0f} ms'.format(
+                        best['total'], budget))
+
+    eager = [m for m in LAZY if m in best['modules']]
+    if eager:
+        problems.append('imported at start-up: ' + ', '.join(eager))
+
+    for msg in problems:
+        print('FAIL: ' + msg)
+
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
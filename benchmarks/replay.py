@@ -0,0 +1,472 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2014 deanishe@deanishe.net
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+
+"""replay.py [options]
+
+Replay typing sessions against the workflow and measure the latency
+of each keystroke as the user feels it.
+
+Each session in `sessions.json` is typed one character at a time
+after the keyword, with random gaps between keys ("|" is a longer
+pause). `reddit.py` is run as a separate process for each query the
+way Alfred runs it: after a short delay once typing stops, only one
+process at a time and only for the latest query (keys typed while the
+script is running are coalesced), again when its output asks to be
+rerun. API requests go to a local stand-in server (`standin.py`).
+
+Every replay starts with an empty cache and runs all sessions in
+order, so later sessions see what earlier ones cached. Background
+jobs are allowed to finish between replays.
+
+Reported for each step (session and query), over all replays:
+
+    wall      run time of the script process
+    felt      time from keystroke to first results
+    settled   time from keystroke to results that aren't rerun
+    req       API requests made by the script itself
+    hits      cache hits (of misses + hits)
+    jobs      background jobs started
+    reruns    times the script was rerun
+
+Compare two builds by saving the results of each, e.g. of a git
+worktree of another revision:
+
+    /usr/bin/python replay.py -o new.json
+    /usr/bin/python replay.py -s /tmp/old/src -o old.json
+    /usr/bin/python replay.py --compare old.json new.json
+
+Usage:
+    replay.py [-s <dir>] [-r <runs>] [-l <ms>] [-g <ms>] [-o <file>]
+              [-b <file>] [-t <percent>] [-f <fault>]... [--seed <n>]
+              [<session>...]
+    replay.py --compare <baseline> <results> [-t <percent>]
+    replay.py -h
+
+Options:
+    -s, --src <dir>            Directory containing reddit.py
+                               [default: ../src]
+    -r, --runs <runs>          Number of replays [default: 5]
+    -l, --latency <ms>         Latency of stand-in server [default: 150]
+    -g, --gap <ms>             Mean time between keys [default: 180]
+    -o, --output <file>        Save results as JSON to <file>
+    -b, --baseline <file>      Compare results to those saved in <file>
+    -t, --threshold <percent>  Max. slowdown of p95 latency compared to
+                               baseline [default: 10]
+    -f, --fault <fault>        Inject fault into server responses
+                               (see standin.py)
+    --seed <n>                 Seed of random key gaps [default: 1]
+    --compare                  Compare two saved results
+    -h, --help                 Show this help text
+
+<session> selects sessions by name.
+
+"""
+
+from __future__ import print_function, absolute_import
+
+from collections import OrderedDict
+import glob
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.join(HERE, '../src'))
+
+from docopt import docopt  # noqa: E402
+
+import standin  # noqa: E402
+
+PROBE = os.path.join(HERE, 'replay_probe.py')
+SESSIONS = os.path.join(HERE, 'sessions.json')
+
+# How long Alfred waits after the last key before running the script
+# ("Automatic" queue delay)
+QUEUE_DELAY = 0.1
+
+# Length of a "|" pause and of the pause after each session
+PAUSE = 1.5
+
+# Shortest gap between keys
+MIN_GAP = 0.04
+
+# Max. number of times a query is rerun
+MAX_RERUNS = 10
+
+# How long to wait for background jobs to finish after a replay
+JOB_TIMEOUT = 60
+
+
+def percentile(values, p):
+    """Return ``p``th percentile of ``values`` (nearest rank)."""
+    if not values:
+        return None
+    values = sorted(values)
+    i = int(math.ceil(p / 100.0 * len(values))) - 1
+    return values[max(0, min(i, len(values) - 1))]
+
+
+def keystrokes(keys, gap, rnd):
+    """Return ``(time, query)`` for each key typed in session ``keys``.
+
+    The first query is the empty one shown when the keyword is
+    entered.
+
+    """
+    t = 0.0
+    query = ''
+    strokes = [(t, query)]
+    pause = False
+    for c in keys:
+        if c == '|':
+            pause = True
+            continue
+        t += PAUSE if pause else max(MIN_GAP, rnd.gauss(gap, gap / 3))
+        pause = False
+        query += c
+        strokes.append((t, query))
+
+    return strokes
+
+
+class Replay(object):
+    """Run sessions against a build of the workflow.
+
+    Args:
+        srcdir (str): Directory containing ``reddit.py``.
+        server (standin.StandInServer): API stand-in.
+
+    """
+
+    def __init__(self, srcdir, server):
+        """Create new `Replay`."""
+        self.srcdir = srcdir
+        self.server = server
+        self.tmpdir = None
+        self.env = None
+
+    def setup(self):
+        """Create fresh cache and data directories."""
+        self.tmpdir = tempfile.mkdtemp(prefix='alfred-reddit-replay-')
+        cache = os.path.join(self.tmpdir, 'cache')
+        data = os.path.join(self.tmpdir, 'data')
+        os.makedirs(cache)
+        os.makedirs(data)
+        with open(os.path.join(data, 'settings.json'), 'wb') as fp:
+            json.dump({'__workflow_autoupdate': False}, fp)
+
+        self.env = dict(os.environ,
+                        alfred_workflow_bundleid='net.deanishe.alfred-reddit',
+                        alfred_workflow_cache=cache,
+                        alfred_workflow_data=data,
+                        alfred_workflow_name='Reddit',
+                        API_BASE_URL=self.server.url,
+                        GITHUB_API_URL=self.server.url,
+                        REPLAY_PROBE_OUT=os.path.join(self.tmpdir, 'probe'))
+
+    def teardown(self):
+        """Wait for background jobs and delete directories."""
+        pidfiles = os.path.join(self.env['alfred_workflow_cache'], '*.pid')
+        deadline = time.time() + JOB_TIMEOUT
+        while glob.glob(pidfiles) and time.time() < deadline:
+            time.sleep(0.1)
+
+        shutil.rmtree(self.tmpdir, True)
+
+    def run_script(self, query):
+        """Run ``reddit.py`` with ``query``.
+
+        Returns:
+            dict: Wall time, output and probe counts.
+
+        """
+        probe = self.env['REPLAY_PROBE_OUT']
+        if os.path.exists(probe):
+            os.unlink(probe)
+
+        cmd = [sys.executable, PROBE, os.path.join(self.srcdir, 'reddit.py'),
+               query.encode('utf-8')]
+        start = time.time()
+        proc = subprocess.Popen(cmd, env=self.env, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+        wall = time.time() - start
+
+        try:
+            output = json.loads(out)
+        except ValueError:
+            output = {}
+            print('[{}] invalid output (exit {}): {}'.format(
+                  query, proc.returncode, err.strip().splitlines()[-1:]),
+                  file=sys.stderr)
+
+        try:
+            with open(probe) as fp:
+                counts = json.load(fp)
+        except (IOError, ValueError):
+            counts = {}
+
+        return {'wall': wall, 'rerun': output.get('rerun'),
+                'items': len(output.get('items', [])), 'counts': counts}
+
+    def session(self, name, keys, gap, rnd):
+        """Type ``keys`` and return measurements by query."""
+        strokes = keystrokes(keys, gap, rnd)
+        steps = OrderedDict()
+        start = time.time()
+        i = 0          # next keystroke
+        query = None   # latest query
+        typed = 0.0    # when latest query was typed
+        dirty = False  # whether script hasn't run for latest query
+        rerun = None   # when to rerun script
+
+        while True:
+            now = time.time() - start
+            while i < len(strokes) and strokes[i][0] <= now:
+                typed, query = strokes[i]
+                dirty = True
+                rerun = None
+                i += 1
+
+            due = [t for t in (strokes[i][0] if i < len(strokes) else None,
+                               typed + QUEUE_DELAY if dirty else None,
+                               rerun) if t is not None]
+            if not due:
+                break
+
+            if not ((dirty and now >= typed + QUEUE_DELAY) or
+                    (rerun is not None and now >= rerun)):
+                time.sleep(max(0, min(due) - now))
+                continue
+
+            res = self.run_script(query)
+            done = time.time() - start
+            step = '{} "{}"'.format(name, query)
+            if dirty:
+                steps[step] = m = {
+                    'position': len(query),
+                    'wall': [res['wall']], 'felt': done - typed,
+                    'settled': done - typed, 'reruns': 0,
+                    'items': res['items'], 'counts': res['counts']}
+            else:
+                m = steps[step]
+                m['wall'].append(res['wall'])
+                m['settled'] = done - typed
+                m['reruns'] += 1
+                for k, v in res['counts'].items():
+                    m['counts'][k] = m['counts'].get(k, 0) + v
+
+            dirty = False
+            rerun = None
+            if res['rerun'] and m['reruns'] < MAX_RERUNS:
+                rerun = done + res['rerun']
+
+        time.sleep(PAUSE)
+        return steps
+
+    def run(self, sessions, gap, seed):
+        """Replay ``sessions`` once with empty cache."""
+        rnd = random.Random(seed)
+        self.server.reset()
+        self.setup()
+        try:
+            steps = OrderedDict()
+            for n, s in enumerate(sessions):
+                measured = self.session(s['name'], s['keys'], gap, rnd)
+                for m in measured.values():
+                    m['position'] = (n, m['position'])
+                steps.update(measured)
+        finally:
+            self.teardown()
+
+        return steps, dict(self.server.requests)
+
+
+def summarize(replays):
+    """Combine measurements of ``replays`` by step."""
+    steps = OrderedDict()
+    for measured, _ in replays:
+        for name, m in measured.items():
+            s = steps.setdefault(name, {
+                'wall': [], 'felt': [], 'settled': [], 'reruns': 0,
+                'requests': 0, 'cache_hits': 0, 'cache_misses': 0,
+                'jobs': 0, 'runs': 0, 'position': m['position']})
+            s['wall'].extend(m['wall'])
+            s['felt'].append(m['felt'])
+            s['settled'].append(m['settled'])
+            s['reruns'] += m['reruns']
+            s['runs'] += 1
+            for k in ('requests', 'cache_hits', 'cache_misses', 'jobs'):
+                s[k] += m['counts'].get(k, 0)
+
+    # Steps skipped in some replays in typing order
+    steps = OrderedDict(sorted(steps.items(),
+                               key=lambda t: t[1].pop('position')))
+
+    server = {}
+    for _, requests in replays:
+        for k, v in requests.items():
+            server[k] = server.get(k, 0) + v
+
+    for s in steps.values():
+        for k in ('wall', 'felt', 'settled'):
+            s[k + '_p'] = [percentile(s[k], p) for p in (50, 95, 99)]
+
+    felt = [v for s in steps.values() for v in s['felt']]
+    return {
+        'steps': steps,
+        'server': server,
+        'felt_p': [percentile(felt, p) for p in (50, 95, 99)],
+    }
+
+
+def ms(seconds):
+    """Format ``seconds`` as milliseconds."""
+    if seconds is None:
+        return '{:>6}'.format('-')
+    return '{:6.0f}'.format(seconds * 1000)
+
+
+def report(results):
+    """Print table of ``results``."""
+    print('{:<32} {:>3} {:>20} {:>20} {:>6} {:>5} {:>7} {:>4} {:>6}'.format(
+          'step', 'n', 'wall p50/95/99 ms', 'felt p50/95/99 ms', 'settld',
+          'req', 'hits', 'jobs', 'reruns'))
+    for name, s in results['steps'].items():
+        print('{:<32} {:>3} {} {} {} {:>5} {:>7} {:>4} {:>6}'.format(
+              name[:32], s['runs'], ''.join([ms(v) for v in s['wall_p']]),
+              ' ' + ''.join([ms(v) for v in s['felt_p']]),
+              ms(s['settled_p'][0]), s['requests'],
+              '{}/{}'.format(s['cache_hits'],
+                             s['cache_hits'] + s['cache_misses']),
+              s['jobs'], s['reruns']))
+
+    print('\nfelt latency of all steps: p50 {} ms, p95 {} ms, p99 {} ms'
+          .format(*[ms(v).strip() for v in results['felt_p']]))
+    print('stand-in server requests: ' + ', '.join(
+          ['{} {}'.format(k, v) for k, v in sorted(results['server'].items())])
+          or 'none')
+
+
+def load(path):
+    """Load results saved in ``path``."""
+    with open(path) as fp:
+        return json.load(fp, object_pairs_hook=OrderedDict)
+
+
+def compare(baseline, results, threshold):
+    """Print comparison of ``results`` to ``baseline``.
+
+    Returns:
+        list: Steps whose p95 felt latency is more than ``threshold``
+            percent higher than in ``baseline``.
+
+    """
+    regressions = []
+    rows = [('all steps', baseline['felt_p'], results['felt_p'])]
+    for name, s in results['steps'].items():
+        old = baseline['steps'].get(name)
+        rows.append((name, old['felt_p'] if old else None, s['felt_p']))
+
+    print('{:<32} {:>14} {:>14} {:>8}'.format(
+          'felt latency (ms)', 'p50', 'p95', 'change'))
+    for name, old, new in rows:
+        if not old:
+            print('{:<32} {:>14} {:>14}  (new)'.format(
+                  name[:32], ms(new[0]).strip(), ms(new[1]).strip()))
+            continue
+
+        change = (new[1] - old[1]) / old[1] * 100 if old[1] else 0.0
+        flag = ''
+        if change > threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        elif change < -threshold:
+            flag = 'faster'
+
+        print('{:<32} {:>14} {:>14} {:+7.1f}%  {}'.format(
+              name[:32],
+              '{} -> {}'.format(ms(old[0]).strip(), ms(new[0]).strip()),
+              '{} -> {}'.format(ms(old[1]).strip(), ms(new[1]).strip()),
+              change, flag))
+
+    return regressions
+
+
+def main():
+    """Run replays."""
+    args = docopt(__doc__)
+    threshold = float(args['--threshold'])
+
+    if args['--compare']:
+        baseline = load(args['<baseline>'])
+        results = load(args['<results>'])
+        return 1 if compare(baseline, results, threshold) else 0
+
+    srcdir = os.path.abspath(os.path.join(os.getcwd(), args['--src']))
+    if args['--src'] == '../src':
+        srcdir = os.path.join(HERE, '../src')
+
+    with open(SESSIONS) as fp:
+        sessions = json.load(fp)
+    if args['<session>']:
+        sessions = [s for s in sessions if s['name'] in args['<session>']]
+
+    try:
+        faults = [standin.Fault.parse(s) for s in args['--fault']]
+    except ValueError as err:
+        print(err, file=sys.stderr)
+        return 1
+
+    server = standin.serve(latency=float(args['--latency']) / 1000,
+                           faults=faults)
+    replay = Replay(srcdir, server)
+    gap = float(args['--gap']) / 1000
+    seed = int(args['--seed'])
+    replays = []
+    try:
+        for i in range(int(args['--runs'])):
+            print('replay {}/{} ...'.format(i + 1, args['--runs']),
+                  file=sys.stderr)
+            replays.append(replay.run(sessions, gap, seed + i))
+    finally:
+        server.shutdown()
+
+    results = summarize(replays)
+    results.update(src=srcdir, python=platform.python_version(),
+                   date=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   latency=float(args['--latency']),
+                   faults=args['--fault'])
+    report(results)
+
+    if args['--output']:
+        with open(args['--output'], 'wb') as fp:
+            json.dump(results, fp, indent=2)
+
+    if args['--baseline']:
+        baseline = load(args['--baseline'])
+        print()
+        regressions = compare(baseline, results, threshold)
+        if regressions:
+            print('\n{} regression(s) over {}%'.format(len(regressions),
+                                                       threshold))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2014 deanishe@deanishe.net
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+
+"""replay_probe.py <script> [<arg>...]
+
+Run workflow script <script> the way Alfred does (in its directory,
+with <arg>s as its arguments) and count what it does. Used by
+`replay.py` in place of running the script directly.
+
+The counts are saved as JSON to the file named by `REPLAY_PROBE_OUT`:
+
+    requests      HTTP requests made by the script itself (not by
+                  the background jobs it starts)
+    cache_hits    calls to `Workflow.cached_data()` that returned data
+    cache_misses  calls to `Workflow.cached_data()` that didn't
+    jobs          background jobs started
+
+"""
+
+from __future__ import print_function, absolute_import
+
+import json
+import os
+import runpy
+import sys
+
+counts = {'requests': 0, 'cache_hits': 0, 'cache_misses': 0, 'jobs': 0}
+
+
+def install(srcdir):
+    """Wrap the workflow library functions that are counted."""
+    sys.path.insert(0, srcdir)
+    from workflow import background, web
+    from workflow.workflow import Workflow
+
+    request = web.request
+    cached_data = Workflow.cached_data
+    run_in_background = background.run_in_background
+
+    def counted_request(*args, **kwargs):
+        counts['requests'] += 1
+        return request(*args, **kwargs)
+
+    def counted_cached_data(self, *args, **kwargs):
+        data = cached_data(self, *args, **kwargs)
+        counts['cache_misses' if data is None else 'cache_hits'] += 1
+        return data
+
+    def counted_run_in_background(*args, **kwargs):
+        retcode = run_in_background(*args, **kwargs)
+        if retcode is not None:  # None if job is already running
+            counts['jobs'] += 1
+        return retcode
+
+    web.request = counted_request
+    Workflow.cached_data = counted_cached_data
+    background.run_in_background = counted_run_in_background
+
+
+def main():
+    """Run script."""
+    script = os.path.abspath(sys.argv[1])
+    srcdir = os.path.dirname(script)
+    os.chdir(srcdir)
+    install(srcdir)
+    sys.argv = sys.argv[1:]
+    try:
+        runpy.run_path(script, run_name='__main__')
+    finally:
+        path = os.getenv('REPLAY_PROBE_OUT')
+        if path:
+            with open(path, 'wb') as fp:
+                json.dump(counts, fp)
+
+
+if __name__ == '__main__':
+    main()
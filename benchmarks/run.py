@@ -0,0 +1,525 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2014 deanishe@deanishe.net
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+
+"""run.py [options] [<pattern>...]
+
+Time the workflow's hot paths on the API responses in `fixtures/`.
+No network access is needed.
+
+The fixtures are synthetic, not recorded from reddit.com: titles and
+bodies are made up, but each post and subreddit has the ~100 fields
+of Reddit's JSON listings, self posts have Markdown and escaped HTML
+bodies, and some titles contain HTML entities, so payload sizes and
+parsing costs are close to real ones. To time real responses, record
+them with `standin.py --record` and save the `body` of the recordings
+of `/r/python/hot.json` and `/subreddits/popular.json` as the
+fixtures.
+
+`bench_fuzzy.py` and `bench_records.py` compare alternative
+implementations rather than timing the current one. `replay.py`
+measures whole runs of the workflow as the user types.
+
+Each benchmark is run often enough to take at least 0.1 seconds, and
+this is repeated. The fastest time per call is reported.
+
+Save results of a known-good build and compare later runs to them to
+find regressions:
+
+    /usr/bin/python run.py -o baseline.json
+    /usr/bin/python run.py -b baseline.json
+
+Usage:
+    run.py [-n <repeat>] [-o <file>] [-b <file>] [-t <percent>] [<pattern>...]
+    run.py --compare <baseline> <results> [-t <percent>]
+    run.py --list
+    run.py -h
+
+Options:
+    -n, --repeat <repeat>      Number of timing runs [default: 5]
+    -o, --output <file>        Save results as JSON to <file>
+    -b, --baseline <file>      Compare results to those saved in <file>
+    -t, --threshold <percent>  Max. slowdown compared to baseline
+                               [default: 10]
+    --compare                  Compare two saved results
+    -l, --list                 List names of benchmarks
+    -h, --help                 Show this help text
+
+<pattern> selects benchmarks whose names contain it, e.g. "filter/".
+
+"""
+
+from __future__ import print_function, absolute_import
+
+import atexit
+import fnmatch
+import gzip
+import json
+import mimetools
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+import urllib
+import urllib2
+from StringIO import StringIO
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.join(HERE, '../src'))
+
+# Keep the benchmarks' cache and data out of the real workflow's
+_tmpdir = tempfile.mkdtemp(prefix='alfred-reddit-bench-')
+atexit.register(shutil.rmtree, _tmpdir, True)
+for _k, _v in (('alfred_workflow_bundleid', 'net.deanishe.alfred-reddit'),
+               ('alfred_workflow_cache', os.path.join(_tmpdir, 'cache')),
+               ('alfred_workflow_data', os.path.join(_tmpdir, 'data')),
+               ('alfred_workflow_name', 'Reddit')):
+    os.environ[_k] = _v
+
+import reddit  # noqa: E402
+from docopt import docopt  # noqa: E402
+from workflow import (Workflow3, web, MATCH_ALL,  # noqa: E402
+                      MATCH_ALLCHARS, MATCH_FUZZY, MATCH_STARTSWITH,
+                      MATCH_SUBSTRING)
+from workflow.workflow import manager  # noqa: E402
+
+FIXTURES = os.path.join(HERE, 'fixtures')
+
+# Min. duration of one timing run
+MIN_TIME = 0.1
+
+# Benchmarks as (name, setup) tuples. ``setup`` returns the function
+# to time.
+BENCHMARKS = []
+
+# Queries for filter benchmarks
+QUERIES = ['py', 'asyncio', 'dj rest', 'pyst']
+
+# Match rules for filter benchmarks
+MATCH_MODES = [
+    ('all', MATCH_ALL),
+    ('posts', reddit.POST_MATCH),
+    ('startswith', MATCH_STARTSWITH),
+    ('substring', MATCH_SUBSTRING),
+    ('allchars', MATCH_ALLCHARS),
+    ('fuzzy', MATCH_FUZZY),
+]
+
+# Number of items to filter
+CORPUS_SIZES = [60, 600, 6000]
+
+wf = None
+
+
+def benchmark(name):
+    """Register decorated setup function as benchmark ``name``."""
+    def wrapper(func):
+        BENCHMARKS.append((name, func))
+        return func
+
+    return wrapper
+
+
+def fixture(name):
+    """Return contents of fixture ``name``."""
+    with open(os.path.join(FIXTURES, name), 'rb') as fp:
+        return fp.read()
+
+
+def listing(name):
+    """Return children of API listing in fixture ``name``."""
+    return json.loads(fixture(name))['data']['children']
+
+
+def posts():
+    """Posts parsed from fixture."""
+    return [reddit.parse_post(d) for d in listing('hot-python.json')]
+
+
+def titles(size):
+    """Return ``size`` post titles from fixture.
+
+    Titles are repeated with a number appended, so they are all
+    different.
+
+    """
+    base = [p.title for p in posts()]
+    return [u'{} {}'.format(base[i % len(base)], i // len(base))
+            for i in range(size)]
+
+
+# ------------------------------------------------------------------
+# Filtering
+# ------------------------------------------------------------------
+
+def _register_filter(label, match_on, size):
+    @benchmark('filter/{}/{}'.format(label, size))
+    def setup():
+        items = titles(size)
+
+        def run():
+            for q in QUERIES:
+                wf.filter(q, items, match_on=match_on)
+
+        return run
+
+
+for _label, _match_on in MATCH_MODES:
+    for _size in CORPUS_SIZES:
+        _register_filter(_label, _match_on, _size)
+
+
+def _register_filter_item(label, match_on):
+    @benchmark('filter_item/{}'.format(label))
+    def setup():
+        items = titles(60)
+
+        def run():
+            for q in QUERIES:
+                for value in items:
+                    wf._filter_item(value, q.split()[0], match_on, True)
+
+        return run
+
+
+for _label, _match_on in MATCH_MODES:
+    _register_filter_item(_label, _match_on)
+
+
+@benchmark('filter/posts/top10/6000')
+def filter_top():
+    """Filter with `max_results`, which selects results with a heap."""
+    items = titles(6000)
+
+    def run():
+        for q in QUERIES:
+            wf.filter(q, items, match_on=reddit.POST_MATCH, max_results=10)
+
+    return run
+
+
+# ------------------------------------------------------------------
+# Parsing API responses
+# ------------------------------------------------------------------
+
+@benchmark('parse/post')
+def parse_post():
+    children = listing('hot-python.json')
+
+    def run():
+        for d in children:
+            reddit.parse_post(d)
+
+    return run
+
+
+@benchmark('parse/subreddit')
+def parse_subreddit():
+    children = listing('popular-subreddits.json')
+
+    def run():
+        for d in children:
+            reddit.parse_subreddit(d)
+
+    return run
+
+
+@benchmark('parse/html_entities')
+def html_entities():
+    strings = [d['data']['title'] for d in listing('popular-subreddits.json')]
+    strings += [p.title for p in posts()]
+
+    def run():
+        for s in strings:
+            reddit.decode_html_entities(s)
+
+    return run
+
+
+@benchmark('parse/query')
+def parse_query():
+    queries = ['python', 'python/', 'python/asyncio',
+               'python/score>500 age<6h asyncio sort:comments',
+               'u/someone/m/multi/rust', 'a+b+c/', '*/django']
+
+    def run():
+        for q in queries:
+            name, slash, query = reddit.parse_query(q)
+            reddit.parse_post_query(query)
+
+    return run
+
+
+def _register_args(label, cachedir):
+    @benchmark('parse/args/{}'.format(label))
+    def parse_args():
+        argvs = [['python'], ['python/asyncio'], ['--search', 'python'],
+                 ['--update'], ['-c', '-p']]
+
+        def run():
+            for argv in argvs:
+                docopt(reddit.__doc__, argv, cachedir=cachedir)
+
+        return run
+
+
+_register_args('compile', None)
+_register_args('cached', _tmpdir)
+
+
+# ------------------------------------------------------------------
+# Caching
+# ------------------------------------------------------------------
+
+def _register_cache(serializer):
+    @benchmark('cache/store/{}'.format(serializer))
+    def store():
+        data = reddit.pack_records(posts() * 8)
+
+        def run():
+            wf.cache_serializer = serializer
+            wf.cache_data('bench', data)
+
+        return run
+
+    @benchmark('cache/load/{}'.format(serializer))
+    def load():
+        wf.cache_serializer = serializer
+        wf.cache_data('bench', reddit.pack_records(posts() * 8))
+
+        def run():
+            wf.cache_serializer = serializer
+            reddit.unpack_records(wf.cached_data('bench', max_age=0),
+                                  reddit.Post)
+
+        return run
+
+
+for _serializer in manager.serializers:
+    _register_cache(_serializer)
+
+
+# ------------------------------------------------------------------
+# Output
+# ------------------------------------------------------------------
+
+class NullWriter(object):
+    """Stand-in for `sys.stdout` that discards output."""
+
+    def write(self, s):
+        pass
+
+    def flush(self):
+        pass
+
+
+def _send_feedback():
+    """Send feedback to `NullWriter` and clear items."""
+    stdout = sys.stdout
+    sys.stdout = NullWriter()
+    try:
+        wf.send_feedback()
+    finally:
+        sys.stdout = stdout
+        wf._items = []
+
+
+@benchmark('feedback/items')
+def feedback_items():
+    """Build and send items for posts."""
+    items = posts()
+
+    def run():
+        for post in items:
+            wf._items.append(reddit.post_item(post))
+        _send_feedback()
+
+    return run
+
+
+@benchmark('feedback/rendered')
+def feedback_rendered():
+    """Send cached items for posts, adding their subtitles."""
+    items = posts()
+    key = '--subreddit-benchmark'
+    reddit.rendered_posts(key, items)  # populate cache
+
+    def run():
+        for fragment in reddit.rendered_posts(key, items):
+            wf.add_rendered_item(fragment)
+        _send_feedback()
+
+    return run
+
+
+# ------------------------------------------------------------------
+# HTTP
+# ------------------------------------------------------------------
+
+class FixtureHandler(urllib2.BaseHandler):
+    """Serve ``fixture://<name>`` URLs gzipped, like Reddit's API."""
+
+    def fixture_open(self, request):
+        """Return fixture as gzipped HTTP response."""
+        path = request.get_host() + request.get_selector().split('?')[0]
+        name = path.rstrip('/')
+        buf = StringIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb') as fp:
+            fp.write(fixture(name))
+
+        headers = mimetools.Message(StringIO(
+            'Content-Type: application/json; charset=UTF-8\r\n'
+            'Content-Encoding: gzip\r\n\r\n'))
+        r = urllib.addinfourl(StringIO(buf.getvalue()), headers,
+                              request.get_full_url(), 200)
+        r.msg = 'OK'
+        return r
+
+
+@benchmark('web/gzip_json')
+def web_gzip():
+    # `web.request()` builds a new opener for every request
+    build_opener = urllib2.build_opener
+    urllib2.build_opener = lambda *handlers: build_opener(FixtureHandler,
+                                                          *handlers)
+
+    def run():
+        web.get('fixture://hot-python.json', params={'limit': 50}).json()
+
+    return run
+
+
+# ------------------------------------------------------------------
+# Running and comparing
+# ------------------------------------------------------------------
+
+def measure(func, repeat):
+    """Return fastest time per call of ``func`` over ``repeat`` runs."""
+    number = 1
+    while True:
+        t = timeit.timeit(func, number=number)
+        if t >= MIN_TIME:
+            break
+        number *= 2 if t * 10 > MIN_TIME else 10
+
+    times = [t / number]
+    for _ in range(repeat - 1):
+        times.append(timeit.timeit(func, number=number) / number)
+
+    return min(times), number
+
+
+def format_time(seconds):
+    """Format ``seconds`` as µs or ms."""
+    if seconds < 0.001:
+        return '{:8.1f} µs'.format(seconds * 1e6)
+    return '{:8.2f} ms'.format(seconds * 1e3)
+
+
+def selected(patterns):
+    """Benchmarks whose names match ``patterns``."""
+    if not patterns:
+        return BENCHMARKS
+
+    return [(name, setup) for name, setup in BENCHMARKS
+            if any([p in name or fnmatch.fnmatch(name, p)
+                    for p in patterns])]
+
+
+def run(benchmarks, repeat):
+    """Run ``benchmarks`` and return results."""
+    results = {}
+    for name, setup in benchmarks:
+        func = setup()
+        best, number = measure(func, repeat)
+        results[name] = {'time': best, 'number': number}
+        print('{:<32} {}'.format(name, format_time(best)))
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def compare(baseline, results, threshold):
+    """Print comparison of ``results`` to ``baseline``.
+
+    Returns:
+        list: Names of benchmarks that are more than ``threshold``
+            percent slower than in ``baseline``.
+
+    """
+    regressions = []
+    for name in sorted(results['results']):
+        new = results['results'][name]['time']
+        old = baseline['results'].get(name, {}).get('time')
+        if not old:
+            print('{:<32} {}  (new)'.format(name, format_time(new)))
+            continue
+
+        change = (new - old) / old * 100
+        flag = ''
+        if change > threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        elif change < -threshold:
+            flag = 'faster'
+
+        print('{:<32} {} -> {}  {:+6.1f}%  {}'.format(
+              name, format_time(old), format_time(new), change, flag))
+
+    return regressions
+
+
+def main():
+    """Run benchmarks."""
+    global wf
+    args = docopt(__doc__)
+    threshold = float(args['--threshold'])
+
+    if args['--list']:
+        for name, _ in BENCHMARKS:
+            print(name)
+        return 0
+
+    if args['--compare']:
+        with open(args['<baseline>']) as fp:
+            baseline = json.load(fp)
+        with open(args['<results>']) as fp:
+            results = json.load(fp)
+        return 1 if compare(baseline, results, threshold) else 0
+
+    wf = reddit.wf = Workflow3()
+    reddit.log = wf.logger
+
+    results = run(selected(args['<pattern>']), int(args['--repeat']))
+
+    if args['--output']:
+        with open(args['--output'], 'wb') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+
+    if args['--baseline']:
+        with open(args['--baseline']) as fp:
+            baseline = json.load(fp)
+        print()
+        regressions = compare(baseline, results, threshold)
+        if regressions:
+            print('\n{} regression(s) over {}%'.format(len(regressions),
+                                                       threshold))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
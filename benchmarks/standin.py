@@ -0,0 +1,770 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2014 deanishe@deanishe.net
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+
+"""standin.py [options] [<fault>...]
+
+Local stand-in for the parts of the Reddit and GitHub APIs the
+workflow uses. It serves listings built from the synthetic responses
+in `fixtures/` (see `run.py`), so the workflow can be run end to end
+without network access.
+
+Point the workflow at it with the `API_BASE_URL` (Reddit) and
+`GITHUB_API_URL` (updates) variables:
+
+    export API_BASE_URL=http://127.0.0.1:8765
+    export GITHUB_API_URL=http://127.0.0.1:8765
+    /usr/bin/python reddit.py python/
+
+Endpoints:
+
+    /r/<name>/hot.json           Hot posts (5 pages). <name> may be a
+                                 combined feed ("a+b"). 404 if no
+                                 subreddit of that name exists.
+    /r/<name>/search.json        Posts whose titles contain all words
+                                 of the "q" parameter
+    /u/<user>/m/<multi>.json     Hot posts of user multi
+    /subreddits/popular.json     500+ subreddits, paged by "after"
+    /subreddits/search.json      Subreddits whose names or titles
+                                 contain the "q" parameter
+    /repos/<user>/<repo>/releases
+                                 GitHub releases (see --release)
+    /download/<file>             Workflow file of a release
+
+Responses are gzipped if the client accepts it and carry Reddit's
+rate-limit headers.
+
+Recordings:
+
+With --record, requests are passed on to reddit.com or api.github.com
+and the responses saved in the --recordings directory. Without it,
+responses saved there are served instead of the generated ones.
+
+Faults:
+
+Each <fault> is injected into the responses to matching requests. The
+format is `<kind>[=<value>][@<text>][*<count>]`: only requests whose
+path contains <text> are affected, and only the next <count> of them.
+
+    latency=<ms>         delay response
+    gzip                 gzip response even if the client didn't ask
+    chunked              send response in chunks (HTTP/1.1)
+    redirect             redirect to subreddit search, like Reddit
+                         does for subreddits that don't exist
+    ratelimit=<seconds>  429 response with Retry-After header
+    status=<code>        error response, e.g. status=503
+    truncate=<fraction>  close connection after <fraction> of body
+
+A bare status code is short for `status=<code>`, and 429 for
+`ratelimit=60`. E.g. `503@hot.json*2` fails the next two requests
+for hot posts.
+
+Faults can be changed while the server is running:
+
+    /_standin/faults             list faults
+    /_standin/faults?set=<fault> replace faults (repeat to set several)
+    /_standin/faults?add=<fault> add fault
+    /_standin/faults?clear=1     remove all faults
+    /_standin/requests           request counts by endpoint
+    /_standin/requests?reset=1   reset request counts and rate limit
+
+Usage:
+    standin.py [-p <port>] [-l <ms>] [-j <ms>] [-d <dir> [--record]]
+               [-R <tag>]... [<fault>...]
+    standin.py -h
+
+Options:
+    -p, --port <port>        Port to listen on [default: 8765]
+    -l, --latency <ms>       Delay before each response [default: 0]
+    -j, --jitter <ms>        Max. random variation of latency [default: 0]
+    -d, --recordings <dir>   Directory of recorded responses
+    --record                 Save real responses to --recordings
+    -R, --release <tag>      Tag of GitHub release (repeatable).
+                             Defaults to version in ../src/info.plist.
+    -h, --help               Show this help text
+
+"""
+
+from __future__ import print_function, absolute_import
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from collections import defaultdict
+import copy
+import gzip
+import hashlib
+import json
+import os
+import plistlib
+import random
+import re
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+import sys
+import threading
+import time
+import urllib
+import urllib2
+import urlparse
+import zipfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(HERE, 'fixtures')
+INFO_PLIST = os.path.join(HERE, '../src/info.plist')
+
+# Real servers used by --record
+REDDIT_URL = 'https://www.reddit.com'
+GITHUB_URL = 'https://api.github.com'
+
+# Number of pages of hot posts in each subreddit
+HOT_PAGES = 5
+
+# Total number of subreddits, padded with generated ones
+SUBREDDIT_COUNT = 600
+
+# Rate-limit headers sent with each response
+RATELIMIT_REQUESTS = 600
+RATELIMIT_PERIOD = 600
+
+# Kinds of fault and their default values
+FAULTS = {
+    'latency': 1000,
+    'gzip': None,
+    'chunked': None,
+    'redirect': None,
+    'ratelimit': 60,
+    'status': 500,
+    'truncate': 0.5,
+}
+
+# Size of chunks of chunked responses
+CHUNK_SIZE = 1024
+
+# Headers of real responses kept in recordings
+RECORDED_HEADERS = ('content-type', 'location', 'retry-after',
+                    'x-ratelimit-remaining', 'x-ratelimit-reset',
+                    'x-ratelimit-used')
+
+
+def fixture(name):
+    """Return parsed JSON fixture ``name``."""
+    with open(os.path.join(FIXTURES, name)) as fp:
+        return json.load(fp)
+
+
+def listing(children, after=None):
+    """Wrap ``children`` in an API listing."""
+    return {'kind': 'Listing',
+            'data': {'children': children, 'after': after, 'before': None}}
+
+
+def load_subreddits():
+    """Return subreddits from fixture plus generated ones, most popular
+    first.
+    """
+    subreddits = [c['data'] for c in
+                  fixture('popular-subreddits.json')['data']['children']]
+    template = subreddits[-1]
+    for i in range(len(subreddits), SUBREDDIT_COUNT):
+        name = 'sub{:04d}'.format(i)
+        d = copy.deepcopy(template)
+        d.update(display_name=name, display_name_prefixed='r/' + name,
+                 title='Subreddit {}'.format(i), url='/r/{}/'.format(name),
+                 public_description='Generated subreddit', over18=False,
+                 subscribers=max(1000, template['subscribers'] - i * 100))
+        subreddits.append(d)
+
+    return subreddits
+
+
+def workflow_version():
+    """Return version of workflow in ``src``."""
+    try:
+        return plistlib.readPlist(INFO_PLIST)['version']
+    except (IOError, KeyError):
+        return '1.0'
+
+
+def recording_name(path):
+    """Return filename of recorded response to request for ``path``."""
+    url = urlparse.urlsplit(path)
+    name = re.sub(r'[^\w.-]+', '_', os.path.splitext(url.path)[0].strip('/'))
+    if url.query:
+        query = urllib.urlencode(sorted(urlparse.parse_qsl(url.query)))
+        name += '-' + hashlib.md5(query).hexdigest()[:10]
+    return name + '.json'
+
+
+class Fault(object):
+    """Fault injected into responses.
+
+    Args:
+        kind (str): Key of `FAULTS`.
+        value (object, optional): Parameter of fault, e.g. delay of
+            ``latency``.
+        match (str, optional): Only requests whose path contains
+            ``match`` are affected.
+        count (int, optional): How many requests are affected.
+            ``None`` means all.
+
+    """
+
+    _spec = re.compile(r'(\w+)(?:=([^@*]+))?(?:@([^*]+))?(?:\*(\d+))?$')
+
+    def __init__(self, kind, value=None, match=None, count=None):
+        """Create new `Fault`."""
+        if kind not in FAULTS:
+            raise ValueError('unknown fault: {!r}'.format(kind))
+        self.kind = kind
+        self.value = value if value is not None else FAULTS[kind]
+        self.match = match
+        self.count = count
+
+    @classmethod
+    def parse(cls, spec):
+        """Create `Fault` from ``spec`` (see module docs)."""
+        m = cls._spec.match(spec)
+        if not m:
+            raise ValueError('invalid fault: {!r}'.format(spec))
+
+        kind, value, match, count = m.groups()
+        if kind.isdigit():
+            kind, value = ('ratelimit', None) if kind == '429' \
+                else ('status', kind)
+
+        if value is not None and FAULTS.get(kind) is not None:
+            value = type(FAULTS[kind])(value)
+
+        return cls(kind, value, match, int(count) if count else None)
+
+    def __str__(self):
+        """Fault as spec."""
+        s = self.kind
+        if FAULTS[self.kind] is not None:
+            s += '={}'.format(self.value)
+        if self.match:
+            s += '@' + self.match
+        if self.count is not None:
+            s += '*{}'.format(self.count)
+        return s
+
+
+class Reddit(object):
+    """Listings served by the stand-in server."""
+
+    def __init__(self):
+        """Load fixtures."""
+        self.subreddits = load_subreddits()
+        self.names = {d['display_name'].lower(): d['display_name']
+                      for d in self.subreddits}
+        self.posts = [c['data'] for c in
+                      fixture('hot-python.json')['data']['children']]
+
+    def hot(self, name, limit=25, after=None):
+        """Return page of hot posts or ``None``.
+
+        Posts of combined feeds are interleaved.
+
+        """
+        names = [self.names.get(n.lower()) for n in name.split('+')]
+        names = [n for n in names if n]
+        if not names:
+            return None
+
+        page = 0
+        if after:
+            m = re.match(r't3_p(\d+)_', after)
+            page = int(m.group(1)) + 1 if m else HOT_PAGES
+
+        if page >= HOT_PAGES:
+            return listing([])
+
+        limit = min(limit, len(self.posts))
+        children = []
+        for i in range(limit):
+            n = names[i % len(names)]
+            children.append(self.post(n, page, i // len(names)))
+
+        after = None
+        if page < HOT_PAGES - 1:
+            after = 't3_p{}_{}'.format(page, len(children))
+
+        return listing(children, after)
+
+    def post(self, name, page, i):
+        """Return post ``i`` on ``page`` of subreddit ``name``."""
+        d = copy.deepcopy(self.posts[i % len(self.posts)])
+        pid = '{}{:x}{:03d}'.format(name.lower()[:3], page, i)
+        slug = d['permalink'].rstrip('/').rsplit('/', 1)[-1]
+        d.update(subreddit=name, id=pid, name='t3_' + pid,
+                 permalink='/r/{}/comments/{}/{}/'.format(name, pid, slug),
+                 created_utc=time.time() - (page * 60 + i) * 600)
+        if d.get('is_self'):
+            d['url'] = 'https://www.reddit.com' + d['permalink']
+        return {'kind': 't3', 'data': d}
+
+    def search_posts(self, name, query, limit=25):
+        """Return hot posts of ``name`` containing all words of ``query``."""
+        words = query.lower().split()
+        children = []
+        for page in range(HOT_PAGES):
+            data = self.hot(name, 100, 't3_p{}_'.format(page - 1)
+                            if page else None)
+            if data is None:
+                return None
+            for c in data['data']['children']:
+                title = c['data']['title'].lower()
+                if all([w in title for w in words]):
+                    children.append(c)
+
+        return listing(children[:limit])
+
+    def popular(self, limit=25, after=None):
+        """Return page of popular subreddits."""
+        start = 0
+        if after:
+            m = re.match(r't5_s(\d+)$', after)
+            start = int(m.group(1)) if m else len(self.subreddits)
+
+        page = self.subreddits[start:start + limit]
+        end = start + len(page)
+        after = 't5_s{}'.format(end) if end < len(self.subreddits) else None
+        return listing([{'kind': 't5', 'data': d} for d in page], after)
+
+    def search_subreddits(self, query, limit=25, nsfw=False):
+        """Return subreddits whose name or title contains ``query``."""
+        query = query.lower()
+        found = [d for d in self.subreddits
+                 if (query in d['display_name'].lower() or
+                     query in d['title'].lower()) and
+                 (nsfw or not d['over18'])]
+        return listing([{'kind': 't5', 'data': d} for d in found[:limit]])
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serve API requests and inject faults."""
+
+    server_version = 'StandIn/1.0'
+
+    def do_GET(self):
+        """Handle request."""
+        url = urlparse.urlsplit(self.path)
+        if url.path.startswith('/_standin/'):
+            return self.control(url.path, urlparse.parse_qs(url.query))
+
+        faults = {f.kind: f for f in self.server.take_faults(self.path)}
+        self.server.delay()
+        if 'latency' in faults:
+            time.sleep(faults['latency'].value / 1000.0)
+
+        endpoint, status, body, headers = self.server.respond(
+            self.path, self.headers)
+        self.server.count(endpoint)
+
+        if 'redirect' in faults:
+            name = re.match(r'/r/([^/]+)', url.path)
+            query = urllib.urlencode({'q': name.group(1) if name else ''})
+            status, body = 302, ''
+            headers['location'] = '{}/subreddits/search.json?{}'.format(
+                self.server.url, query)
+        elif 'ratelimit' in faults:
+            status = 429
+            body = json.dumps({'message': 'Too Many Requests', 'error': 429})
+            headers['retry-after'] = str(faults['ratelimit'].value)
+            headers['x-ratelimit-remaining'] = '0'
+        elif 'status' in faults:
+            status = faults['status'].value
+            body = json.dumps({'message': 'Error', 'error': status})
+
+        self.send(status, body, headers, gzipped=(
+                  'gzip' in faults or
+                  'gzip' in (self.headers.get('accept-encoding') or '')),
+                  chunked='chunked' in faults,
+                  truncate=faults['truncate'].value
+                  if 'truncate' in faults else None)
+
+    def control(self, path, params):
+        """Change faults or return request counts."""
+        server = self.server
+        try:
+            if path == '/_standin/faults':
+                if 'clear' in params:
+                    server.set_faults([])
+                if 'set' in params:
+                    server.set_faults([Fault.parse(s) for s in params['set']])
+                for spec in params.get('add', []):
+                    server.add_fault(Fault.parse(spec))
+                data = [str(f) for f in server.faults]
+            elif path == '/_standin/requests':
+                if 'reset' in params:
+                    server.reset()
+                data = dict(server.requests)
+            else:
+                return self.send(404, 'Not Found', {})
+        except ValueError as err:
+            return self.send(400, str(err), {})
+
+        self.send(200, json.dumps(data), {})
+
+    def send(self, status, body, headers, gzipped=False, chunked=False,
+             truncate=None):
+        """Send response with ``body``.
+
+        Args:
+            status (int): HTTP status.
+            body (str): Response body.
+            headers (dict): Extra headers.
+            gzipped (bool, optional): Compress ``body``.
+            chunked (bool, optional): Use chunked transfer encoding.
+            truncate (float, optional): Fraction of ``body`` to send
+                before closing connection.
+
+        """
+        if gzipped:
+            buf = StringIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as fp:
+                fp.write(body)
+            body = buf.getvalue()
+
+        if chunked:
+            self.protocol_version = 'HTTP/1.1'
+
+        self.send_response(status)
+        self.send_header('content-type', headers.pop(
+                         'content-type', 'application/json; charset=UTF-8'))
+        if chunked:
+            self.send_header('transfer-encoding', 'chunked')
+            self.send_header('connection', 'close')
+        else:
+            self.send_header('content-length', str(len(body)))
+        if gzipped:
+            self.send_header('content-encoding', 'gzip')
+        for k, v in sorted(headers.items()):
+            self.send_header(k, v)
+        self.end_headers()
+
+        if truncate is not None:
+            body = body[:int(len(body) * truncate)]
+
+        if not chunked:
+            self.wfile.write(body)
+        else:
+            for i in range(0, len(body), CHUNK_SIZE):
+                chunk = body[i:i + CHUNK_SIZE]
+                self.wfile.write('{:x}\r\n{}\r\n'.format(len(chunk), chunk))
+            if truncate is None:
+                self.wfile.write('0\r\n\r\n')
+
+        self.close_connection = 1
+
+    def log_message(self, fmt, *args):
+        """Log requests only when run from the command line."""
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, fmt, *args)
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server with latency, faults and request counts.
+
+    Args:
+        port (int): Port to listen on. 0 picks a free one.
+        latency (float): Seconds to wait before each response.
+        jitter (float): Max. seconds latency randomly varies by.
+        faults (list, optional): `Fault` objects to inject.
+        recordings (str, optional): Directory of recorded responses.
+        record (bool, optional): Pass requests on to real APIs and
+            save responses in ``recordings``.
+        releases (list, optional): Tags of GitHub releases.
+
+    Attributes:
+        requests (dict): Number of requests by endpoint.
+
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, faults=None,
+                 recordings=None, record=False, releases=None,
+                 verbose=False):
+        """Create new server on ``port``."""
+        HTTPServer.__init__(self, ('127.0.0.1', port), Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.faults = list(faults or [])
+        self.recordings = recordings
+        self.record = record
+        self.releases = releases or ['v' + workflow_version()]
+        self.verbose = verbose
+        self.reddit = Reddit()
+        self.requests = defaultdict(int)
+        self._lock = threading.Lock()
+        self._period = (time.time(), 0)
+        if recordings and not os.path.exists(recordings):
+            os.makedirs(recordings)
+
+    @property
+    def url(self):
+        """Base URL of server."""
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def count(self, endpoint):
+        """Increment request counter of ``endpoint``."""
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def reset(self):
+        """Reset request counters and rate limit."""
+        with self._lock:
+            self.requests.clear()
+            self._period = (time.time(), 0)
+
+    def delay(self):
+        """Sleep for configured latency."""
+        t = self.latency
+        if self.jitter:
+            t += random.uniform(-self.jitter, self.jitter)
+        if t > 0:
+            time.sleep(t)
+
+    def set_faults(self, faults):
+        """Replace faults with ``faults``."""
+        with self._lock:
+            self.faults = list(faults)
+
+    def add_fault(self, fault):
+        """Inject ``fault`` too."""
+        with self._lock:
+            self.faults.append(fault)
+
+    def take_faults(self, path):
+        """Return faults to inject into response to ``path``.
+
+        Faults that have affected as many requests as they should are
+        removed.
+
+        """
+        taken = []
+        with self._lock:
+            for f in self.faults[:]:
+                if f.match and f.match not in path:
+                    continue
+                taken.append(f)
+                if f.count is not None:
+                    f.count -= 1
+                    if f.count <= 0:
+                        self.faults.remove(f)
+
+        return taken
+
+    def ratelimit(self):
+        """Count request against rate limit.
+
+        Returns:
+            dict: Reddit's rate-limit headers.
+
+        """
+        with self._lock:
+            start, used = self._period
+            now = time.time()
+            if now - start >= RATELIMIT_PERIOD:
+                start, used = now, 0
+            used += 1
+            self._period = (start, used)
+
+        remaining = max(0, RATELIMIT_REQUESTS - used)
+        return {'x-ratelimit-remaining': str(remaining),
+                'x-ratelimit-used': str(used),
+                'x-ratelimit-reset': str(int(start + RATELIMIT_PERIOD - now))}
+
+    def respond(self, path, headers):
+        """Return response to request for ``path``.
+
+        Returns:
+            tuple: ``(endpoint, status, body, headers)``.
+
+        """
+        endpoint = self.endpoint(path)
+        if self.recordings:
+            fn = os.path.join(self.recordings, recording_name(path))
+            if self.record:
+                try:
+                    self.save(fn, *self.fetch(path, headers))
+                except urllib2.URLError as err:
+                    return (endpoint, 502, json.dumps(
+                            {'message': str(err), 'error': 502}), {})
+            if os.path.exists(fn):
+                with open(fn) as fp:
+                    rec = json.load(fp)
+                body = rec['body']
+                if not isinstance(body, basestring):
+                    body = json.dumps(body)
+                return (endpoint, rec['status'], body.encode('utf-8'),
+                        {str(k): str(v) for k, v in rec['headers'].items()})
+
+        status, body, headers = self.generate(endpoint, path)
+        if endpoint != 'download':
+            headers.update(self.ratelimit())
+        return endpoint, status, body, headers
+
+    def endpoint(self, path):
+        """Return name of endpoint ``path`` belongs to."""
+        path = urlparse.urlsplit(path).path
+        for name, pattern in (
+                ('hot', r'/r/[^/]+/hot\.json$'),
+                ('post-search', r'/r/[^/]+/search\.json$'),
+                ('multi', r'/(u|user)/[^/]+/m/[^/]+\.json$'),
+                ('popular', r'/subreddits/popular\.json$'),
+                ('search', r'/subreddits/search\.json$'),
+                ('releases', r'/repos/[^/]+/[^/]+/releases$'),
+                ('download', r'/download/')):
+            if re.match(pattern, path):
+                return name
+        return 'other'
+
+    def generate(self, endpoint, path):
+        """Build response from fixtures.
+
+        Returns:
+            tuple: ``(status, body, headers)``.
+
+        """
+        url = urlparse.urlsplit(path)
+        params = dict(urlparse.parse_qsl(url.query))
+        limit = int(params.get('limit') or 25)
+        after = params.get('after')
+        name = url.path.split('/')[2] if url.path.count('/') > 1 else ''
+
+        if endpoint == 'hot':
+            data = self.reddit.hot(name, limit, after)
+        elif endpoint == 'post-search':
+            data = self.reddit.search_posts(name, params.get('q', ''), limit)
+        elif endpoint == 'multi':
+            data = self.reddit.hot(self.reddit.subreddits[0]['display_name'],
+                                   limit, after)
+        elif endpoint == 'popular':
+            data = self.reddit.popular(limit, after)
+        elif endpoint == 'search':
+            nsfw = params.get('include_over_18', '').lower() in ('1', 'true')
+            data = self.reddit.search_subreddits(params.get('q', ''), limit,
+                                                 nsfw)
+        elif endpoint == 'releases':
+            data = self.github_releases(url.path.split('/')[3])
+        elif endpoint == 'download':
+            return 200, self.workflow_file(), {
+                'content-type': 'application/octet-stream'}
+        else:
+            data = None
+
+        if data is None:
+            return 404, json.dumps({'message': 'Not Found', 'error': 404}), {}
+
+        return 200, json.dumps(data), {}
+
+    def github_releases(self, repo):
+        """Return GitHub releases of ``repo``, newest first."""
+        releases = []
+        for i, tag in enumerate(reversed(self.releases)):
+            url = '{}/download/{}-{}.alfredworkflow'.format(self.url, repo,
+                                                           tag)
+            releases.append({
+                'id': i + 1, 'tag_name': tag, 'name': tag,
+                'prerelease': False, 'draft': False,
+                'assets': [{'name': url.rsplit('/', 1)[-1],
+                            'browser_download_url': url}]})
+        return releases
+
+    def workflow_file(self):
+        """Return contents of empty workflow file."""
+        buf = StringIO()
+        zf = zipfile.ZipFile(buf, 'w')
+        zf.writestr('info.plist', '')
+        zf.close()
+        return buf.getvalue()
+
+    def fetch(self, path, headers):
+        """Pass request for ``path`` on to real API.
+
+        Returns:
+            tuple: ``(status, body, headers)``.
+
+        """
+        base = GITHUB_URL if path.startswith('/repos/') else REDDIT_URL
+        req = urllib2.Request(base + path, headers={
+            'user-agent': headers.get('user-agent') or 'StandIn/1.0'})
+        try:
+            r = urllib2.urlopen(req)
+        except urllib2.HTTPError as err:
+            r = err
+
+        body = r.read()
+        if 'gzip' in (r.info().get('content-encoding') or ''):
+            body = gzip.GzipFile(fileobj=StringIO(body)).read()
+
+        kept = {k: r.info()[k] for k in RECORDED_HEADERS if k in r.info()}
+        return r.getcode(), body, kept
+
+    def save(self, path, status, body, headers):
+        """Save response as recording ``path``."""
+        try:
+            body = json.loads(body)
+        except ValueError:
+            body = body.decode('utf-8', 'replace')
+
+        with open(path, 'wb') as fp:
+            json.dump({'status': status, 'headers': headers, 'body': body},
+                      fp, indent=2, sort_keys=True)
+
+
+def serve(port=0, latency=0.0, jitter=0.0, **kwargs):
+    """Start `StandInServer` in a background thread and return it.
+
+    Keyword arguments are passed to `StandInServer`. Call the
+    server's ``shutdown()`` method to stop it.
+
+    """
+    server = StandInServer(port, latency, jitter, **kwargs)
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    return server
+
+
+def main():
+    """Run server until interrupted."""
+    sys.path.insert(0, os.path.join(HERE, '../src'))
+    from docopt import docopt
+    args = docopt(__doc__)
+    if args['--record'] and not args['--recordings']:
+        print('--record requires --recordings', file=sys.stderr)
+        return 1
+
+    try:
+        faults = [Fault.parse(s) for s in args['<fault>']]
+    except ValueError as err:
+        print(err, file=sys.stderr)
+        return 1
+
+    server = StandInServer(int(args['--port']),
+                           float(args['--latency']) / 1000,
+                           float(args['--jitter']) / 1000,
+                           faults=faults,
+                           recordings=args['--recordings'],
+                           record=args['--record'],
+                           releases=args['--release'],
+                           verbose=True)
+    print('serving on {} ...'.format(server.url), file=sys.stderr)
+    for f in faults:
+        print('fault: {}'.format(f), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
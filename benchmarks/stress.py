@@ -0,0 +1,448 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2014 deanishe@deanishe.net
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+
+"""stress.py [options]
+
+Run concurrent workers that read and write the workflow's shared
+files the way simultaneous `reddit.py` processes do (Script Filter
+reruns, background jobs, the update checker and Run Script actions),
+and check that no data is lost or corrupted.
+
+Each worker is a separate process that repeatedly picks one of these
+operations at random until the time budget is used up:
+
+    history    add a new subreddit to `__history` (`remember_subreddit()`)
+    settings   set a new key in `settings.json` (new `Settings` object,
+               as each `reddit.py` process has its own)
+    write      cache a self-checking payload under a shared key
+    read       load a cached payload and verify it
+    session    cache a self-checking list of subreddits as `--last`
+               session data, then read it back
+    lock       increment a counter in a plain file under `LockFile`
+    metrics    increment a counter and append it to the metrics log
+               (as `Workflow.run()` does at the end of each run)
+
+Afterwards, the harness checks for:
+
+    lost updates   subreddits missing from `__history`, keys missing
+                   from `settings.json`, counter increments missing
+                   (from the counter file and the metrics store)
+    torn reads     payloads that fail to load or verify
+    lock timeouts  `AcquisitionError`s
+
+and reports throughput, the duration of each operation and how long
+workers waited for locks. Exits with status 1 if any check fails.
+
+Usage:
+    stress.py [-w <workers>] [-d <seconds>] [-k <keys>] [-o <file>]
+              [--seed <n>]
+    stress.py -h
+
+Options:
+    -w, --workers <workers>   Number of concurrent workers [default: 8]
+    -d, --duration <seconds>  Time budget [default: 10]
+    -k, --keys <keys>         Number of shared cache keys [default: 3]
+    -o, --output <file>       Save results as JSON to <file>
+    --seed <n>                Seed of random operations [default: 1]
+    -h, --help                Show this help text
+
+"""
+
+from __future__ import print_function, absolute_import
+
+import atexit
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.join(HERE, '../src'))
+
+# All workers share one cache and data directory and session
+_tmpdir = tempfile.mkdtemp(prefix='alfred-reddit-stress-')
+atexit.register(shutil.rmtree, _tmpdir, True)
+for _k, _v in (('alfred_workflow_bundleid', 'net.deanishe.alfred-reddit'),
+               ('alfred_workflow_cache', os.path.join(_tmpdir, 'cache')),
+               ('alfred_workflow_data', os.path.join(_tmpdir, 'data')),
+               ('alfred_workflow_name', 'Reddit'),
+               ('_WF_SESSION_ID', 'stress')):
+    os.environ[_k] = _v
+
+import reddit  # noqa: E402
+from docopt import docopt  # noqa: E402
+from workflow import Workflow3, metrics  # noqa: E402
+from workflow.util import AcquisitionError, LockFile  # noqa: E402
+from workflow.workflow import Settings  # noqa: E402
+
+# Relative frequency of operations
+OPERATIONS = [
+    ('history', 2),
+    ('settings', 2),
+    ('write', 3),
+    ('read', 6),
+    ('session', 2),
+    ('lock', 3),
+    ('metrics', 3),
+]
+
+# Size range of cached payloads in bytes
+PAYLOAD_SIZE = (100, 200000)
+
+# Extra time workers get to finish their last operation
+GRACE = 30
+
+COUNTER = 'stress-counter'
+
+
+def percentile(values, p):
+    """Return ``p``th percentile of ``values`` (nearest rank)."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1,
+                             int(-(-p * len(values) // 100)) - 1))]
+
+
+def checksum(data):
+    """Checksum of string ``data``."""
+    return hashlib.md5(data).hexdigest()
+
+
+def payload(rnd, worker, seq):
+    """Return cache data that can be checked after loading."""
+    data = os.urandom(rnd.randint(*PAYLOAD_SIZE) // 2).encode('hex')
+    return {'worker': worker, 'seq': seq, 'data': data,
+            'checksum': checksum(data)}
+
+
+def valid(cached):
+    """Whether ``cached`` is an intact `payload()`."""
+    return (isinstance(cached, dict) and
+            checksum(cached.get('data', '')) == cached.get('checksum'))
+
+
+class Worker(object):
+    """Perform random operations on shared files.
+
+    Args:
+        n (int): Number of worker.
+        deadline (float): Time to stop at.
+        keys (int): Number of shared cache keys.
+        seed (int): Seed of random operations.
+
+    """
+
+    def __init__(self, n, deadline, keys, seed):
+        """Create new `Worker`."""
+        self.n = n
+        self.deadline = deadline
+        self.keys = ['stress-{}'.format(i) for i in range(keys)]
+        self.rnd = random.Random(seed * 1000 + n)
+        self.seq = 0
+        self.stats = {
+            'ops': {name: [] for name, _ in OPERATIONS},
+            'waits': [],
+            'history': [],
+            'settings': [],
+            'increments': 0,
+            'metrics': 0,
+            'torn': [],
+            'timeouts': [],
+            'errors': [],
+        }
+        self.wf = None
+
+    def run(self):
+        """Perform operations until deadline and return stats."""
+        self.wf = reddit.wf = Workflow3()
+        reddit.log = self.wf.logger
+        self.time_locks()
+
+        ops = [name for name, weight in OPERATIONS for _ in range(weight)]
+        while time.time() < self.deadline:
+            name = self.rnd.choice(ops)
+            self.seq += 1
+            start = time.time()
+            try:
+                getattr(self, 'op_' + name)()
+            except AcquisitionError as err:
+                self.stats['timeouts'].append('{}: {}'.format(name, err))
+            except Exception as err:
+                self.stats['errors'].append('{}: {!r}'.format(name, err))
+            self.stats['ops'][name].append(time.time() - start)
+
+        return self.stats
+
+    def time_locks(self):
+        """Record how long each `LockFile.acquire()` waits."""
+        acquire = LockFile.acquire
+        waits = self.stats['waits']
+
+        def timed(lock, *args, **kwargs):
+            start = time.time()
+            try:
+                return acquire(lock, *args, **kwargs)
+            finally:
+                waits.append(time.time() - start)
+
+        LockFile.acquire = timed
+
+    def op_history(self):
+        """Add subreddit to history."""
+        name = 'stress{}x{}'.format(self.n, self.seq)
+        reddit.remember_subreddit(name)
+        self.stats['history'].append(name)
+
+    def op_settings(self):
+        """Set new key in settings file."""
+        key = 'stress-{}-{}'.format(self.n, self.seq)
+        settings = Settings(self.wf.settings_path)
+        settings[key] = self.seq
+        self.stats['settings'].append(key)
+
+    def op_write(self):
+        """Cache payload under shared key."""
+        self.wf.cache_data(self.rnd.choice(self.keys),
+                           payload(self.rnd, self.n, self.seq))
+
+    def op_read(self):
+        """Load and verify payload of shared key."""
+        key = self.rnd.choice(self.keys)
+        try:
+            cached = self.wf.cached_data(key, max_age=0)
+        except Exception as err:
+            self.stats['torn'].append('{}: {!r}'.format(key, err))
+            return
+
+        if cached is not None and not valid(cached):
+            self.stats['torn'].append('{}: checksum mismatch'.format(key))
+
+    def op_session(self):
+        """Cache and load ``--last`` session data."""
+        count = self.rnd.randint(1, 200)
+        tag = '{}x{}x{}'.format(self.n, self.seq, count)
+        reddit.cache_records('--last', [reddit.Subreddit(tag, str(i))
+                                        for i in range(count)], session=True)
+        try:
+            last = reddit.cached_records('--last', reddit.Subreddit,
+                                         session=True)
+        except Exception as err:
+            self.stats['torn'].append('--last: {!r}'.format(err))
+            return
+
+        if not last:
+            self.stats['torn'].append('--last: missing')
+            return
+
+        # Another worker may have written it since, but it must be whole
+        tag = last[0].name
+        if (len(last) != int(tag.split('x')[-1]) or
+                any([sr.name != tag for sr in last])):
+            self.stats['torn'].append('--last: inconsistent records')
+
+    def op_lock(self):
+        """Increment counter under lock."""
+        path = self.wf.datafile(COUNTER)
+        with LockFile(path, timeout=5):
+            try:
+                with open(path) as fp:
+                    value = int(fp.read() or 0)
+            except IOError:
+                value = 0
+            time.sleep(self.rnd.uniform(0, 0.002))
+            with open(path, 'w') as fp:
+                fp.write(str(value + 1))
+        self.stats['increments'] += 1
+
+    def op_metrics(self):
+        """Append a counter increment to metrics log, sometimes merging
+        the log into the store."""
+        self.wf.metrics.incr('stress_total')
+        self.wf.metrics.save(self.wf.cachefile(metrics.LOGNAME))
+        if random.random() < 0.2:
+            metrics.aggregate(self.wf.cachefile(metrics.FILENAME),
+                              self.wf.cachefile(metrics.LOGNAME))
+        self.stats['metrics'] += 1
+
+
+def work(args):
+    """Run `Worker` in subprocess."""
+    n, deadline, keys, seed, queue = args
+    try:
+        stats = Worker(n, deadline, keys, seed).run()
+    except Exception as err:
+        stats = {'crashed': repr(err)}
+    queue.put((n, stats))
+
+
+def check(wf, stats):
+    """Return descriptions of problems found in shared files."""
+    problems = []
+
+    history = {sr.name for sr in
+               reddit.cached_records('__history', reddit.Subreddit) or []}
+    added = [name for s in stats for name in s['history']]
+    lost = [name for name in added if name not in history]
+    if lost:
+        problems.append('history: {} of {} subreddit(s) lost'.format(
+                        len(lost), len(added)))
+
+    with open(wf.settings_path) as fp:
+        settings = json.load(fp)
+    added = [key for s in stats for key in s['settings']]
+    lost = [key for key in added if key not in settings]
+    if lost:
+        problems.append('settings: {} of {} key(s) lost'.format(
+                        len(lost), len(added)))
+
+    try:
+        with open(wf.datafile(COUNTER)) as fp:
+            counter = int(fp.read() or 0)
+    except IOError:
+        counter = 0
+    increments = sum([s['increments'] for s in stats])
+    if counter != increments:
+        problems.append('lock: counter is {}, but was incremented {} '
+                        'time(s)'.format(counter, increments))
+
+    store = metrics.aggregate(wf.cachefile(metrics.FILENAME),
+                              wf.cachefile(metrics.LOGNAME))
+    counter = store['total']['counters'].get('stress_total', 0)
+    increments = sum([s['metrics'] for s in stats])
+    if counter != increments:
+        problems.append('metrics: counter is {}, but was incremented {} '
+                        'time(s)'.format(counter, increments))
+
+    for kind in ('torn', 'timeouts', 'errors'):
+        msgs = [m for s in stats for m in s[kind]]
+        if msgs:
+            problems.append('{}: {} ({})'.format(
+                            kind, len(msgs), '; '.join(sorted(set(msgs))[:3])))
+
+    return problems
+
+
+def ms(seconds):
+    """Format ``seconds`` as milliseconds."""
+    if seconds is None:
+        return '{:>8}'.format('-')
+    return '{:8.1f}'.format(seconds * 1000)
+
+
+def summarize(stats, duration):
+    """Return throughput and latency distributions."""
+    results = {'ops': {}}
+    total = 0
+    for name, _ in OPERATIONS:
+        times = [t for s in stats for t in s['ops'][name]]
+        total += len(times)
+        results['ops'][name] = {
+            'count': len(times),
+            'per_second': len(times) / duration,
+            'p': [percentile(times, p) for p in (50, 95, 99, 100)],
+        }
+
+    waits = [t for s in stats for t in s['waits']]
+    results['lock_wait'] = {
+        'count': len(waits),
+        'p': [percentile(waits, p) for p in (50, 95, 99, 100)],
+    }
+    results['per_second'] = total / duration
+    return results
+
+
+def report(results):
+    """Print ``results``."""
+    print('{:<10} {:>7} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+          'operation', 'count', 'ops/s', 'p50 ms', 'p95 ms', 'p99 ms',
+          'max ms'))
+    rows = sorted(results['ops'].items())
+    rows.append(('lock wait', dict(results['lock_wait'], per_second=None)))
+    for name, r in rows:
+        rate = '{:8.1f}'.format(r['per_second']) if r['per_second'] else \
+            '{:>8}'.format('')
+        print('{:<10} {:>7} {} {}'.format(name, r['count'], rate,
+                                          ''.join([ms(v) for v in r['p']])))
+
+    print('\n{:.1f} operations/s with {} workers'.format(
+          results['per_second'], results['workers']))
+    if results['problems']:
+        print('\nFAILED:')
+        for p in results['problems']:
+            print('  ' + p)
+    else:
+        print('no lost updates, torn reads or lock timeouts')
+
+
+def main():
+    """Run stress test."""
+    args = docopt(__doc__)
+    workers = int(args['--workers'])
+    duration = float(args['--duration'])
+    keys = int(args['--keys'])
+    seed = int(args['--seed'])
+
+    wf = reddit.wf = Workflow3()
+    reddit.log = wf.logger
+
+    queue = multiprocessing.Queue()
+    deadline = time.time() + duration
+    procs = [multiprocessing.Process(
+             target=work, args=((n, deadline, keys, seed, queue),))
+             for n in range(workers)]
+    for p in procs:
+        p.start()
+
+    stats = {}
+    try:
+        while len(stats) < workers:
+            n, s = queue.get(timeout=max(1, deadline + GRACE - time.time()))
+            stats[n] = s
+    except Exception:  # Queue.Empty
+        pass
+
+    problems = []
+    for p in procs:
+        p.join(1)
+        if p.is_alive():
+            p.terminate()
+
+    hung = workers - len(stats)
+    if hung:
+        problems.append('{} worker(s) didn\'t finish within {}s of the '
+                        'time budget'.format(hung, GRACE))
+
+    crashed = [s['crashed'] for s in stats.values() if 'crashed' in s]
+    problems.extend(['worker crashed: ' + c for c in crashed])
+    stats = [s for s in stats.values() if 'crashed' not in s]
+    problems.extend(check(wf, stats))
+
+    results = summarize(stats, duration)
+    results.update(workers=workers, duration=duration, problems=problems,
+                   python=platform.python_version(),
+                   platform=platform.platform(),
+                   date=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    report(results)
+
+    if args['--output']:
+        with open(args['--output'], 'wb') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,633 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2014 deanishe@deanishe.net
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2026-10-18
+#
+
+"""Compiled, read-only catalog of subreddits.
+
+Catalogs are opened with :mod:`mmap`, so lookups only read the parts
+of the file they touch instead of unpickling the whole list.
+
+File layout (integers are little-endian)::
+
+    header    magic, version, number of entries, section offsets
+    entries   fixed-size entries, sorted by lowercase name
+    ranks     indices of entries, most subscribers first
+    buckets   start of each bucket of deletion index
+    deletes   deletion index: (hash, entry index) pairs, sorted
+    heap      UTF-8 names and titles
+
+The deletion index maps the hash of each name and of each variant of
+the name with one letter deleted to the name's entry. It is used to
+find misspelt names (see `Catalog.similar()`).
+
+"""
+
+from __future__ import print_function, absolute_import
+
+from array import array
+from collections import namedtuple
+import heapq
+from itertools import chain, islice
+import json
+import marshal
+import mmap
+import os
+import struct
+import zlib
+
+from workflow.util import atomic_writer
+
+MAGIC = b'RCAT'
+VERSION = 2
+
+# magic, version, bucket bits, count, ranks offset, buckets offset,
+# deletes offset, number of deletes, heap offset
+HEADER = struct.Struct(b'<4sHHIIIIII')
+
+# heap offset, name length, title length, type, flags, subscribers
+ENTRY = struct.Struct(b'<IHHBBI')
+
+RANK = struct.Struct(b'<I')
+
+# hash, entry index
+DELETE = struct.Struct(b'<II')
+
+# Subreddit types. Stored as index in this tuple.
+TYPES = ('public', 'restricted', 'private', 'archived', 'gold_restricted',
+         'gold_only', 'employees_only', 'user')
+
+# Entry flags
+FLAG_NSFW = 0x01
+
+# Max. number of entries `build()` sorts in memory. Larger inputs are
+# sorted in runs of this size, which are spooled to disk and merged.
+# The (much smaller) items of the deletion index and ranks are sorted
+# in runs 10 times this size.
+RUN_SIZE = 50000
+
+
+Entry = namedtuple('Entry', 'name title type subscribers nsfw')
+
+
+def sort_key(name):
+    """Key catalog entries are sorted and looked up by."""
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+    return name.lower()
+
+
+def deletes(key, depth=1):
+    """Return ``key`` and its variants with up to ``depth`` letters deleted.
+
+    Args:
+        key (str): Sort key.
+        depth (int, optional): Max. number of letters to delete.
+
+    Returns:
+        set: Variants of ``key``.
+
+    """
+    variants = {key}
+    edge = {key}
+    for _ in range(depth):
+        edge = {k[:i] + k[i + 1:] for k in edge for i in range(len(k))}
+        variants |= edge
+    return variants
+
+
+def delete_hash(key):
+    """Hash of a deletion variant."""
+    return zlib.crc32(key) & 0xffffffff
+
+
+def distance(a, b, max_distance=None):
+    """Edit distance between ``a`` and ``b``.
+
+    Insertions, deletions, substitutions and transpositions of
+    adjacent letters ("optimal string alignment") each count as one
+    edit.
+
+    Args:
+        a (str): First string.
+        b (str): Second string.
+        max_distance (int, optional): Return ``max_distance + 1`` as
+            soon as the distance is known to be larger.
+
+    Returns:
+        int: Number of edits.
+
+    """
+    if max_distance is not None and abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    prev2 = None
+    prev = range(len(b) + 1)
+    for i in xrange(1, len(a) + 1):
+        row = [i]
+        for j in xrange(1, len(b) + 1):
+            d = min(row[j - 1] + 1, prev[j] + 1,
+                    prev[j - 1] + (a[i - 1] != b[j - 1]))
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2] and
+                    a[i - 2] == b[j - 1]):
+                d = min(d, prev2[j - 2] + 1)
+            row.append(d)
+
+        if max_distance is not None and min(row) > max_distance:
+            return max_distance + 1
+
+        prev2, prev = prev, row
+
+    return prev[-1]
+
+
+def similar(name, names, max_distance=2):
+    """Return ``names`` within ``max_distance`` edits of ``name``.
+
+    Compares ``name`` to each name in turn, so only suitable for
+    short lists. Use `Catalog.similar()` for catalogs.
+
+    Args:
+        name (unicode): Possibly misspelt name.
+        names (list): Names to search.
+        max_distance (int, optional): Max. edit distance.
+
+    Returns:
+        list: ``(distance, name)`` tuples.
+
+    """
+    key = sort_key(name)
+    matches = []
+    for n in names:
+        d = distance(key, sort_key(n), max_distance)
+        if d <= max_distance:
+            matches.append((d, n))
+
+    return matches
+
+
+class Catalog(object):
+    """Memory-mapped catalog file.
+
+    Args:
+        path (str): Path to catalog file created by `CatalogWriter`.
+
+    Raises:
+        ValueError: Raised if ``path`` isn't a valid catalog.
+
+    """
+
+    def __init__(self, path):
+        """Open catalog at ``path``."""
+        self.path = path
+        with open(path, 'rb') as fp:
+            self._mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mm) < HEADER.size:
+            raise ValueError('invalid catalog: {!r}'.format(path))
+
+        (magic, version, bits, count, ranks, buckets,
+         dels, ndels, heap) = HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('invalid catalog: {!r}'.format(path))
+
+        self._count = count
+        self._ranks = ranks
+        self._shift = 32 - bits
+        self._buckets = buckets
+        self._deletes = dels
+        self._heap = heap
+
+    def close(self):
+        """Unmap catalog file."""
+        self._mm.close()
+
+    def __enter__(self):
+        """Use catalog as context manager. It's closed on exit."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close catalog."""
+        self.close()
+
+    def __len__(self):
+        """Number of subreddits in catalog."""
+        return self._count
+
+    def __iter__(self):
+        """Iterate over entries in order of name."""
+        for i in xrange(self._count):
+            yield self.entry(i)
+
+    def _raw(self, i):
+        return ENTRY.unpack_from(self._mm, HEADER.size + i * ENTRY.size)
+
+    def key(self, i):
+        """Sort key (lowercase UTF-8 name) of entry ``i``."""
+        off, nlen = self._raw(i)[:2]
+        off += self._heap
+        return self._mm[off:off + nlen].lower()
+
+    def entry(self, i):
+        """Return entry ``i`` (in order of name).
+
+        Args:
+            i (int): Index of entry.
+
+        Returns:
+            Entry: ``(name, title, type, subscribers, nsfw)`` tuple.
+
+        """
+        off, nlen, tlen, typ, flags, subscribers = self._raw(i)
+        off += self._heap
+        name = self._mm[off:off + nlen].decode('utf-8')
+        title = self._mm[off + nlen:off + nlen + tlen].decode('utf-8')
+        return Entry(name, title, TYPES[typ], subscribers,
+                     bool(flags & FLAG_NSFW))
+
+    def bisect(self, key):
+        """Index of first entry whose sort key is >= ``key``."""
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, name):
+        """Return entry for ``name`` (case-insensitive) or ``None``."""
+        key = sort_key(name)
+        i = self.bisect(key)
+        if i < self._count and self.key(i) == key:
+            return self.entry(i)
+        return None
+
+    def prefixed(self, prefix, limit=None):
+        """Return entries whose names start with ``prefix``.
+
+        Args:
+            prefix (unicode): Case-insensitive start of name.
+            limit (int, optional): Max. number of entries to return.
+
+        Returns:
+            list: `Entry` tuples in order of name.
+
+        """
+        key = sort_key(prefix)
+        entries = []
+        i = self.bisect(key)
+        while i < self._count and (limit is None or len(entries) < limit):
+            if not self.key(i).startswith(key):
+                break
+            entries.append(self.entry(i))
+            i += 1
+
+        return entries
+
+    def similar(self, name, max_distance=2):
+        """Return entries whose names are similar to ``name``.
+
+        Args:
+            name (unicode): Possibly misspelt name.
+            max_distance (int, optional): Max. edit distance.
+
+        Returns:
+            list: ``(distance, Entry)`` tuples in order of name.
+
+        """
+        key = sort_key(name)
+        # Index contains variants with one letter deleted, so deleting
+        # up to two letters from ``key`` finds all names within one
+        # edit and many within two.
+        candidates = set()
+        for v in deletes(key, min(max_distance, 2)):
+            candidates.update(self._lookup(delete_hash(v)))
+
+        matches = []
+        for i in candidates:
+            d = distance(key, self.key(i), max_distance)
+            if d <= max_distance:
+                matches.append((i, d))
+
+        matches.sort()
+        return [(d, self.entry(i)) for i, d in matches]
+
+    def _lookup(self, h):
+        """Generate indices of entries with deletion variant hash ``h``."""
+        bucket = h >> self._shift
+        start, end = struct.unpack_from(b'<II', self._mm,
+                                        self._buckets + bucket * 4)
+        for k in xrange(start, end):
+            dh, i = DELETE.unpack_from(self._mm,
+                                       self._deletes + k * DELETE.size)
+            if dh == h:
+                yield i
+            elif dh > h:
+                break
+
+    def top(self, limit=None):
+        """Return entries with the most subscribers.
+
+        Args:
+            limit (int, optional): Max. number of entries to return.
+
+        Returns:
+            list: `Entry` tuples, most subscribers first.
+
+        """
+        n = self._count if limit is None else min(limit, self._count)
+        return [self.entry(RANK.unpack_from(self._mm,
+                                            self._ranks + i * RANK.size)[0])
+                for i in xrange(n)]
+
+
+class CatalogWriter(object):
+    """Write a catalog file.
+
+    Entries must be added in order of `sort_key()`. Entries and names
+    are spooled to temporary files, so catalogs of any size can be
+    written. The catalog is moved into place atomically by `close()`.
+
+    Args:
+        path (str): Path to write catalog to.
+
+    """
+
+    def __init__(self, path):
+        """Create new `CatalogWriter`."""
+        self.path = path
+        import tempfile
+        self.count = 0
+        self._entries = tempfile.TemporaryFile()
+        self._heap = tempfile.TemporaryFile()
+        self._heapsize = 0
+        self._deletes = tempfile.TemporaryFile()
+        self._ndeletes = 0
+        self._subscribers = array(b'I')
+        self._last = None
+
+    def add(self, name, title, type='public', subscribers=0, nsfw=False):
+        """Append subreddit to catalog.
+
+        Args:
+            name (unicode): Name of subreddit.
+            title (unicode): Subreddit's title.
+            type (unicode, optional): Subreddit type. Unknown types are
+                stored as ``public``.
+            subscribers (int, optional): Number of subscribers.
+            nsfw (bool, optional): Whether subreddit is "over 18".
+
+        Raises:
+            ValueError: Raised if ``name`` sorts before the last entry.
+
+        Returns:
+            bool: ``False`` if ``name`` is a duplicate and was skipped.
+
+        """
+        key = sort_key(name)
+        if self._last is not None:
+            if key == self._last:
+                return False
+            if key < self._last:
+                raise ValueError('catalog entries out of order: {!r} < '
+                                 '{!r}'.format(key, self._last))
+
+        name = name.encode('utf-8')
+        title = (title or '')[:1000].encode('utf-8')
+        try:
+            typ = TYPES.index(type)
+        except ValueError:
+            typ = 0
+
+        subscribers = min(max(int(subscribers or 0), 0), 0xffffffff)
+        self._entries.write(ENTRY.pack(self._heapsize, len(name), len(title),
+                                       typ, FLAG_NSFW if nsfw else 0,
+                                       subscribers))
+        self._heap.write(name + title)
+        self._heapsize += len(name) + len(title)
+        for h in {delete_hash(v) for v in deletes(key)}:
+            self._deletes.write(DELETE.pack(h, self.count))
+            self._ndeletes += 1
+        self._subscribers.append(subscribers)
+        self._last = key
+        self.count += 1
+        return True
+
+    def _read_deletes(self):
+        """Generate ``(hash, index)`` pairs written by `add()`."""
+        self._deletes.seek(0)
+        while True:
+            data = self._deletes.read(DELETE.size * 4096)
+            if not data:
+                break
+            for off in xrange(0, len(data), DELETE.size):
+                yield DELETE.unpack_from(data, off)
+
+    def close(self):
+        """Write catalog to `path`."""
+        import shutil
+        import tempfile
+
+        # Sort indices by subscribers, most first
+        ranks = tempfile.TemporaryFile()
+        order = ((-n, i) for i, n in enumerate(self._subscribers))
+        for _, i in _external_sort(order, RUN_SIZE * 10):
+            ranks.write(RANK.pack(i))
+
+        # Aim for ~8 deletes per bucket
+        bits = min(max((self._ndeletes // 8).bit_length(), 4), 20)
+        shift = 32 - bits
+
+        # Sort deletion index and count entries in each bucket
+        counts = array(b'I', [0] * ((1 << bits) + 1))
+        dels = tempfile.TemporaryFile()
+        for h, i in _external_sort(self._read_deletes(), RUN_SIZE * 10):
+            dels.write(DELETE.pack(h, i))
+            counts[(h >> shift) + 1] += 1
+
+        for b in xrange(1, len(counts)):
+            counts[b] += counts[b - 1]
+
+        ranks_off = HEADER.size + self.count * ENTRY.size
+        buckets_off = ranks_off + self.count * RANK.size
+        dels_off = buckets_off + len(counts) * 4
+        heap_off = dels_off + self._ndeletes * DELETE.size
+
+        with atomic_writer(self.path, 'wb') as fp:
+            fp.write(HEADER.pack(MAGIC, VERSION, bits, self.count,
+                                 ranks_off, buckets_off, dels_off,
+                                 self._ndeletes, heap_off))
+            self._entries.seek(0)
+            shutil.copyfileobj(self._entries, fp)
+            ranks.seek(0)
+            shutil.copyfileobj(ranks, fp)
+            fp.write(counts.tostring())
+            dels.seek(0)
+            shutil.copyfileobj(dels, fp)
+            self._heap.seek(0)
+            shutil.copyfileobj(self._heap, fp)
+
+        for f in (self._entries, self._heap, self._deletes, ranks, dels):
+            f.close()
+
+
+def _spool(entries):
+    """Write sorted ``entries`` to a temporary file."""
+    import tempfile
+    fp = tempfile.TemporaryFile()
+    for e in entries:
+        marshal.dump(e, fp)
+    fp.seek(0)
+    return fp
+
+
+def _unspool(fp):
+    """Read entries written by `_spool()`."""
+    while True:
+        try:
+            yield marshal.load(fp)
+        except EOFError:
+            fp.close()
+            return
+
+
+def _external_sort(items, run_size=RUN_SIZE):
+    """Sort ``items``, holding at most ``run_size`` of them in memory.
+
+    Args:
+        items (iterable): Items to sort.
+        run_size (int, optional): Number of items to sort in memory.
+            Larger inputs are sorted in runs that are spooled to disk
+            and merged.
+
+    Returns:
+        iterable: Sorted items.
+
+    """
+    items = iter(items)
+    runs = []
+    while True:
+        run = sorted(islice(items, run_size))
+        if not run:
+            break
+        runs.append(run)
+        if len(run) < run_size:
+            break
+        runs[-1] = _unspool(_spool(run))
+
+    if len(runs) == 1:
+        return runs[0]
+
+    return heapq.merge(*runs)
+
+
+def build(path, entries, run_size=RUN_SIZE):
+    """Write ``entries`` to a new catalog at ``path``.
+
+    At most ``run_size`` entries are held in memory, so ``entries``
+    may be a generator over a dump of any size. Of entries with the
+    same name, the one with the most subscribers is kept.
+
+    Args:
+        path (str): Path to write catalog to.
+        entries (iterable): ``(name, title, type, subscribers, nsfw)``
+            tuples in any order.
+        run_size (int, optional): Number of entries to sort in memory.
+
+    Returns:
+        int: Number of entries in catalog.
+
+    """
+    decorated = ((sort_key(e[0]), -(e[3] or 0), tuple(e)) for e in entries)
+
+    writer = CatalogWriter(path)
+    for _, _, e in _external_sort(decorated, run_size):
+        writer.add(*e)
+
+    writer.close()
+    return writer.count
+
+
+def _flag(value):
+    """Parse boolean from JSON or CSV value."""
+    if isinstance(value, basestring):
+        return value.strip().lower() in ('1', 'true', 'yes', 't')
+    return bool(value)
+
+
+def _dump_entry(d):
+    """Create entry tuple from one record of a subreddit dump."""
+    name = d.get('display_name') or d.get('name') or ''
+    if name.startswith('t5_'):  # Fullname ID, not display name
+        return None
+
+    name = name.strip()
+    if not name:
+        return None
+
+    try:
+        subscribers = int(d.get('subscribers') or 0)
+    except ValueError:
+        subscribers = 0
+
+    return (name,
+            (d.get('title') or '').strip(),
+            d.get('subreddit_type') or d.get('type') or 'public',
+            subscribers,
+            _flag(d.get('over18') or d.get('over_18') or d.get('nsfw')))
+
+
+def read_dump(fp):
+    """Generate entries from a dump of subreddits.
+
+    The dump may be newline-delimited JSON or CSV with a header row.
+    Fields are ``display_name`` (or ``name``), ``title``,
+    ``subscribers``, ``over18`` and ``subreddit_type`` (or ``type``).
+    Unreadable records are skipped.
+
+    Args:
+        fp (file): Open dump file.
+
+    Yields:
+        tuple: ``(name, title, type, subscribers, nsfw)`` entry.
+
+    """
+    first = fp.readline()
+    if first.lstrip().startswith(b'{'):
+        for line in chain([first], fp):
+            if not line.strip():
+                continue
+            try:
+                e = _dump_entry(json.loads(line))
+            except (ValueError, AttributeError):
+                continue
+            if e:
+                yield e
+
+        return
+
+    import csv
+    header = next(csv.reader([first]))
+    for row in csv.DictReader(fp, fieldnames=header):
+        try:
+            d = {k: v.decode('utf-8') for k, v in row.items()
+                 if k and v is not None}
+            e = _dump_entry(d)
+        except (UnicodeDecodeError, AttributeError):
+            continue
+        if e:
+            yield e
+
+
+def open_catalog(path):
+    """Open catalog at ``path`` or return ``None`` if it doesn't exist."""
+    if not os.path.exists(path):
+        return None
+    return Catalog(path)
@@ -6,11 +6,13 @@
  * Copyright (c) 2013 Vladimir Keleshev, vladimir@keleshev.com
 
 """
+import os
 import sys
 import re
+import zlib
 
 
-__all__ = ['docopt']
+__all__ = ['docopt', 'Usage', 'cached_usage']
 __version__ = '0.6.2'
 
 
@@ -490,7 +492,83 @@ class Dict(dict):
         return '{%s}' % ',\n '.join('%r: %r' % i for i in sorted(self.items()))
 
 
-def docopt(doc, argv=None, help=True, version=None, options_first=False):
+class Usage(object):
+
+    """Usage-message `doc` compiled into a pattern that argv is matched
+    against. Compile once with `Usage(doc)` to parse many argvs, or use
+    `cached_usage()` to also skip compiling in later processes."""
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.usage = printable_usage(doc)
+        self.options = parse_defaults(doc)
+        self.pattern = parse_pattern(formal_usage(self.usage), self.options)
+        # [default] syntax for argument is disabled
+        #for a in pattern.flat(Argument):
+        #    same_name = [d for d in arguments if d.name == a.name]
+        #    if same_name:
+        #        a.value = same_name[0].value
+        pattern_options = set(self.pattern.flat(Option))
+        for ao in self.pattern.flat(AnyOptions):
+            doc_options = parse_defaults(doc)
+            ao.children = list(set(doc_options) - pattern_options)
+            #if any_options:
+            #    ao.children += [Option(o.short, o.long, o.argcount)
+            #                    for o in argv if type(o) is Option]
+        self.pattern.fix()
+
+    def parse(self, argv, help=True, version=None, options_first=False):
+        """Match `argv` against pattern. See `docopt()`."""
+        DocoptExit.usage = self.usage
+        argv = parse_argv(TokenStream(argv, DocoptExit), list(self.options),
+                          options_first)
+        extras(help, version, argv, self.doc)
+        matched, left, collected = self.pattern.match(argv)
+        if matched and left == []:  # better error message if left?
+            return Dict((a.name, a.value)
+                        for a in (self.pattern.flat() + collected))
+        raise DocoptExit()
+
+
+def cached_usage(doc, cachedir):
+    """Return `Usage` for `doc`, compiled by an earlier process if
+    possible.
+
+    Compiled usages are pickled to `cachedir`, in a file named after
+    a hash of `doc`. If the file is missing or unreadable, `doc` is
+    compiled and the file (re)written.
+
+    """
+    try:
+        import cPickle as pickle
+    except ImportError:
+        import pickle
+
+    data = doc if isinstance(doc, bytes) else doc.encode('utf-8')
+    name = 'docopt-%s-%08x.pickle' % (__version__,
+                                      zlib.crc32(data) & 0xffffffff)
+    path = os.path.join(cachedir, name)
+    try:
+        with open(path, 'rb') as fp:
+            usage = pickle.load(fp)
+        if usage.doc == doc:
+            return usage
+    except Exception:  # missing, corrupt or written by another version
+        pass
+
+    usage = Usage(doc)
+    temp = '%s.%d' % (path, os.getpid())
+    try:
+        with open(temp, 'wb') as fp:
+            pickle.dump(usage, fp, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp, path)
+    except (IOError, OSError):  # cache is optional
+        pass
+    return usage
+
+
+def docopt(doc, argv=None, help=True, version=None, options_first=False,
+           cachedir=None):
     """Parse `argv` based on command-line interface described in `doc`.
 
     `docopt` creates your command-line interface based on its
@@ -514,6 +592,10 @@ def docopt(doc, argv=None, help=True, version=None, options_first=False):
     options_first : bool (default: False)
         Set to True to require options preceed positional arguments,
         i.e. to forbid options and positional arguments intermix.
+    cachedir : str, optional
+        Directory to cache the compiled `doc` in, so later calls
+        (in this or other processes) needn't parse it again. See
+        `cached_usage()`.
 
     Returns
     -------
@@ -555,25 +637,5 @@ def docopt(doc, argv=None, help=True, version=None, options_first=False):
     """
     if argv is None:
         argv = sys.argv[1:]
-    DocoptExit.usage = printable_usage(doc)
-    options = parse_defaults(doc)
-    pattern = parse_pattern(formal_usage(DocoptExit.usage), options)
-    # [default] syntax for argument is disabled
-    #for a in pattern.flat(Argument):
-    #    same_name = [d for d in arguments if d.name == a.name]
-    #    if same_name:
-    #        a.value = same_name[0].value
-    argv = parse_argv(TokenStream(argv, DocoptExit), list(options),
-                      options_first)
-    pattern_options = set(pattern.flat(Option))
-    for ao in pattern.flat(AnyOptions):
-        doc_options = parse_defaults(doc)
-        ao.children = list(set(doc_options) - pattern_options)
-        #if any_options:
-        #    ao.children += [Option(o.short, o.long, o.argcount)
-        #                    for o in argv if type(o) is Option]
-    extras(help, version, argv, doc)
-    matched, left, collected = pattern.fix().match(argv)
-    if matched and left == []:  # better error message if left?
-        return Dict((a.name, a.value) for a in (pattern.flat() + collected))
-    raise DocoptExit()
+    usage = cached_usage(doc, cachedir) if cachedir else Usage(doc)
+    return usage.parse(argv, help, version, options_first)
@@ -0,0 +1,469 @@
+#!/usr/bin/python
+# encoding: utf-8
+#
+# Copyright (c) 2014 deanishe@deanishe.net
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2026-10-18
+#
+
+"""Inverted index of posts for full-text search across subreddits.
+
+Posts are added as they are cached and dropped again once they're
+older than the retention window. Queries only read the posting lists
+of the query's words and the documents they return, not the whole
+index.
+
+Directory layout (all files are :mod:`marshal` dumps)::
+
+    meta          version, record version, next document ID, oldest
+                  live document ID, time of first and last addition,
+                  number and total length of documents in each block
+    keys          document key (e.g. permalink) -> document ID
+    terms-<c>     word -> posting list, for words starting with <c>
+    docs-<n>      document ID -> (time added, record version, record),
+                  for IDs ``n * DOC_BLOCK`` to ``(n + 1) * DOC_BLOCK - 1``
+
+Adding documents doesn't rewrite ``keys`` and ``terms-<c>``. New keys
+and postings are appended to ``keys.log`` and ``terms-<c>.log`` as
+further dumps, which readers merge with the main file. A log is
+compacted into its main file once it's larger than
+:const:`COMPACT_SIZE`, and all logs are compacted when documents
+expire.
+
+A posting list is an :class:`array.array` of unsigned ints, two per
+occurrence of the word: document ID and ``position << 16 | length``,
+where ``position`` is the index of the word in the document and
+``length`` the number of words in the document. Document IDs only
+increase, so posting lists are sorted and whole blocks of documents
+expire together. No more documents are added to a block after a
+quarter of the retention window, so documents are kept for at most
+1.25 times the window.
+
+"""
+
+from __future__ import print_function, absolute_import
+
+from array import array
+import heapq
+import marshal
+import math
+import os
+import re
+import time
+
+from workflow.util import LockFile, atomic_writer
+
+VERSION = 2
+
+# Number of documents per docs-<n> file
+DOC_BLOCK = 256
+
+# Size at which a log is merged into its main file
+COMPACT_SIZE = 64 * 1024
+
+# Default retention window
+MAX_AGE = 86400 * 7  # 1 week
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Score multiplier for each pair of consecutive query words that are
+# also adjacent in a document
+PHRASE_BOOST = 1.5
+
+# Min. length of the last word of a query to match words it is a
+# prefix of (as the user is probably still typing it)
+PREFIX_MIN_LENGTH = 2
+
+_split = re.compile(r'\w+', re.UNICODE).findall
+_shard_file = re.compile(r'terms-(\w)(?:\.log)?$').match
+
+
+def tokenize(text):
+    """Split ``text`` into lowercase words."""
+    return _split(text.lower())
+
+
+def shard(word):
+    """Name of the posting list file for ``word``."""
+    c = word[0]
+    if c.isalnum() and ord(c) < 128:
+        return c
+
+    return '_'
+
+
+def _load(path, default=None):
+    """Load marshalled data from ``path``."""
+    try:
+        with open(path, 'rb') as fp:
+            return marshal.load(fp)
+    except (IOError, EOFError, ValueError, TypeError):
+        return default
+
+
+def _dump(path, data):
+    """Marshal ``data`` to ``path``."""
+    with atomic_writer(path, 'wb') as fp:
+        marshal.dump(data, fp)
+
+
+def _load_log(path):
+    """Load data appended to ``path`` by `_append()`."""
+    records = []
+    try:
+        with open(path, 'rb') as fp:
+            while True:
+                records.append(marshal.load(fp))
+    except IOError:  # no log
+        pass
+    except (EOFError, ValueError, TypeError):  # end of log (or torn write)
+        pass
+    return records
+
+
+def _append(path, data):
+    """Marshal ``data`` to the end of ``path`` (in one write)."""
+    with open(path, 'ab') as fp:
+        fp.write(marshal.dumps(data))
+
+
+def _size(path):
+    """Size of file ``path`` (0 if it doesn't exist)."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class PostIndex(object):
+    """Inverted index of posts stored in a directory.
+
+    Args:
+        dirpath (str): Directory to keep index in. It is created if
+            it doesn't exist.
+        max_age (int, optional): Retention window in seconds.
+            Documents are dropped when they were added longer ago.
+        record_version (int, optional): Version of the format of
+            records added to the index. `search()` skips records of
+            newer versions, and the index is cleared if it contains
+            any.
+
+    """
+
+    def __init__(self, dirpath, max_age=MAX_AGE, record_version=0):
+        """Create new `PostIndex` in ``dirpath``."""
+        self.dirpath = dirpath
+        self.max_age = max_age
+        self.record_version = record_version
+        if not os.path.exists(dirpath):
+            os.makedirs(dirpath)
+
+    def _path(self, name):
+        return os.path.join(self.dirpath, name)
+
+    def _meta(self):
+        meta = _load(self._path('meta'))
+        if (not meta or meta.get('version') != VERSION or
+                meta.get('records', 0) > self.record_version):
+            return {'version': VERSION, 'records': self.record_version,
+                    'next': 0, 'oldest': 0, 'blocks': {}}
+
+        return meta
+
+    def _keys(self):
+        """Document key -> ID mapping (main file plus log)."""
+        keys = _load(self._path('keys'), {})
+        for added in _load_log(self._path('keys.log')):
+            keys.update(added)
+        return keys
+
+    def _shard(self, name):
+        """Word -> posting list mapping of shard ``name``."""
+        path = self._path('terms-{}'.format(name))
+        lists = _load(path, {})
+        for added in _load_log(path + '.log'):
+            for word, data in added.items():
+                lists[word] = lists.get(word, b'') + data
+        return lists
+
+    def __len__(self):
+        """Number of documents in index."""
+        return sum([b[2] for b in self._meta()['blocks'].values()])
+
+    def add(self, docs, now=None):
+        """Add documents to index and drop expired ones.
+
+        Documents that are already in the index have their record
+        replaced, but keep their place in the retention window.
+
+        Args:
+            docs (iterable): ``(key, text, record)`` tuples. ``key``
+                uniquely identifies the document, ``text`` is indexed
+                and ``record`` (any value :mod:`marshal` can store)
+                is returned by `search()`.
+            now (float, optional): Current time.
+
+        Returns:
+            int: Number of new documents.
+
+        """
+        now = now or time.time()
+        with LockFile(self._path('meta')):
+            meta = self._meta()
+            if not meta['next']:  # new index or unknown version
+                self._clear()
+
+            meta['records'] = self.record_version
+            keys = self._keys()
+            oldest = self._expire(meta, now)
+
+            blocks = {}    # block number -> documents
+            postings = {}  # shard -> {word: array}
+            added = {}     # new keys
+            count = 0
+
+            def block(n):
+                if n not in blocks:
+                    blocks[n] = _load(self._path('docs-{}'.format(n)), {})
+                return blocks[n]
+
+            for key, text, record in docs:
+                i = keys.get(key)
+                if i is not None:
+                    entries = block(i // DOC_BLOCK)
+                    if i in entries:
+                        entries[i] = (entries[i][0], self.record_version,
+                                      record)
+                    continue
+
+                # Start a new block if current one is too old
+                stats = meta['blocks'].get(meta['next'] // DOC_BLOCK)
+                if stats and stats[0] < now - self.max_age / 4:
+                    meta['next'] += DOC_BLOCK - meta['next'] % DOC_BLOCK
+
+                i = keys[key] = added[key] = meta['next']
+                meta['next'] += 1
+                block(i // DOC_BLOCK)[i] = (now, self.record_version, record)
+
+                words = tokenize(text)
+                length = min(len(words), 0xffff)
+                for pos, word in enumerate(words[:0xffff]):
+                    lists = postings.setdefault(shard(word), {})
+                    lists.setdefault(word, array(b'I')).extend(
+                        (i, pos << 16 | length))
+
+                stats = meta['blocks'].setdefault(i // DOC_BLOCK,
+                                                  [now, now, 0, 0])
+                stats[1] = now
+                stats[2] += 1
+                stats[3] += length
+                count += 1
+
+            if oldest:  # drop expired postings from all shards
+                names = set(postings)
+                for fn in os.listdir(self.dirpath):
+                    m = _shard_file(fn)
+                    if m:
+                        names.add(m.group(1))
+                for name in names:
+                    self._compact_shard(name, postings.get(name, {}),
+                                        oldest)
+            else:
+                for name, lists in postings.items():
+                    self._append_shard(name, lists, meta['oldest'])
+
+            for n, entries in blocks.items():
+                _dump(self._path('docs-{}'.format(n)), entries)
+
+            path = self._path('keys')
+            if oldest or _size(path + '.log') > COMPACT_SIZE:
+                _dump(path, {k: i for k, i in keys.items()
+                             if i >= meta['oldest']})
+                self._unlink(path + '.log')
+            elif added:
+                _append(path + '.log', added)
+
+            _dump(self._path('meta'), meta)
+
+        return count
+
+    def _clear(self):
+        """Delete index files."""
+        for fn in os.listdir(self.dirpath):
+            if fn.startswith(('keys', 'terms-', 'docs-')):
+                os.unlink(self._path(fn))
+
+    def _unlink(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _expire(self, meta, now):
+        """Delete blocks of expired documents.
+
+        Returns:
+            int: New ID of oldest document if any blocks were deleted,
+                otherwise 0.
+
+        """
+        cutoff = now - self.max_age
+        expired = [n for n, b in meta['blocks'].items() if b[1] < cutoff]
+        if not expired:
+            return 0
+
+        for n in expired:
+            del meta['blocks'][n]
+            self._unlink(self._path('docs-{}'.format(n)))
+
+        meta['oldest'] = max(meta['oldest'], (max(expired) + 1) * DOC_BLOCK)
+        return meta['oldest']
+
+    def _append_shard(self, name, lists, oldest):
+        """Append posting ``lists`` to the log of shard ``name``.
+
+        The log is compacted instead if it's grown too large.
+
+        """
+        path = self._path('terms-{}'.format(name))
+        if _size(path + '.log') > COMPACT_SIZE:
+            self._compact_shard(name, lists, oldest)
+        else:
+            _append(path + '.log', {w: a.tostring()
+                                    for w, a in lists.items()})
+
+    def _compact_shard(self, name, lists, oldest):
+        """Merge log of shard ``name`` and posting ``lists`` into its
+        main file.
+
+        Postings of documents older than ``oldest`` are dropped.
+
+        """
+        path = self._path('terms-{}'.format(name))
+        stored = self._shard(name)
+        for word, data in stored.items():
+            a = array(b'I', data)
+            if a and a[0] < oldest:
+                a = _prune(a, oldest)
+            if word in lists:
+                a.extend(lists.pop(word))
+            if a:
+                stored[word] = a.tostring()
+            else:
+                del stored[word]
+
+        for word, a in lists.items():
+            stored[word] = a.tostring()
+
+        _dump(path, stored)
+        self._unlink(path + '.log')
+
+    def _postings(self, word, prefix, oldest, cache):
+        """Return ``{id: (tf, length, positions)}`` for ``word``.
+
+        If ``prefix`` is ``True``, postings of all words starting with
+        ``word`` are merged.
+
+        """
+        name = shard(word)
+        if name not in cache:
+            cache[name] = self._shard(name)
+
+        lists = cache[name]
+        if prefix:
+            data = [v for k, v in lists.items() if k.startswith(word)]
+        else:
+            data = [lists[word]] if word in lists else []
+
+        postings = {}
+        for s in data:
+            a = array(b'I', s)
+            for j in xrange(0, len(a), 2):
+                i = a[j]
+                if i < oldest:
+                    continue
+                p = postings.get(i)
+                if p is None:
+                    p = postings[i] = [0, a[j + 1] & 0xffff, []]
+                p[0] += 1
+                p[2].append(a[j + 1] >> 16)
+
+        return postings
+
+    def search(self, query, limit=50):
+        """Return documents matching all words in ``query``.
+
+        Documents are ranked by BM25, boosted if consecutive words
+        of ``query`` are adjacent in the document. The last word of
+        ``query`` also matches words it is a prefix of.
+
+        Args:
+            query (unicode): Search query.
+            limit (int, optional): Max. number of results.
+
+        Returns:
+            list: ``(score, record)`` tuples, best match first.
+
+        """
+        words = tokenize(query)
+        meta = self._meta()
+        count = sum([b[2] for b in meta['blocks'].values()])
+        if not words or not count:
+            return []
+
+        avglen = float(sum([b[3] for b in meta['blocks'].values()])) / count
+        oldest = meta['oldest']
+
+        cache = {}
+        terms = []
+        for j, word in enumerate(words):
+            prefix = j == len(words) - 1 and len(word) >= PREFIX_MIN_LENGTH
+            postings = self._postings(word, prefix, oldest, cache)
+            if not postings:
+                return []
+            terms.append(postings)
+
+        ids = set(min(terms, key=len))
+        for postings in terms:
+            ids.intersection_update(postings)
+
+        scores = []
+        for i in ids:
+            score = 0.0
+            for postings in terms:
+                tf, length, _ = postings[i]
+                idf = math.log(1 + (count - len(postings) + 0.5) /
+                               (len(postings) + 0.5))
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avglen)
+                score += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+            for a, b in zip(terms, terms[1:]):
+                if set(a[i][2]) & {p - 1 for p in b[i][2]}:
+                    score *= PHRASE_BOOST
+
+            scores.append((score, i))
+
+        results = []
+        blocks = {}
+        for score, i in heapq.nlargest(limit, scores):
+            n = i // DOC_BLOCK
+            if n not in blocks:
+                blocks[n] = _load(self._path('docs-{}'.format(n)), {})
+            entry = blocks[n].get(i)
+            if entry and entry[1] <= self.record_version:
+                results.append((score, entry[2]))
+
+        return results
+
+
+def _prune(a, oldest):
+    """Drop postings of documents older than ``oldest`` from ``a``."""
+    for j in xrange(0, len(a), 2):
+        if a[j] >= oldest:
+            return a[j:]
+
+    return array(b'I')
@@ -16,6 +16,9 @@ Usage:
     reddit.py <query>
     reddit.py --search <query>
     reddit.py --update
+    reddit.py --more <name> [--reopen]
+    reddit.py --search-posts <name> <query>
+    reddit.py --import-catalog <file>
     reddit.py [-c] [-p] [-s] [-b]
 
 Options:
@@ -24,6 +27,10 @@ Options:
     -s, --subreddit       Open subreddit in browser
     -b, --submit          Submit link/text to subreddit
     --search <query>      Search for subreddits using API
+    --more <name>         Fetch next page of posts in subreddit
+    -r, --reopen          Show subreddit in Alfred again afterwards
+    --search-posts <name> Search for posts in subreddit using API
+    --import-catalog <file>  Import dump of subreddits into local catalog
     -u, --update          Update list of top subreddits
     -h, --help            Show this help text
 
@@ -31,16 +38,27 @@ Options:
 
 from __future__ import print_function, unicode_literals, absolute_import
 
-from datetime import datetime
-from HTMLParser import HTMLParser
-from functools import partial
+import atexit
+from collections import namedtuple
+import heapq
+import json
+import math
+import operator
 import os
 import re
-import subprocess
 import sys
-
-from workflow import Workflow3, web, ICON_WARNING
+from threading import Thread
+import time
+import zlib
+
+from catalog import (build as build_catalog, open_catalog, read_dump,
+                     similar)
+from postindex import PostIndex
+from workflow import (Workflow3, ICON_WARNING, MATCH_ALL, MATCH_ALLCHARS,
+                      MATCH_FUZZY)
 from workflow.background import is_running, run_in_background
+from workflow.util import LockFile
+from workflow.workflow3 import Item3
 
 
 # dP     dP                   oo          dP       dP
@@ -50,268 +68,1731 @@ from workflow.background import is_running, run_in_background
 # 88  .d8P  88.  .88 88       88 88.  .88 88.  .88 88 88.  ...       88
 # 888888'   `88888P8 dP       dP `88888P8 88Y8888' dP `88888P' `88888P'
 
-# How many posts to retrieve
-POST_COUNT = 50
+# How many posts to retrieve
+POST_COUNT = 50
+
+# How many subreddits to retrieve
+SUBREDDIT_COUNT = 25
+
+# How long to cache searches for subreddits for
+SEARCH_CACHE_MAX_AGE = 3600  # 1 hour
+
+# How long to cache lists of posts for. This is the default: the
+# actual lifetime is calculated for each subreddit from how quickly
+# its posts change (see `adaptive_ttl()`)
+POSTS_CACHE_MAX_AGE = 180  # 3 minutes
+
+# Bounds of calculated lifetime of cached posts
+POSTS_TTL_MIN = int(os.getenv('POSTS_TTL_MIN') or 30)
+POSTS_TTL_MAX = int(os.getenv('POSTS_TTL_MAX') or 1800)  # 30 minutes
+
+# Aim to refresh cached posts after this many new posts have
+# probably been submitted ...
+POSTS_TTL_NEW_POSTS = 3
+
+# ... or this fraction of the hot list has probably changed
+POSTS_TTL_CHURN = 0.2
+
+# Max. number of posts to keep per subreddit. "Load more…" appends
+# pages of `POST_COUNT` posts to the cached posts up to this limit.
+POST_STORE_MAX = 500
+
+# How long to keep posts from additional pages. After this, the
+# cached posts are reset to the first page.
+POST_STORE_MAX_AGE = 3600  # 1 hour
+
+# Fetch more posts in the background if a query matches fewer than
+# this many cached posts...
+DEEP_FETCH_MIN_MATCHES = 5
+
+# ... but not beyond this many posts
+DEEP_FETCH_MAX_POSTS = 250
+
+# Search for posts via the API if a query matches fewer than this
+# many cached posts
+SEARCH_FALLBACK_MIN_MATCHES = 5
+
+# Min. length of query to search posts via API. Results for shorter
+# queries are re-used for longer queries they are a prefix of.
+SEARCH_FALLBACK_MIN_LENGTH = 3
+
+# How long to cache results of post searches
+POST_SEARCH_CACHE_MAX_AGE = 900  # 15 minutes
+
+# How long to remember that a subreddit doesn't exist
+MISSING_CACHE_MAX_AGE = 3600  # 1 hour
+
+# Don't start optional requests (searches, additional pages) if
+# fewer than this many API requests remain in the current rate-limit
+# period
+RATELIMIT_RESERVE = 10
+
+# How long to cache list of top subreddits
+TOP_CACHE_MAX_AGE = 86400  # 1 day
+
+# How many top reddits to cache
+TOP_COUNT = 500
+
+# How many subreddits to show for an empty query
+TOP_SHOW_COUNT = 200
+
+# Compiled catalog of top subreddits (in cache directory)
+TOP_CATALOG = 'top-subreddits.catalog'
+
+# Catalog of subreddits imported from a dump (in data directory)
+IMPORTED_CATALOG = 'subreddits.catalog'
+
+# Max. number of subreddits in a catalog whose names start with the
+# query to add to search results. The ones with the most subscribers
+# among the first `SEARCH_CATALOG_SCAN` are used.
+SEARCH_CATALOG_LIMIT = 100
+SEARCH_CATALOG_SCAN = 2000
+
+# Suggest known subreddits whose names are within this many edits of
+# a name that doesn't exist (1 for names of up to 4 letters) ...
+TYPO_MAX_DISTANCE = 2
+
+# ... but no more than this many
+TYPO_SUGGESTIONS = 3
+
+# Max. number of subreddits to fetch in one combined listing, e.g.
+# r/a+b+c/hot.json. Larger sets are split into chunks, which are
+# fetched concurrently and cached separately.
+FEED_CHUNK_SIZE = 25
+
+# Name of the feed that combines all subreddits in history
+HISTORY_FEED = '+history'
+
+# Name that searches posts in all cached subreddits, i.e. "r/*/query"
+SEARCH_ALL = '*'
+
+# Index of all cached posts (in cache directory)
+POST_INDEX = 'postindex'
+
+# How long to keep posts in the index
+POST_INDEX_MAX_AGE = 86400 * 7  # 1 week
+
+# Max. number of results when searching all cached posts
+POST_INDEX_RESULTS = 50
+
+# How to order posts in combined feeds: "hot" or "new"
+FEED_SORT = os.getenv('FEED_SORT', 'hot').lower()
+
+# How to match queries against posts. The fuzzy scorer ranks the best
+# alignment of the query in a title instead of the leftmost one.
+POST_MATCH = MATCH_ALL ^ MATCH_ALLCHARS | MATCH_FUZZY
+
+# Filters that may be used in post queries, e.g. "score>100 age<6h"
+POST_FILTER = re.compile(r'(author|age|score|comments|self|nsfw|domain|'
+                         r'flair|sort)(<=|>=|<|>|=|:)(.*)$', re.IGNORECASE)
+
+# Comparisons of numeric post filters
+POST_FILTER_OPS = {
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+    '=': operator.eq,
+    ':': operator.eq,
+}
+
+# Units of "age" filter. Numbers without a unit are hours.
+AGE_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+# Orders of posts that may be chosen with "sort:<order>"
+POST_SORTS = {
+    'score': lambda p: -p.score,
+    'comments': lambda p: -p.comments,
+    'new': lambda p: -p.timestamp,
+}
+
+# Include NSFW subreddits
+NSFW = os.getenv('NSFW', '0').lower() in ('1', 'true', 'yes', 'on')
+
+# GitHub update settings
+UPDATE_SETTINGS = {'github_slug': 'deanishe/alfred-reddit'}
+
+HELP_URL = 'https://github.com/deanishe/alfred-reddit'
+
+
+ICON_REDDIT = 'icon.png'
+ICON_UPDATE = 'update-available.png'
+
+# Where to send API requests. Override to use a stand-in server,
+# e.g. benchmarks/standin.py
+API_BASE_URL = (os.getenv('API_BASE_URL') or
+                'https://www.reddit.com').rstrip('/')
+
+# JSON list of hot posts in subreddit
+HOT_POSTS_URL = API_BASE_URL + '/r/{name}/hot.json'
+# HOT_POSTS_URL = 'https://www.reddit.com/{name}/hot.json'
+
+# JSON list of hot posts in user multi
+USER_MULTI_HOT_URL = API_BASE_URL + '/{name}.json'
+
+# JSON subreddit search
+SEARCH_URL = API_BASE_URL + '/subreddits/search.json'
+
+# JSON post search within a subreddit
+POST_SEARCH_URL = API_BASE_URL + '/r/{name}/search.json'
+
+# JSON list of popular subreddits
+POPULAR_URL = API_BASE_URL + '/subreddits/popular.json'
+
+# HTML URL of subreddit
+SUBREDDIT_URL = 'https://www.reddit.com/r/{name}/'
+
+# HTML URL of user multi
+USER_MULTI_URL = 'https://www.reddit.com/{name}/'
+
+# HTML URL of post
+POST_URL = 'https://www.reddit.com{permalink}'
+
+USER_AGENT = 'Alfred-Reddit/{version} ({url})'
+
+# Version of the format of cached posts and subreddits. Increment
+# when fields are added to `Post` or `Subreddit`. Fields may only be
+# appended, so records cached by older versions can still be loaded.
+RECORD_VERSION = 4
+
+# Populated on run
+log = None
+
+
+# dP     dP           dP
+# 88     88           88
+# 88aaaaa88a .d8888b. 88 88d888b. .d8888b. 88d888b. .d8888b.
+# 88     88  88ooood8 88 88'  `88 88ooood8 88'  `88 Y8ooooo.
+# 88     88  88.  ... 88 88.  .88 88.  ... 88             88
+# dP     dP  `88888P' dP 88Y888P' `88888P' dP       `88888P'
+#                        88
+#                        dP
+
+def open_url(url):
+    """Open URL in default browser."""
+    log.debug('Opening : %s', url)
+    import subprocess
+    subprocess.call(['open', url])
+
+
+def cache_key(name):
+    """Make filesystem-friendly cache key."""
+    key = name.lower()
+    key = re.sub(r'[^a-z0-9-_\.]', '-', key)
+    key = re.sub(r'-+', '-', key)
+    log.debug('Cache key : %r -> %r', name, key)
+    return key
+
+
+def relative_time(timestamp):
+    """Return human-readable, relative time."""
+    from datetime import datetime
+    now = datetime.utcnow()
+    postdate = datetime.utcfromtimestamp(timestamp)
+    delta = now - postdate
+    seconds = delta.seconds
+    days, rem = divmod(seconds, 86400)
+    hours, rem = divmod(rem, 3600)
+    minutes, seconds = divmod(rem, 60)
+    # log.debug('Post is {!r} old'.format(delta))
+    if days:
+        return '{} day{} ago'.format(days, 's'[days == 1:])
+    if hours:
+        return '{} hr{} ago'.format(hours, 's'[hours == 1:])
+    if minutes:
+        return '{} min{} ago'.format(minutes, 's'[minutes == 1:])
+    if seconds:
+        return '{} sec{} ago'.format(seconds, 's'[seconds == 1:])
+    else:
+        return '1 sec ago'
+
+
+def decode_html_entities(s):
+    """Decode HTML entities into Unicode."""
+    from HTMLParser import HTMLParser
+    h = HTMLParser()
+    return h.unescape(s)
+
+
+def file_mtime(path):
+    """Return modification time of ``path`` or 0 if it doesn't exist."""
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0
+
+
+def cache_mtime(name):
+    """Return modification time of cache ``name`` or 0 if it doesn't exist."""
+    return file_mtime(wf.cachefile('{}.{}'.format(name, wf.cache_serializer)))
+
+
+def normalise_query(query):
+    """Lowercase ``query`` and collapse whitespace."""
+    return ' '.join(query.lower().split())
+
+
+def subreddit_from_env():
+    """Return subreddit based on env vars."""
+    values = [wf.decode(os.getenv(k) or '') for k in
+              ('subreddit_name', 'subreddit_title', 'subreddit_type')]
+    if not all(values):
+        return None
+
+    sr = Subreddit(*values)
+    log.debug('subreddit from env=%r', sr)
+    return sr
+
+
+#  888888ba                                            dP
+#  88    `8b                                           88
+# a88aaaa8P' .d8888b. .d8888b. .d8888b. 88d888b. .d888b88 .d8888b.
+#  88   `8b. 88ooood8 88'  `"" 88'  `88 88'  `88 88'  `88 Y8ooooo.
+#  88     88 88.  ... 88.  ... 88.  .88 88       88.  .88       88
+#  dP     dP `88888P' `88888P' `88888P' dP       `88888P8 `88888P'
+
+class Record(tuple):
+    """Base class of cached objects.
+
+    Records are tuples with named fields, like `namedtuple` objects.
+    They are cached as plain tuples, not pickled objects, so cache
+    files stay small, and loading them only has to create tuples (see
+    `unpack_records()`).
+
+    """
+
+    __slots__ = ()
+
+    def pack(self):
+        """Return record as a tuple for caching."""
+        return tuple(self)
+
+    def __repr__(self):
+        """Readable representation."""
+        return '{}{!r}'.format(self.__class__.__name__, self.pack())
+
+
+class Post(Record, namedtuple('Post', 'title permalink url author subreddit '
+                               'score timestamp comments domain flair nsfw')):
+    """Reddit post.
+
+    URLs and relative time are not cached, but calculated on demand.
+
+    Attributes:
+        title (unicode): Title of post.
+        permalink (unicode): Path of post's comments page.
+        url (unicode): URL of linked article or ``None`` for self posts.
+        author (unicode): Username of poster.
+        subreddit (unicode): Subreddit post was submitted to.
+        score (int): Post's score.
+        timestamp (float): UTC timestamp of submission.
+        comments (int): Number of comments.
+        domain (unicode): Domain of linked article or ``self.<name>``
+            for self posts.
+        flair (unicode): Post's flair text.
+        nsfw (bool): Whether post is marked "over 18".
+
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, title, permalink, url, author, subreddit='', score=0,
+                timestamp=0, comments=0, domain='', flair='', nsfw=False):
+        """Create new `Post`."""
+        return tuple.__new__(cls, (title, permalink, url, author, subreddit,
+                                   score, timestamp, comments, domain, flair,
+                                   nsfw))
+
+    @classmethod
+    def from_dict(cls, d):
+        """Create `Post` from dict cached by an older version."""
+        permalink = d['comments_url'][len(POST_URL.format(permalink='')):]
+        url = d['post_url']
+        if url == d['comments_url']:
+            url = None
+
+        return cls(d['title'], permalink, url, d['author'],
+                   d.get('subreddit', ''), d.get('score', 0), d['timestamp'])
+
+    @property
+    def comments_url(self):
+        """URL of post's comments page."""
+        return POST_URL.format(permalink=self.permalink)
+
+    @property
+    def post_url(self):
+        """URL of linked article or comments page for self posts."""
+        return self.url or self.comments_url
+
+    @property
+    def selfpost(self):
+        """Whether post is a self (text) post."""
+        return self.url is None
+
+    @property
+    def reltime(self):
+        """Human-readable age of post."""
+        return relative_time(self.timestamp)
+
+
+class Subreddit(Record, namedtuple('Subreddit',
+                                   'name title type subscribers nsfw')):
+    """Subreddit or user multi.
+
+    Attributes:
+        name (unicode): Name of subreddit, e.g. ``python`` or
+            ``u/<user>/m/<multi>``.
+        title (unicode): Subreddit's title.
+        type (unicode): ``public``, ``restricted`` etc.
+        subscribers (int): Number of subscribers (0 if unknown).
+        nsfw (bool): Whether subreddit is marked "over 18".
+
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, name, title, type='public', subscribers=0, nsfw=False):
+        """Create new `Subreddit`."""
+        return tuple.__new__(cls, (name, title, type, subscribers, nsfw))
+
+    @classmethod
+    def from_dict(cls, d):
+        """Create `Subreddit` from dict cached by an older version."""
+        return cls(d['name'], d['title'], d['type'])
+
+    @property
+    def url(self):
+        """URL of subreddit's webpage."""
+        return subreddit_url(self.name)
+
+
+def pack_records(records):
+    """Convert `Record` objects to versioned, cacheable data."""
+    return {'version': RECORD_VERSION,
+            'records': [r.pack() for r in records]}
+
+
+def unpack_records(data, cls):
+    """Convert data from `pack_records()` to ``cls`` objects.
+
+    Lists of dicts cached by older versions are also converted.
+
+    Args:
+        data (object): Cached data.
+        cls (type): `Post` or `Subreddit`.
+
+    Returns:
+        list: ``cls`` objects or ``None`` if ``data`` is ``None``
+            or in an unknown format.
+
+    """
+    if isinstance(data, list):  # Cached by an older version
+        return [cls.from_dict(d) for d in data]
+
+    version = data.get('version', 0) if isinstance(data, dict) else 0
+    if version == RECORD_VERSION:
+        # Records are complete: skip `__new__()` and its defaults
+        new = tuple.__new__
+        return [new(cls, t) for t in data['records']]
+
+    # Records from older versions lack newer fields, which get defaults
+    if 0 < version < RECORD_VERSION:
+        return [cls(*t) for t in data['records']]
+
+    return None
+
+
+def cache_records(key, records, session=False):
+    """Cache list of `Post` or `Subreddit` objects under ``key``."""
+    wf.cache_data(key, pack_records(records), session=session)
+
+
+def cached_records(key, cls, max_age=0, session=False):
+    """Load list of ``cls`` objects cached by `cache_records()`.
+
+    Args:
+        key (unicode): Cache key.
+        cls (type): `Post` or `Subreddit`.
+        max_age (int, optional): Max. age of cache in seconds.
+        session (bool, optional): Whether cache is session-scoped.
+
+    Returns:
+        list: ``cls`` objects or ``None`` if cache is missing or stale.
+
+    """
+    data = wf.cached_data(key, max_age=max_age, session=session)
+    return unpack_records(data, cls)
+
+
+#  a88888b.            dP            dP
+# d8'   `88            88            88
+# 88        .d8888b. d8888P .d8888b. 88 .d8888b. .d8888b.
+# 88        88'  `88   88   88'  `88 88 88'  `88 88'  `88
+# Y8.   .88 88.  .88   88   88.  .88 88 88.  .88 88.  .88
+#  Y88888P' `88888P8   dP   `88888P8 dP `88888P' `8888P88
+#                                                     .88
+#                                                 d8888P
+
+# Catalogs opened by `load_catalog()`, keyed by path
+_catalogs = {}
+
+
+def load_catalog(path):
+    """Return `Catalog` at ``path`` or ``None`` if there isn't one.
+
+    Each catalog is opened once per process and stays open until
+    `close_catalogs()` is called.
+
+    """
+    cat = _catalogs.get(path)
+    if cat:
+        return cat
+
+    try:
+        cat = open_catalog(path)
+    except ValueError as err:
+        log.error('catalog is corrupt: %s', err)
+        return None
+
+    if cat:
+        _catalogs[path] = cat
+    return cat
+
+
+@atexit.register
+def close_catalogs(path=None):
+    """Close catalog at ``path`` or all catalogs opened by `load_catalog()`.
+
+    Called at exit and after a catalog is rebuilt, so the next call to
+    `load_catalog()` opens the new file.
+
+    """
+    paths = [path] if path else list(_catalogs)
+    for p in paths:
+        cat = _catalogs.pop(p, None)
+        if cat:
+            cat.close()
+
+
+def top_catalog():
+    """Return `Catalog` of top subreddits or ``None`` if there isn't one."""
+    return load_catalog(wf.cachefile(TOP_CATALOG))
+
+
+def catalogs():
+    """Return all available catalogs, top subreddits first."""
+    return [c for c in (top_catalog(),
+                        load_catalog(wf.datafile(IMPORTED_CATALOG))) if c]
+
+
+def has_imported_catalog():
+    """Whether user has imported a (complete) catalog of subreddits."""
+    return os.path.exists(wf.datafile(IMPORTED_CATALOG))
+
+
+def import_catalog(path):
+    """Import subreddits from dump at ``path`` into local catalog.
+
+    The dump is streamed, so it may be much larger than memory. See
+    `catalog.read_dump()` for supported formats. Gzipped dumps are
+    decompressed on the fly.
+
+    Args:
+        path (unicode): Path to dump file.
+
+    Returns:
+        int: Number of subreddits in catalog.
+
+    """
+    import gzip
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as fp:
+        n = build_catalog(wf.datafile(IMPORTED_CATALOG), read_dump(fp))
+
+    close_catalogs(wf.datafile(IMPORTED_CATALOG))
+    return n
+
+
+def top_catalog_fresh():
+    """Whether catalog of top subreddits was updated recently."""
+    age = time.time() - file_mtime(wf.cachefile(TOP_CATALOG))
+    # Catalogs written by older versions can't be opened
+    return age < TOP_CACHE_MAX_AGE and top_catalog() is not None
+
+
+def catalog_subreddits(query, nsfw=NSFW):
+    """Return subreddits in catalogs that may match ``query``.
+
+    Only the top subreddits and those whose names start with
+    ``query`` are read, not the whole catalogs.
+
+    Args:
+        query (unicode): Start of subreddit name.
+        nsfw (bool, optional): Include NSFW subreddits.
+
+    Returns:
+        list: `Subreddit` objects.
+
+    """
+    entries = []
+    top = top_catalog()
+    if top:
+        entries.extend(top.top(TOP_COUNT))
+
+    for cat in catalogs():
+        entries.extend(heapq.nlargest(SEARCH_CATALOG_LIMIT,
+                                      cat.prefixed(query, SEARCH_CATALOG_SCAN),
+                                      key=lambda e: e.subscribers))
+
+    seen = set()
+    subreddits = []
+    for e in entries:
+        if e.name in seen or e.type == 'private' or (e.nsfw and not nsfw):
+            continue
+        seen.add(e.name)
+        subreddits.append(Subreddit(*e))
+
+    return subreddits
+
+
+def catalog_subreddit(name):
+    """Return `Subreddit` for ``name`` from catalogs or ``None``."""
+    for cat in catalogs():
+        e = cat.find(name)
+        if e:
+            return Subreddit(*e)
+
+    return None
+
+
+def similar_subreddits(name, nsfw=NSFW):
+    """Return known subreddits whose names are similar to ``name``.
+
+    History and catalogs are searched for names within
+    `TYPO_MAX_DISTANCE` edits of ``name``.
+
+    Args:
+        name (unicode): Possibly misspelt name.
+        nsfw (bool, optional): Include NSFW subreddits.
+
+    Returns:
+        list: Up to `TYPO_SUGGESTIONS` `Subreddit` objects, closest
+            and most popular first.
+
+    """
+    max_distance = 1 if len(name) <= 4 else TYPO_MAX_DISTANCE
+    history = {sr.name: sr for sr in
+               cached_records('__history', Subreddit) or []}
+
+    matches = {}
+    for d, n in similar(name, list(history), max_distance):
+        matches[n.lower()] = (d, history[n])
+
+    for cat in catalogs():
+        for d, e in cat.similar(name, max_distance):
+            if e.type == 'private' or (e.nsfw and not nsfw):
+                continue
+            matches.setdefault(e.name.lower(), (d, Subreddit(*e)))
+
+    # Same name in different case
+    matches.pop(name.lower(), None)
+
+    matches = sorted(matches.values(),
+                     key=lambda t: (t[0], -t[1].subscribers))
+    return [sr for _, sr in matches[:TYPO_SUGGESTIONS]]
+
+
+def probably_misspelt(name):
+    """Whether ``name`` is probably not a real subreddit.
+
+    Only names that aren't in the user's history or an imported
+    (complete) catalog qualify.
+
+    """
+    if name.startswith('u/') or is_feed(name) or not has_imported_catalog():
+        return False
+
+    history = cached_records('__history', Subreddit) or []
+    if name.lower() in {sr.name.lower() for sr in history}:
+        return False
+
+    return catalog_subreddit(name) is None
+
+
+#  888888ba                      dP      oo                dP
+#  88    `8b                     88                        88
+# a88aaaa8P' .d8888b. .d8888b. d8888P    dP 88d888b. .d888b88 .d8888b. dP.  .dP
+#  88        88'  `88 Y8ooooo.   88      88 88'  `88 88'  `88 88ooood8  `8bd8'
+#  88        88.  .88       88   88      88 88    88 88.  .88 88.  ...  .d88b.
+#  dP        `88888P' `88888P'   dP      dP dP    dP `88888P8 `88888P' dP'  `dP
+
+def post_index():
+    """Return index of all cached posts."""
+    return PostIndex(wf.cachefile(POST_INDEX), POST_INDEX_MAX_AGE,
+                     RECORD_VERSION)
+
+
+def index_text(post):
+    """Text of ``post`` that is indexed."""
+    return '{} {} {}'.format(post.title, post.author, post.subreddit)
+
+
+def index_posts(posts):
+    """Add ``posts`` to index of all cached posts."""
+    with wf.span('index.add', posts=len(posts)) as sp:
+        n = post_index().add((p.permalink, index_text(p), p.pack())
+                             for p in posts)
+        sp.set(new=n)
+    log.debug('%d new post(s) in index', n)
+
+
+def indexed_posts(query):
+    """Search index of all cached posts for ``query``."""
+    with wf.span('index.search') as sp:
+        results = post_index().search(query, POST_INDEX_RESULTS)
+        sp.set(results=len(results))
+    return [Post(*record) for _, record in results]
+
+
+#  888888ba                 dP       dP oo   dP       .d888888   888888ba  dP
+#  88    `8b                88       88      88      d8'    88   88    `8b 88
+# a88aaaa8P' .d8888b. .d888b88 .d888b88 dP d8888P    88aaaaa88a a88aaaa8P' 88
+#  88   `8b. 88ooood8 88'  `88 88'  `88 88   88      88     88   88        88
+#  88     88 88.  ... 88.  .88 88.  .88 88   88      88     88   88        88
+#  dP     dP `88888P' `88888P8 `88888P8 dP   dP      88     88   dP        dP
+
+def parse_post(api_dict):
+    """Create `Post` from API dict."""
+    d = api_dict.get('data', {})
+    url = d['url']
+    if url == POST_URL.format(**d):  # self post
+        url = None
+
+    return Post(decode_html_entities(d['title']), d['permalink'], url,
+                d['author'], d.get('subreddit', ''), d.get('score', 0),
+                d['created_utc'], d.get('num_comments') or 0,
+                d.get('domain') or '',
+                decode_html_entities(d.get('link_flair_text') or ''),
+                bool(d.get('over_18')))
+
+
+def parse_subreddit(api_dict):
+    """Create `Subreddit` from API dict."""
+    d = api_dict.get('data', {})
+    return Subreddit(d['display_name'], decode_html_entities(d['title']),
+                     d['subreddit_type'], d.get('subscribers') or 0,
+                     bool(d.get('over18')))
+
+
+class RateLimited(Exception):
+    """Raised if Reddit's API rate limit has been reached.
+
+    Args:
+        wait (float): Seconds until the rate limit resets.
+
+    """
+
+    def __init__(self, wait):
+        """Create new `RateLimited`."""
+        super(RateLimited, self).__init__(
+            'Reddit rate limit reached. Try again in '
+            '{:d}s'.format(int(wait) + 1))
+        self.wait = wait
+
+
+def api_get(url, params=None):
+    """Make API request and record rate limit.
+
+    Args:
+        url (unicode): URL to fetch.
+        params (dict, optional): URL parameters.
+
+    Raises:
+        RateLimited: Raised if no requests remain in the current
+            rate-limit period.
+
+    Returns:
+        web.Response: API response.
+
+    """
+    wait = ratelimit_wait()
+    if wait:
+        wf.metrics.incr('ratelimit_refused_total')
+        raise RateLimited(wait)
+
+    headers = {'user-agent': USER_AGENT.format(version=wf.version,
+                                               url=wf.help_url)}
+
+    from workflow import web
+    r = web.get(url, params, headers=headers)
+    log.debug('[%d] %s', r.status_code, r.url)
+    record_ratelimit(r)
+    return r
+
+
+def record_ratelimit(r):
+    """Save rate-limit headers of API response ``r``."""
+    if r.error is not None:
+        headers = r.error.hdrs
+    else:
+        headers = r.headers
+
+    remaining = headers.get('x-ratelimit-remaining')
+    reset = headers.get('x-ratelimit-reset')
+
+    if r.status_code == 429:
+        remaining = 0
+        reset = headers.get('retry-after') or reset or 60
+
+    if remaining is None or reset is None:
+        return
+
+    try:
+        limit = {'remaining': float(remaining),
+                 'reset': time.time() + float(reset)}
+    except ValueError:
+        log.warning('invalid rate-limit headers: %r, %r', remaining, reset)
+        return
+
+    log.debug('rate limit: %d request(s) remaining for %ds',
+              limit['remaining'], float(reset))
+    wf.metrics.gauge('ratelimit_remaining', limit['remaining'])
+    wf.metrics.gauge('ratelimit_reset_seconds', float(reset))
+    wf.cache_data('__ratelimit', limit)
+
+
+def ratelimit_remaining():
+    """Number of API requests left in current rate-limit period.
+
+    Returns:
+        float: Remaining requests or ``None`` if unknown.
+
+    """
+    limit = wf.cached_data('__ratelimit', max_age=0)
+    if not limit or time.time() >= limit['reset']:
+        return None
+
+    return limit['remaining']
+
+
+def ratelimit_wait():
+    """Seconds until API requests are allowed again (0 if allowed)."""
+    limit = wf.cached_data('__ratelimit', max_age=0)
+    if not limit or limit['remaining'] >= 1:
+        return 0
+
+    return max(limit['reset'] - time.time(), 0)
+
+
+def rate_limited():
+    """Whether optional API requests should be skipped."""
+    remaining = ratelimit_remaining()
+    return remaining is not None and remaining < RATELIMIT_RESERVE
+
+
+def is_missing(name):
+    """Whether subreddit ``name`` is known not to exist."""
+    return wf.cached_data_fresh('--missing-' + cache_key(name),
+                                MISSING_CACHE_MAX_AGE)
+
+
+def mark_missing(name):
+    """Remember that subreddit ``name`` doesn't exist."""
+    wf.cache_data('--missing-' + cache_key(name), time.time())
+
+
+def popular_subreddits(limit=SUBREDDIT_COUNT, after=None):
+    """Return list of popular subreddits."""
+    log.debug('Fetching list of popular subreddits ...')
+
+    params = {'limit': limit}
+    if after:
+        params['after'] = after
+
+    r = api_get(POPULAR_URL, params)
+    r.raise_for_status()
+
+    data = r.json()['data']
+    after = data['after']
+    subreddits = data['children']
+
+    subreddits = [parse_subreddit(d) for d in subreddits]
+    subreddits = [sr for sr in subreddits if sr.type != 'private']
+
+    return subreddits, after
+
+
+def search_subreddits(query, limit=SUBREDDIT_COUNT, nsfw=NSFW):
+    """Return list of subreddits matching ``query``."""
+    log.debug('Searching for subreddits matching %r ...', query)
+
+    nsfw = 1 if NSFW else 0
+    params = {'limit': limit, 'q': query, 'include_over_18': nsfw}
+
+    r = api_get(SEARCH_URL, params)
+    r.raise_for_status()
+
+    subreddits = r.json()['data']['children']
+
+    subreddits = [parse_subreddit(d) for d in subreddits]
+    # Only show public subreddits
+    subreddits = [sr for sr in subreddits if sr.type == 'public']
+
+    for sr in subreddits:
+        log.debug('%s', sr)
+
+    return subreddits
+
+
+def hot_posts(name, limit=POST_COUNT, after=None):
+    """Return page of hot posts on specified subreddit.
+
+    Args:
+        name (unicode): Name of subreddit, multi or combined feed.
+        limit (int, optional): Number of posts to fetch.
+        after (unicode, optional): Listing cursor returned with the
+            previous page.
+
+    Returns:
+        tuple: ``(posts, after)``. ``after`` is the cursor of the next
+            page or ``None``. ``posts`` is ``None`` if ``name`` isn't
+            a subreddit.
+
+    """
+    log.debug('Fetching hot posts in r/%s ...', name)
+    params = {'limit': limit}
+    if after:
+        params['after'] = after
+
+    r = api_get(hot_url(name), params)
+
+    # API redirects to subreddit search instead of returning a 404 :(
+    if r.status_code == 404 or r.url.startswith(SEARCH_URL):
+        msg = 'Not a subreddit : `{}`'.format(name)
+        log.error(msg)
+        mark_missing(name)
+        return None, None
+
+    r.raise_for_status()
+
+    data = r.json()['data']
+    posts = [parse_post(d) for d in data['children']]
+
+    return posts, data.get('after')
+
+
+def search_posts(name, query, limit=POST_COUNT):
+    """Search for posts in subreddit ``name`` using the API.
+
+    Args:
+        name (unicode): Name of subreddit or combined feed.
+        query (unicode): Search query.
+        limit (int, optional): Max. number of results.
+
+    Returns:
+        list: Posts matching ``query`` or ``None`` if ``name`` isn't
+            a subreddit.
+
+    """
+    log.debug('Searching r/%s for %r ...', name, query)
+    if is_feed(name):
+        name = '+'.join(feed_subreddits(name))
+
+    params = {'q': query, 'restrict_sr': 1, 'limit': limit}
+    r = api_get(POST_SEARCH_URL.format(name=name), params)
+
+    if r.status_code == 404 or r.url.startswith(SEARCH_URL):
+        log.error('Not a subreddit : `%s`', name)
+        mark_missing(name)
+        return None
+
+    r.raise_for_status()
+
+    return [parse_post(d) for d in r.json()['data']['children']]
+
+
+def post_search_cache_key(name, query):
+    """Cache key for results of searching ``name`` for ``query``."""
+    key = cache_key(query)
+    if len(key) > 64:  # Keep filenames short
+        key = '{}-{:x}'.format(key[:55], zlib.crc32(key) & 0xffffffff)
+
+    return '--postsearch-{}--{}'.format(cache_key(name), key)
+
+
+def searched_posts(name, query):
+    """Return posts in ``name`` found by API search for ``query``.
+
+    If there are no cached results for ``query``, a search is started
+    in the background. Meanwhile, cached results for the longest
+    prefix of ``query`` are used instead.
+
+    Args:
+        name (unicode): Name of subreddit or combined feed.
+        query (unicode): User query.
+
+    Returns:
+        list: Posts that match ``query`` locally, too.
+
+    """
+    query = normalise_query(query)
+    if len(query) < SEARCH_FALLBACK_MIN_LENGTH:
+        return []
+
+    posts = cached_records(post_search_cache_key(name, query), Post,
+                           POST_SEARCH_CACHE_MAX_AGE)
+
+    if posts is None:
+        if not is_running('postsearch') and not rate_limited():
+            run_in_background('postsearch',
+                              [sys.executable, 'reddit.py',
+                               '--search-posts', name.encode('utf-8'),
+                               query.encode('utf-8')])
+
+        for i in range(len(query) - 1, SEARCH_FALLBACK_MIN_LENGTH - 1, -1):
+            posts = cached_records(post_search_cache_key(name, query[:i]),
+                                   Post, POST_SEARCH_CACHE_MAX_AGE)
+            if posts:
+                log.debug('using search results for %r', query[:i])
+                break
+
+    if not posts:
+        return []
+
+    return wf.filter(query, posts, key=post_search_key, min_score=30,
+                     match_on=POST_MATCH)
+
+
+def feed_posts(name):
+    """Return hot posts from all subreddits in combined feed ``name``.
+
+    Small feeds are fetched with one combined listing. Larger ones
+    are split into chunks (see `feed_chunks()`) that are fetched
+    concurrently and merged into one stream ordered by `FEED_SORT`.
+
+    Args:
+        name (unicode): Combined feed, e.g. ``a+b+c`` or `HISTORY_FEED`.
+
+    Returns:
+        tuple: ``(posts, after)`` as for `hot_posts()`. Chunked feeds
+            can't be paged, so ``after`` is always ``None`` for them.
+
+    """
+    names = feed_subreddits(name)
+    if not names:
+        return [], None
+
+    if len(names) <= FEED_CHUNK_SIZE:
+        return hot_posts('+'.join(names))
+
+    chunks = ['+'.join(chunk) for chunk in feed_chunks(names)]
+    log.debug('%d subreddit(s) in %d chunk(s)', len(names), len(chunks))
+
+    results = {}
+    stale = []
+    stores = {}
+    for chunk in chunks:
+        key = posts_key(chunk)
+        store = stores[chunk] = load_store(key)
+        if store is not None and not store_expired(key, store):
+            results[chunk] = store['posts']
+        else:
+            stale.append(chunk)
+
+    pages = {}
+
+    def fetch(chunk):
+        try:
+            pages[chunk] = hot_posts(chunk)
+        except Exception as err:
+            log.error('error fetching chunk %r: %s', chunk, err)
+
+    threads = [Thread(target=fetch, args=(chunk,)) for chunk in stale]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # Cache new chunks or fall back to expired data
+    for chunk in stale:
+        key = posts_key(chunk)
+        posts, after = pages.get(chunk, (None, None))
+        if posts is not None:
+            store = make_store(posts, after, stores[chunk])
+            log.info('[%s] cache TTL: %ds', chunk, store['ttl'])
+            save_store(key, store)
+        else:
+            posts = (stores[chunk] or {}).get('posts')
+
+        results[chunk] = posts
+
+    return merge_posts([results[c] or [] for c in chunks]), None
+
+
+def posts_key(name):
+    """Cache key for posts in subreddit ``name``."""
+    return '--subreddit-' + cache_key(name)
+
+
+def make_store(posts, after=None, previous=None):
+    """Create cached post store from first page of posts.
+
+    Args:
+        posts (list): Posts as returned by `hot_posts()`.
+        after (unicode, optional): Cursor of the next page of posts.
+        previous (dict, optional): Previous store for the same
+            subreddit. Used to calculate how long to cache posts.
+
+    Returns:
+        dict: Post store. ``extended`` is the time the last additional
+            page was appended or 0, ``fetched`` the time ``posts``
+            were fetched, ``ids`` the IDs of ``posts`` and ``ttl``
+            how long the store should be cached.
+
+    """
+    store = {
+        'posts': posts,
+        'after': after,
+        'extended': 0,
+        'fetched': time.time(),
+        'ids': [p.permalink for p in posts],
+    }
+    store['ttl'] = adaptive_ttl(store, previous)
+    return store
+
+
+def load_store(key):
+    """Load cached post store ``key``.
+
+    Args:
+        key (unicode): Cache key, see `posts_key()`.
+
+    Returns:
+        dict: Post store (see `make_store()`) or ``None``.
+
+    """
+    store = wf.cached_data(key, max_age=0)
+    if store is None:
+        return None
+
+    if isinstance(store, list):  # Cached by an older version
+        store = {'posts': store, 'after': None, 'extended': 0}
+
+    with wf.span('store.unpack', key=key):
+        store['posts'] = unpack_records(store['posts'], Post)
+    if store['posts'] is None:  # Unknown format
+        return None
+
+    return store
+
+
+def save_store(key, store):
+    """Cache post ``store`` under ``key``."""
+    data = dict(store)
+    data['posts'] = pack_records(store['posts'])
+    wf.cache_data(key, data)
+    index_posts(store['posts'])
+
+
+def append_posts(posts, older):
+    """Append posts in ``older`` that aren't in ``posts``.
+
+    Posts are compared by permalink, and the result is truncated to
+    `POST_STORE_MAX` posts.
+
+    """
+    seen = {p.permalink for p in posts}
+    older = [p for p in older if p.permalink not in seen]
+    return (posts + older)[:POST_STORE_MAX]
+
+
+def store_age(key, store):
+    """Seconds since posts in ``store`` cached under ``key`` were fetched."""
+    if store.get('fetched'):
+        return time.time() - store['fetched']
+
+    return wf.cached_data_age(key)
+
+
+def store_expired(key, store):
+    """Whether post ``store`` cached under ``key`` needs refreshing."""
+    if store_age(key, store) >= store.get('ttl', POSTS_CACHE_MAX_AGE):
+        wf.metrics.cache_lookup(key, 'expired')
+        return True
+
+    return False
+
+
+def listing_churn(old_ids, new_ids):
+    """Fraction of a listing that changed between two fetches.
+
+    New posts count fully, posts that moved more than two places
+    count half.
+
+    Args:
+        old_ids (list): Post IDs from earlier fetch.
+        new_ids (list): Post IDs from later fetch.
+
+    Returns:
+        float: Number between 0 (unchanged) and 1.
+
+    """
+    if not new_ids:
+        return 0.0
+
+    old_rank = {id_: i for i, id_ in enumerate(old_ids)}
+    changed = 0.0
+    for i, id_ in enumerate(new_ids):
+        j = old_rank.get(id_)
+        if j is None:
+            changed += 1
+        elif abs(i - j) > 2:
+            changed += 0.5
+
+    return changed / len(new_ids)
+
+
+def adaptive_ttl(store, previous=None):
+    """Calculate how long to cache post ``store``.
+
+    Combines two estimates:
+
+    1. Posting rate. The median time between posts in the listing,
+       multiplied by `POSTS_TTL_NEW_POSTS`.
+    2. Churn. How much the listing changed since ``previous`` was
+       fetched, extrapolated to the time it takes for
+       `POSTS_TTL_CHURN` of the listing to change.
+
+    Args:
+        store (dict): New post store.
+        previous (dict, optional): Previous store for same subreddit.
+
+    Returns:
+        int: Cache lifetime between `POSTS_TTL_MIN` and `POSTS_TTL_MAX`.
+
+    """
+    estimates = []
+
+    times = sorted([p.timestamp for p in store['posts']], reverse=True)
+    if len(times) > 1:
+        gaps = sorted([a - b for a, b in zip(times, times[1:])])
+        estimates.append(gaps[len(gaps) // 2] * POSTS_TTL_NEW_POSTS)
+
+    if previous and previous.get('fetched') and previous.get('ids'):
+        elapsed = store['fetched'] - previous['fetched']
+        # After a long gap, the listing has changed completely and
+        # the churn tells us nothing
+        if 0 < elapsed <= POSTS_TTL_MAX * 2:
+            churn = listing_churn(previous['ids'], store['ids'])
+            if churn:
+                estimates.append(elapsed * POSTS_TTL_CHURN / churn)
+            else:
+                estimates.append(elapsed * 2)
+
+    if not estimates:
+        return POSTS_CACHE_MAX_AGE
+
+    # Geometric mean
+    ttl = math.exp(sum([math.log(max(e, 1)) for e in estimates]) /
+                   len(estimates))
+    return int(min(max(ttl, POSTS_TTL_MIN), POSTS_TTL_MAX))
+
+
+def refresh_store(name, store=None):
+    """Fetch first page of posts and merge it into ``store``.
+
+    Posts from additional pages in the cached store are kept if they
+    are younger than `POST_STORE_MAX_AGE`. The store is re-read and
+    saved under a lock, so pages added by a background ``--more``
+    process in the meantime aren't lost.
+
+    Args:
+        name (unicode): Name of subreddit, multi or combined feed.
+        store (dict, optional): Expired post store.
+
+    Returns:
+        dict: Updated post store or ``None`` if ``name`` doesn't exist.
+
+    """
+    with wf.span('store.refresh', subreddit=name):
+        if is_feed(name):
+            posts, after = feed_posts(name)
+        else:
+            posts, after = hot_posts(name)
+
+    if posts is None:
+        return None
+
+    key = posts_key(name)
+    with LockFile(wf.cachefile(key)):
+        current = load_store(key) or store
+        new = make_store(posts, after, current)
+        log.info('[%s] cache TTL: %ds', name, new['ttl'])
+        if (current and current['extended'] and
+                time.time() - current['extended'] < POST_STORE_MAX_AGE):
+            new['posts'] = append_posts(posts, current['posts'])
+            new['after'] = current['after']
+            new['extended'] = current['extended']
+
+        save_store(key, new)
+
+    return new
+
+
+def extend_store(name):
+    """Append next page of posts to cached posts for ``name``.
+
+    Args:
+        name (unicode): Name of subreddit, multi or combined feed.
+
+    Returns:
+        dict: Updated post store or ``None`` if there are no cached
+            posts for ``name``.
+
+    """
+    key = posts_key(name)
+    store = load_store(key)
+    if not store:
+        return None
+
+    if not store['after'] or len(store['posts']) >= POST_STORE_MAX:
+        log.debug('no more posts to fetch for %r', name)
+        return store
+
+    cursor = store['after']
+    posts, after = hot_posts(name, after=cursor)
+    if posts is None:
+        return store
+
+    # The store may have been refreshed or extended while the page
+    # was being fetched
+    with LockFile(wf.cachefile(key)):
+        store = load_store(key) or store
+        count = len(store['posts'])
+        store['posts'] = append_posts(store['posts'], posts)
+        if store['after'] == cursor:
+            store['after'] = after
+        store['extended'] = time.time()
+        save_store(key, store)
+
+    log.debug('added %d post(s) to %r, %d in total',
+              len(store['posts']) - count, name, len(store['posts']))
+    return store
+
+
+def reopen_alfred(name, query=None):
+    """Show posts in subreddit ``name`` in Alfred."""
+    from workflow.util import applescriptify, run_applescript
+    text = 'r/{}/{}'.format(name, query or '')
+    run_applescript('tell application "Alfred 3" to search "{}"'.format(
+                    applescriptify(text)))
+
+
+def feed_subreddits(name):
+    """Return names of subreddits in combined feed ``name``."""
+    if name == HISTORY_FEED:
+        history = cached_records('__history', Subreddit) or []
+        # Skip multis and other feeds
+        names = [sr.name for sr in history
+                 if not sr.name.startswith('u/') and '+' not in sr.name]
+    else:
+        names = name.split('+')
+
+    seen = set()
+    unique = []
+    for n in names:
+        if n and n.lower() not in seen:
+            seen.add(n.lower())
+            unique.append(n)
+
+    return unique
+
+
+def feed_chunks(names):
+    """Split subreddit ``names`` into chunks for combined listings.
+
+    Chunk boundaries are determined by a hash of the names (like
+    content-defined chunking), not by position, so adding or removing
+    a subreddit only changes the chunk it falls into. The other
+    chunks, and their caches, stay the same.
+
+    Args:
+        names (list): Subreddit names.
+
+    Returns:
+        list: Lists of at most `FEED_CHUNK_SIZE` names.
+
+    """
+    divisor = max(FEED_CHUNK_SIZE // 2, 1)
+    chunks = []
+    chunk = []
+    for name in sorted(names, key=lambda s: s.lower()):
+        chunk.append(name)
+        h = zlib.crc32(name.lower().encode('utf-8')) & 0xffffffff
+        if h % divisor == 0 or len(chunk) == FEED_CHUNK_SIZE:
+            chunks.append(chunk)
+            chunk = []
+
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
+
+
+def hotness(post):
+    """Reddit's "hot" rank of ``post``."""
+    score = post.score
+    order = math.log10(max(abs(score), 1))
+    sign = 1 if score > 0 else -1 if score < 0 else 0
+    return sign * order + (post.timestamp - 1134028003) / 45000.0
+
+
+def merge_posts(streams):
+    """Merge lists of posts into one list ordered by `FEED_SORT`.
+
+    Args:
+        streams (list): Lists of posts, e.g. from different chunks
+            of a combined feed.
 
-# How many subreddits to retrieve
-SUBREDDIT_COUNT = 25
+    Returns:
+        list: Posts from all ``streams``, best first.
 
-# How long to cache searches for subreddits for
-SEARCH_CACHE_MAX_AGE = 3600  # 1 hour
+    """
+    if FEED_SORT == 'new':
+        rank = lambda p: p.timestamp  # noqa: E731
+    else:
+        rank = hotness
 
-# How long to cache lists of posts for
-POSTS_CACHE_MAX_AGE = 180  # 3 minutes
+    # k-way merge of individually-sorted streams
+    decorated = []
+    for i, posts in enumerate(streams):
+        d = [(-rank(p), i, j, p) for j, p in enumerate(posts)]
+        d.sort()
+        decorated.append(d)
 
-# How long to cache list of top subreddits
-TOP_CACHE_MAX_AGE = 86400  # 1 day
+    return [t[3] for t in heapq.merge(*decorated)]
 
-# How many top reddits to cache
-TOP_COUNT = 500
 
-# Include NSFW subreddits
-NSFW = os.getenv('NSFW', '0').lower() in ('1', 'true', 'yes', 'on')
+def post_search_key(post):
+    """Search key for post."""
+    return '{} {}'.format(post.title, post.author)
 
-# GitHub update settings
-UPDATE_SETTINGS = {'github_slug': 'deanishe/alfred-reddit'}
 
-HELP_URL = 'https://github.com/deanishe/alfred-reddit'
+def parse_age(value):
+    """Parse age like ``90m`` or ``2d`` to seconds or return ``None``."""
+    m = re.match(r'(\d+(?:\.\d+)?)([smhdw]?)$', value)
+    if not m:
+        return None
 
+    return float(m.group(1)) * AGE_UNITS[m.group(2) or 'h']
 
-ICON_REDDIT = 'icon.png'
-ICON_UPDATE = 'update-available.png'
 
-# JSON list of hot posts in subreddit
-HOT_POSTS_URL = 'https://www.reddit.com/r/{name}/hot.json'
-# HOT_POSTS_URL = 'https://www.reddit.com/{name}/hot.json'
+def parse_bool(value):
+    """Parse ``yes``, ``no`` etc. or return ``None``."""
+    if value in ('1', 'y', 'yes', 'true', 'on'):
+        return True
+    if value in ('0', 'n', 'no', 'false', 'off'):
+        return False
+    return None
 
-# JSON list of hot posts in user multi
-USER_MULTI_HOT_URL = 'https://www.reddit.com/{name}.json'
 
-# JSON subreddit search
-SEARCH_URL = 'https://www.reddit.com/subreddits/search.json'
+def post_filter(field, op, value):
+    """Build predicate for post filter ``<field><op><value>``.
 
-# JSON list of popular subreddits
-POPULAR_URL = 'https://www.reddit.com/subreddits/popular.json'
+    Args:
+        field (unicode): Lowercase name of filter, e.g. ``score``.
+        op (unicode): Comparison, one of `POST_FILTER_OPS`.
+        value (unicode): Lowercase value to compare to.
 
-# HTML URL of subreddit
-SUBREDDIT_URL = 'https://www.reddit.com/r/{name}/'
+    Returns:
+        callable: Function that takes a `Post` and returns ``True`` if
+            it matches, or ``None`` if ``value`` is invalid (e.g. the
+            user is still typing it).
 
-# HTML URL of user multi
-USER_MULTI_URL = 'https://www.reddit.com/{name}/'
+    """
+    compare = POST_FILTER_OPS[op]
+
+    if field == 'age':
+        seconds = parse_age(value)
+        if seconds is None:
+            return None
+        now = time.time()
+        return lambda p: compare(now - p.timestamp, seconds)
+
+    if field in ('score', 'comments'):
+        if not re.match(r'-?\d+$', value):
+            return None
+        n = int(value)
+        return lambda p: compare(getattr(p, field), n)
+
+    if op != ':' or not value:
+        return None
 
-# HTML URL of post
-POST_URL = 'https://www.reddit.com{permalink}'
+    if field in ('self', 'nsfw'):
+        flag = parse_bool(value)
+        if flag is None:
+            return None
+        if field == 'self':
+            return lambda p: p.selfpost == flag
+        return lambda p: p.nsfw == flag
 
-USER_AGENT = 'Alfred-Reddit/{version} ({url})'
+    if field == 'author':
+        return lambda p: p.author.lower() == value
 
-# Populated on run
-log = None
+    if field == 'domain':  # also match subdomains
+        return lambda p: (p.domain.lower() == value or
+                          p.domain.lower().endswith('.' + value))
 
+    if field == 'flair':
+        return lambda p: value in p.flair.lower()
 
-# dP     dP           dP
-# 88     88           88
-# 88aaaaa88a .d8888b. 88 88d888b. .d8888b. 88d888b. .d8888b.
-# 88     88  88ooood8 88 88'  `88 88ooood8 88'  `88 Y8ooooo.
-# 88     88  88.  ... 88 88.  .88 88.  ... 88             88
-# dP     dP  `88888P' dP 88Y888P' `88888P' dP       `88888P'
-#                        88
-#                        dP
+    return None
 
-def open_url(url):
-    """Open URL in default browser."""
-    log.debug('Opening : %s', url)
-    subprocess.call(['open', url])
 
+def parse_post_query(query):
+    """Split structured filters and sort order from post ``query``.
 
-def cache_key(name):
-    """Make filesystem-friendly cache key."""
-    key = name.lower()
-    key = re.sub(r'[^a-z0-9-_\.]', '-', key)
-    key = re.sub(r'-+', '-', key)
-    log.debug('Cache key : %r -> %r', name, key)
-    return key
+    E.g. ``score>500 age<6h asyncio`` filters for posts with a score
+    over 500, younger than 6 hours, that match "asyncio".
 
+    Args:
+        query (unicode): Query entered after ``r/<name>/``.
 
-def relative_time(timestamp):
-    """Return human-readable, relative time."""
-    now = datetime.utcnow()
-    postdate = datetime.utcfromtimestamp(timestamp)
-    delta = now - postdate
-    seconds = delta.seconds
-    days, rem = divmod(seconds, 86400)
-    hours, rem = divmod(rem, 3600)
-    minutes, seconds = divmod(rem, 60)
-    # log.debug('Post is {!r} old'.format(delta))
-    if days:
-        return '{} day{} ago'.format(days, 's'[days == 1:])
-    if hours:
-        return '{} hr{} ago'.format(hours, 's'[hours == 1:])
-    if minutes:
-        return '{} min{} ago'.format(minutes, 's'[minutes == 1:])
-    if seconds:
-        return '{} sec{} ago'.format(seconds, 's'[seconds == 1:])
-    else:
-        return '1 sec ago'
+    Returns:
+        tuple: ``(filters, sort, text)``. ``filters`` is a list of
+            predicates (see `post_filter()`), ``sort`` a key function
+            from `POST_SORTS` or ``None`` and ``text`` the rest of
+            ``query``, to be matched against titles and authors.
 
+    """
+    filters = []
+    sort = None
+    words = []
+    for word in (query or '').split():
+        m = POST_FILTER.match(word)
+        if not m:
+            words.append(word)
+            continue
 
-def decode_html_entities(s):
-    """Decode HTML entities into Unicode."""
-    h = HTMLParser()
-    return h.unescape(s)
+        field, op, value = [s.lower() for s in m.groups()]
+        if field == 'sort':
+            sort = POST_SORTS.get(value, sort)
+            continue
 
+        f = post_filter(field, op, value)
+        if f:
+            filters.append(f)
 
-def subreddit_from_env():
-    """Return subreddit based on env vars."""
-    sr = dict(
-        name=os.getenv('subreddit_name'),
-        title=os.getenv('subreddit_title'),
-        type=os.getenv('subreddit_type'),
-        url=os.getenv('subreddit_url')
-    )
-    if None in sr.values():
-        return None
+    return filters, sort, ' '.join(words)
 
-    log.debug('subreddit from env=%r', sr)
-    return sr
 
+def subreddit_search_key(sr):
+    """Search key for subreddit."""
+    return sr.name
+    # return '{} {}'.format(sr.name, sr.title)
 
-#  888888ba                 dP       dP oo   dP       .d888888   888888ba  dP
-#  88    `8b                88       88      88      d8'    88   88    `8b 88
-# a88aaaa8P' .d8888b. .d888b88 .d888b88 dP d8888P    88aaaaa88a a88aaaa8P' 88
-#  88   `8b. 88ooood8 88'  `88 88'  `88 88   88      88     88   88        88
-#  88     88 88.  ... 88.  .88 88.  .88 88   88      88     88   88        88
-#  dP     dP `88888P' `88888P8 `88888P8 dP   dP      88     88   dP        dP
 
-def parse_post(api_dict):
-    """Strip down API dict."""
-    d = api_dict.get('data', {})
-    post = {
-        'title': decode_html_entities(d['title']),
-        'post_url': d['url'],
-        'author': d['author'],
-        'timestamp': d['created_utc'],
-        'reltime': relative_time(d['created_utc']),
-        'comments_url': POST_URL.format(**d)
-    }
-    post['selfpost'] = post['post_url'] == post['comments_url']
-    return post
+def subreddit_url(name):
+    """Make URL for subreddit."""
+    if name.startswith('u/'):  # user multi
+        return USER_MULTI_URL.format(name=name)
+    return SUBREDDIT_URL.format(name=name)
 
 
-def parse_subreddit(api_dict):
-    """Strip down API dict."""
-    d = api_dict.get('data', {})
-    return {
-        'name': d['display_name'],
-        'title': decode_html_entities(d['title']),
-        'type': d['subreddit_type'],
-        'url': subreddit_url(d['display_name']),
-    }
+def hot_url(name):
+    """Make URL for hot posts.
 
+    ``name`` may be a subreddit, a user multi (``u/<user>/m/<multi>``)
+    or a combined feed (``a+b+c`` or `HISTORY_FEED`).
 
-def popular_subreddits(limit=SUBREDDIT_COUNT, after=None):
-    """Return list of popular subreddits."""
-    log.debug('Fetching list of popular subreddits ...')
+    """
+    if name.startswith('u/'):  # user multi
+        return USER_MULTI_HOT_URL.format(name=name)
+    if '+' in name:  # combined feed
+        name = '+'.join(feed_subreddits(name))
+    return HOT_POSTS_URL.format(name=name)
 
-    headers = {'user-agent': USER_AGENT.format(version=wf.version,
-                                               url=wf.help_url)}
 
-    params = {'limit': limit}
-    if after:
-        params['after'] = after
+def is_feed(name):
+    """Whether ``name`` is a combined feed of several subreddits."""
+    return '+' in name
 
-    r = web.get(POPULAR_URL, params, headers=headers)
 
-    log.debug('[%d] %s', r.status_code, r.url)
+#  888888ba                          dP                   oo
+#  88    `8b                         88
+# a88aaaa8P' .d8888b. 88d888b. .d888b88 .d8888b. 88d888b. dP 88d888b. .d8888b.
+#  88   `8b. 88ooood8 88'  `88 88'  `88 88ooood8 88'  `88 88 88'  `88 88'  `88
+#  88     88 88.  ... 88    88 88.  .88 88.  ... 88       88 88    88 88.  .88
+#  dP     dP `88888P' dP    dP `88888P8 `88888P' dP       dP dP    dP `8888P88
+#                                                                          .88
+#                                                                      d8888P
 
-    r.raise_for_status()
+def subreddit_item(sr):
+    """Build Alfred item for subreddit in the list of top subreddits."""
+    url = sr.url
+    it = Item3(sr.name,
+               sr.title,
+               autocomplete='{}/'.format(sr.name),
+               quicklookurl=url,
+               icon=ICON_REDDIT)
 
-    data = r.json()['data']
-    after = data['after']
-    subreddits = data['children']
+    it.setvar('subreddit_url', url)
+    it.add_modifier('cmd',
+                    'View "r/{}" in browser'.format(sr.name),
+                    valid=True).setvar('argv', '-s')
+    it.add_modifier('alt',
+                    'Make post in "r/{}" in browser'.format(sr.name),
+                    valid=True).setvar('argv', '-b')
+    return it
 
-    subreddits = [parse_subreddit(d) for d in subreddits]
-    subreddits = [d for d in subreddits if d['type'] != 'private']
 
-    return subreddits, after
+def post_subtitle(post, feed=False):
+    """Subtitle of Alfred item for post.
 
+    Not part of cached items (see `rendered_posts()`) because it
+    contains the post's age.
 
-def search_subreddits(query, limit=SUBREDDIT_COUNT, nsfw=NSFW):
-    """Return list of subreddits matching ``query``."""
-    log.debug('Searching for subreddits matching %r ...', query)
-    headers = {
-        'user-agent': USER_AGENT.format(version=wf.version,
-                                        url=wf.help_url)
-    }
+    """
+    author = post.author
+    if feed and post.subreddit:
+        author = '{} in r/{}'.format(author, post.subreddit)
 
-    nsfw = 1 if NSFW else 0
-    params = {'limit': limit, 'q': query, 'include_over_18': nsfw}
+    return 'Posted {} by {} // {}'.format(post.reltime, author, post.post_url)
 
-    r = web.get(SEARCH_URL, params, headers=headers)
-    log.debug('[%d] %s', r.status_code, r.url)
 
-    r.raise_for_status()
+def post_item(post, qlpost=False, feed=False):
+    """Build Alfred item for post.
 
-    subreddits = r.json()['data']['children']
+    Args:
+        post (Post): Post to show.
+        qlpost (bool, optional): Quick Look post instead of comments.
+        feed (bool, optional): Post is part of a combined feed, so
+            show its subreddit.
 
-    subreddits = [parse_subreddit(d) for d in subreddits]
-    # Only show public subreddits
-    subreddits = [d for d in subreddits if d['type'] == 'public']
+    Returns:
+        Item3: Alfred item for post.
 
-    for sr in subreddits:
-        log.debug(sr)
+    """
+    if qlpost:
+        qlurl = post.post_url
+    else:
+        qlurl = post.comments_url
+
+    it = Item3(post.title,
+               post_subtitle(post, feed),
+               arg=post.post_url,
+               largetext=post.title,
+               valid=True,
+               quicklookurl=qlurl,
+               icon=ICON_REDDIT)
+
+    it.setvar('post_url', post.post_url)
+    it.setvar('comments_url', post.comments_url)
+    it.setvar('argv', '-p')
+
+    csub = 'View comments on Reddit'
+    cargv = '-c'
+    asub = 'View both article and comments in browser'
+    aargv = '-c -p'
+
+    if post.selfpost:
+        csub = asub = '[Self post] View on Reddit'
+        aargv = '-c'
+
+    it.add_modifier('cmd', csub, valid=True).setvar('argv', cargv)
+    it.add_modifier('alt', asub, valid=True).setvar('argv', aargv)
+    return it
+
+
+def top_subreddits():
+    """Return history followed by top subreddits."""
+    subreddits = cached_records('__history', Subreddit) or []
+    cat = top_catalog()
+    top = [Subreddit(*e) for e in cat.top(TOP_SHOW_COUNT)] if cat else []
+    seen = {sr.name for sr in subreddits}
+    for sr in top:
+        if sr.name not in seen:
+            subreddits.append(sr)
 
-    return subreddits
+    return subreddits[:TOP_SHOW_COUNT]
 
 
-def hot_posts(name, limit=POST_COUNT):
-    """Return list of hot posts on specified subreddit."""
-    log.debug('Fetching hot posts in r/%s ...', name)
-    url = hot_url(name)
-    headers = {'user-agent': USER_AGENT.format(version=wf.version,
-                                               url=wf.help_url)}
-    params = {'limit': limit}
+def render_top():
+    """Render and cache Alfred items for empty query.
 
-    log.debug('url : %s', url)
-    r = web.get(url, params, headers=headers)
-    log.debug('[%d] %s', r.status_code, r.url)
+    Called whenever `TOP_CATALOG` or `__history` changes, so that the
+    empty-query view only has to print cached JSON.
 
-    # API redirects to subreddit search instead of returning a 404 :(
-    if r.status_code == 404 or r.url.startswith(SEARCH_URL):
-        msg = 'Not a subreddit : `{}`'.format(name)
-        log.error(msg)
-        return None
+    Returns:
+        list: JSON fragments of items.
 
-    r.raise_for_status()
+    """
+    fragments = [subreddit_item(sr).json for sr in top_subreddits()]
 
-    data = r.json()
-    posts = [parse_post(d) for d in data['data']['children']]
+    # Combined feed of subreddits in history
+    names = feed_subreddits(HISTORY_FEED)
+    if len(names) > 1:
+        it = Item3('History Feed',
+                   'Hot posts from the {} subreddits in your '
+                   'history'.format(len(names)),
+                   autocomplete='{}/'.format(HISTORY_FEED),
+                   icon=ICON_REDDIT)
+        fragments.insert(0, it.json)
 
-    return posts
+    wf.cache_data('--rendered-top', fragments)
+    log.debug('rendered %d top subreddit(s)', len(fragments))
+    return fragments
 
 
-def post_search_key(post):
-    """Search key for post."""
-    return '{} {}'.format(post['title'], post['author'])
+def rendered_top():
+    """Return cached items for empty query, rendering them if stale."""
+    mtime = cache_mtime('--rendered-top')
+    if mtime and mtime >= max(cache_mtime('__history'),
+                              file_mtime(wf.cachefile(TOP_CATALOG))):
+        return wf.cached_data('--rendered-top', max_age=0)
 
+    return render_top()
 
-def subreddit_search_key(sr):
-    """Search key for subreddit."""
-    return sr['name']
-    # return '{} {}'.format(sr['name'], sr['title'])
 
+def rendered_posts(key, posts, qlpost=False, feed=False):
+    """Return Alfred items for ``posts``, rendering them if stale.
 
-def subreddit_url(name):
-    """Make URL for subreddit."""
-    if name.startswith('u/'):  # user multi
-        return USER_MULTI_URL.format(name=name)
-    return SUBREDDIT_URL.format(name=name)
+    Items are cached without their subtitles, which contain the age
+    of the post and are added each time the items are shown.
 
+    Args:
+        key (unicode): Cache key of ``posts``.
+        posts (list): Posts as returned by `hot_posts()`.
+        qlpost (bool, optional): Quick Look post instead of comments.
+        feed (bool, optional): Posts are from a combined feed.
 
-def hot_url(name):
-    """Make URL for hot posts."""
-    if name.startswith('u/'):  # user multi
-        return USER_MULTI_HOT_URL.format(name=name)
-    return HOT_POSTS_URL.format(name=name)
+    Returns:
+        list: JSON fragments of items, in same order as ``posts``.
+
+    """
+    def render(post):
+        obj = post_item(post, qlpost, feed).obj
+        del obj['subtitle']
+        return json.dumps(obj)
+
+    rkey = '--partial{}{}'.format('-ql' if qlpost else '', key)
+    fragments = None
+    mtime = cache_mtime(rkey)
+    if mtime and mtime >= cache_mtime(key):
+        fragments = wf.cached_data(rkey, max_age=0)
+        if fragments and len(fragments) != len(posts):
+            fragments = None
+
+    if not fragments:
+        with wf.span('posts.render', posts=len(posts)):
+            fragments = [render(post) for post in posts]
+        wf.cache_data(rkey, fragments)
+        log.debug('rendered %d post(s) for %s', len(fragments), key)
+
+    # Fragments are JSON objects: insert subtitle before closing brace
+    return ['{}, "subtitle": {}}}'.format(f[:-1],
+                                           json.dumps(post_subtitle(p, feed)))
+            for p, f in zip(posts, fragments)]
 
 
 # dP   dP   dP                   dP       .8888b dP
@@ -346,17 +1827,35 @@ def update_top_subreddits():
         res, after = popular_subreddits(100, after)
         subreddits.extend(res)
 
-    wf.cache_data('__top', subreddits)
+    n = build_catalog(wf.cachefile(TOP_CATALOG),
+                      [sr.pack() for sr in subreddits])
+    close_catalogs(wf.cachefile(TOP_CATALOG))
+    log.debug('%d subreddit(s) in catalog', n)
+    render_top()
+
+
+def in_history(name, subreddits):
+    """Whether subreddit ``name`` is in list ``subreddits``."""
+    name = name.lower()
+    return any(sr.name.lower() == name for sr in subreddits)
 
 
 def remember_subreddit(name=None):
     """Add current subreddit to history."""
+    if name == HISTORY_FEED:
+        return
+
+    # Most of the time, the subreddit is already in history. Check
+    # without locking or looking it up in the catalog.
+    if name and in_history(name, cached_records('__history', Subreddit) or []):
+        log.debug('%r already in history', name)
+        return
+
     if name:
-        last = wf.cached_data('--last', max_age=0, session=True) or {}
-        sr = last.get(name)
+        last = cached_records('--last', Subreddit, session=True) or []
+        sr = {sr.name: sr for sr in last}.get(name) or catalog_subreddit(name)
         if not sr:  # must be a multi
-            sr = dict(name=name, title=name, type="public",
-                      url=subreddit_url(name))
+            sr = Subreddit(name, name)
     else:
         sr = subreddit_from_env()
 
@@ -364,16 +1863,19 @@ def remember_subreddit(name=None):
         log.debug('no subreddit to save to history')
         return
 
-    subreddits = wf.cached_data('__history', max_age=0) or []
-    log.debug('%d subreddit(s) in history', len(subreddits))
-    for d in subreddits:
-        if sr['name'].lower() == d['name'].lower():
-            log.debug('%r already in history', sr['name'])
+    # Other processes may be adding subreddits, too
+    with LockFile(wf.cachefile('__history')):
+        subreddits = cached_records('__history', Subreddit) or []
+        log.debug('%d subreddit(s) in history', len(subreddits))
+        if in_history(sr.name, subreddits):
+            log.debug('%r already in history', sr.name)
             return
 
-    subreddits.append(sr)
-    wf.cache_data('__history', subreddits)
-    log.debug('added %r to history', sr['name'])
+        subreddits.append(sr)
+        cache_records('__history', subreddits)
+
+    render_top()
+    log.debug('added %r to history', sr.name)
     log.debug('%d subreddit(s) in history', len(subreddits))
 
 
@@ -390,6 +1892,8 @@ def parse_query(query):
     # r/blah -> Search for subreddit matching `blah`
     # r/blah/ -> List hot posts in r/blah
     # r/blah/wut -> Filter hot posts in r/blah by `wut`
+    # r/a+b+c/ -> List hot posts in r/a, r/b and r/c
+    # r/+history/ -> List hot posts in all subreddits in history
     m = re.match(r'(u/\w+/m/[^/]+)(/)(.+)?', query)  # user multi
     if not m:
         m = re.match(r'([^/]+)(/)?(.+)?', query)  # normal subreddit
@@ -399,37 +1903,18 @@ def parse_query(query):
 
     name, slash, query = m.groups()
 
+    # Tidy combined feed, e.g. "a++b+" -> "a+b"
+    if is_feed(name) and name != HISTORY_FEED:
+        name = '+'.join([s for s in name.split('+') if s]) or None
+
     log.debug('name : %r slash : %r  query : %r', name, slash, query)
     return name, slash, query
 
 
 def show_top():
     """List history and top subreddits."""
-    subreddits = wf.cached_data('__history', max_age=0) or []
-    top = wf.cached_data('__top', max_age=0) or []
-    seen = {sr['name'] for sr in subreddits}
-    for sr in top:
-        if sr['name'] not in seen:
-            subreddits.append(sr)
-
-    if len(subreddits) > 200:
-        subreddits = subreddits[:200]
-
-    for sr in subreddits:
-        url = sr['url']
-        it = wf.add_item(sr['name'],
-                         sr['title'],
-                         autocomplete='{}/'.format(sr['name']),
-                         quicklookurl=url,
-                         icon=ICON_REDDIT)
-
-        it.setvar('subreddit_url', url)
-        it.add_modifier('cmd',
-                        'View "r/{}" in browser'.format(sr['name']),
-                        valid=True).setvar('argv', '-s')
-        it.add_modifier('alt',
-                        'Make post in "r/{}" in browser'.format(sr['name']),
-                        valid=True).setvar('argv', '-b')
+    for fragment in rendered_top():
+        wf.add_rendered_item(fragment)
 
     if is_running('top'):
         wf.rerun = 0.2
@@ -439,20 +1924,34 @@ def show_top():
 
 
 def show_search(name, nsfw=NSFW):
-    """List subreddits matching `name`."""
-    nsfw = 'nsfw-' if nsfw else ''
-    top = wf.cached_data('__top', max_age=0) or []
-    history = wf.cached_data('__history', max_age=0) or []
-    key = '--search-{}{}'.format(nsfw, cache_key(name))
+    """List subreddits matching `name`.
+
+    Subreddits in history and the local catalogs are searched first.
+    If the user has imported a complete catalog, the API is only
+    searched for names that don't match anything locally.
+
+    """
+    with wf.span('catalog.search') as sp:
+        top = catalog_subreddits(name, nsfw)
+        sp.set(results=len(top))
+    history = cached_records('__history', Subreddit) or []
+    key = '--search-{}{}'.format('nsfw-' if nsfw else '', cache_key(name))
+
+    def search_key(sr):
+        return sr.name
+
+    local = has_imported_catalog() and wf.filter(name, history + top,
+                                                 key=search_key,
+                                                 min_score=30, max_results=1)
 
     # Load cached results for name or start search in background
-    cached = wf.cached_data(key, None, SEARCH_CACHE_MAX_AGE) or []
-    if not cached and not is_running('search'):
-        run_in_background('search', ['/usr/bin/python', 'reddit.py',
+    cached = cached_records(key, Subreddit, SEARCH_CACHE_MAX_AGE) or []
+    if not cached and not local and not is_running('search'):
+        run_in_background('search', [sys.executable, 'reddit.py',
                           '--search', name.encode('utf-8')])
         wf.rerun = 0.3
 
-    log.debug('loaded subreddits: %d history, %d top, %d cached',
+    log.debug('loaded subreddits: %d history, %d catalog, %d cached',
               len(history), len(top), len(cached))
 
     if is_running('search'):
@@ -460,17 +1959,27 @@ def show_search(name, nsfw=NSFW):
 
     subreddits = history
     other = top + cached
-    seen = {sr['name'] for sr in history}
+    seen = {sr.name for sr in history}
     for sr in other:
-        if sr['name'] in seen:
+        if sr.name in seen:
             continue
         subreddits.append(sr)
-        seen.add(sr['name'])
+        seen.add(sr.name)
 
     # Filter results because Reddit's search is super-crappy
-    subreddits = wf.filter(name, subreddits,
-                           key=lambda sr: sr['name'],
-                           min_score=30)
+    results = wf.filter(name, subreddits, key=search_key,
+                        include_score=True, min_score=30)
+
+    # Exact match first, then by type of match and popularity
+    query = name.lower()
+    results.sort(key=lambda t: (t[0].name.lower() != query, t[2],
+                                -t[0].subscribers, -t[1]))
+    subreddits = [t[0] for t in results]
+
+    # Nothing matches: maybe a typo
+    if not subreddits:
+        with wf.span('catalog.similar'):
+            subreddits = similar_subreddits(name, nsfw)
 
     if not subreddits:
         if is_running('search'):
@@ -484,57 +1993,121 @@ def show_search(name, nsfw=NSFW):
         return
 
     # Cache all subreddits in case we need to "remember" one
-    results = {sr['name']: sr for sr in subreddits}
-    wf.cache_data('--last', results, session=True)
+    cache_records('--last', subreddits, session=True)
 
     # List all matching subreddits
 
     for sr in subreddits:
 
-        log.debug(repr(sr))
+        log.debug('%r', sr)
 
-        url = sr['url']
-        it = wf.add_item(sr['name'],
-                         sr['title'],
-                         autocomplete='{}/'.format(sr['name']),
+        url = sr.url
+        it = wf.add_item(sr.name,
+                         sr.title,
+                         autocomplete='{}/'.format(sr.name),
                          arg=url,
-                         uid=sr['name'],
+                         uid=sr.name,
                          quicklookurl=url,
                          valid=True,
                          icon=ICON_REDDIT)
 
         # Export subreddit to ENV in case we want to save it
-        it.setvar('subreddit_name', sr['name'])
-        it.setvar('subreddit_title', sr['title'])
-        it.setvar('subreddit_type', sr['type'])
+        it.setvar('subreddit_name', sr.name)
+        it.setvar('subreddit_title', sr.title)
+        it.setvar('subreddit_type', sr.type)
         it.setvar('subreddit_url', url)
         it.setvar('argv', '-s')
         it.add_modifier('alt',
-                        'Make post in "r/{}" in browser'.format(sr['name']),
+                        'Make post in "r/{}" in browser'.format(sr.name),
                         valid=True).setvar('argv', '-b')
 
     wf.send_feedback()
     return
 
 
+def show_indexed(query):
+    """Search posts in all cached subreddits for `query`."""
+    # Whether Quick Look shows post or comments
+    qlpost = os.getenv('QUICKLOOK_POST') == "1"
+
+    if not query:
+        wf.add_item('Search all cached posts',
+                    'Posts from subreddits viewed in the last {} days'.format(
+                        POST_INDEX_MAX_AGE // 86400),
+                    icon=ICON_REDDIT)
+        wf.send_feedback()
+        return 0
+
+    posts = indexed_posts(query)
+    if not posts:
+        wf.add_item('No matching posts found',
+                    'Try a different query',
+                    icon=ICON_WARNING)
+
+    for post in posts:
+        wf.add_rendered_item(post_item(post, qlpost, feed=True).json)
+
+    wf.send_feedback()
+
+    log.debug('%d indexed post(s) match %r', len(posts), query)
+
+
+def add_suggestions(suggestions, query=None):
+    """Add "Did you mean …?" items for `Subreddit` ``suggestions``."""
+    for sr in suggestions:
+        wf.add_item('Did you mean r/{}?'.format(sr.name),
+                    sr.title,
+                    autocomplete='{}/{}'.format(sr.name, query or ''),
+                    icon=ICON_REDDIT)
+
+
 def show_posts(name, query):
     """List posts within subreddit `name`."""
     # Whether Quick Look shows post or comments
     qlpost = os.getenv('QUICKLOOK_POST') == "1"
 
     # Filesystem-friendly key
-    key = '--subreddit-' + cache_key(name)
+    key = posts_key(name)
 
     log.debug('Viewing r/%s ...', name)
 
-    posts = wf.cached_data(key,
-                           partial(hot_posts, name),
-                           max_age=POSTS_CACHE_MAX_AGE)
-
-    if posts is None:  # Non-existent subreddit
+    store = None
+    if not is_missing(name):
+        store = load_store(key)
+
+        # Suggest similar names instead of asking the API
+        if store is None and probably_misspelt(name):
+            suggestions = similar_subreddits(name)
+            if suggestions:
+                add_suggestions(suggestions, query)
+                wf.send_feedback()
+                return 0
+
+        if store is None or store_expired(key, store):
+            try:
+                store = refresh_store(name, store)
+            except RateLimited as err:
+                log.warning('[%s] %s', name, err)
+                resets = time.strftime('%H:%M:%S',
+                                       time.localtime(time.time() + err.wait))
+                if store is None:
+                    wf.add_item('Reddit rate limit reached',
+                                'Try again at {}'.format(resets),
+                                icon=ICON_WARNING)
+                    wf.send_feedback()
+                    return 0
+
+                # Show cached posts, however old
+                wf.add_item('Reddit rate limit reached',
+                            'Showing cached posts. Limit resets at '
+                            '{}'.format(resets),
+                            icon=ICON_WARNING)
+
+    if store is None:  # Non-existent subreddit
         wf.add_item('r/{} does not exist'.format(name),
                     'Try a different name',
                     icon=ICON_WARNING)
+        add_suggestions(similar_subreddits(name), query)
 
         wf.send_feedback()
         return 0
@@ -542,63 +2115,95 @@ def show_posts(name, query):
     # Add to history
     remember_subreddit(name)
 
-    if query:
-        posts = wf.filter(query, posts, key=post_search_key, min_score=30)
+    posts = store['posts']
+    filters, sort, text = parse_post_query(query)
+
+    # Pair posts with their pre-rendered items
+    entries = zip(posts, rendered_posts(key, posts, qlpost, is_feed(name)))
+
+    # Cheap structured filters first, so fewer posts are fuzzy-matched
+    if filters:
+        with wf.span('posts.filters', filters=len(filters)) as sp:
+            entries = [t for t in entries if all([f(t[0]) for f in filters])]
+            sp.set(results=len(entries))
+
+    if text:
+        entries = wf.filter(text, entries,
+                            key=lambda t: post_search_key(t[0]),
+                            min_score=30, match_on=POST_MATCH)
+
+    if sort:
+        entries.sort(key=lambda t: sort(t[0]))
+
+    more = store['after'] and len(posts) < POST_STORE_MAX
+
+    # Few matches: look for more in the next page in the background
+    if (more and query and len(entries) < DEEP_FETCH_MIN_MATCHES and
+            len(posts) < DEEP_FETCH_MAX_POSTS and not is_running('more') and
+            not rate_limited()):
+        run_in_background('more', [sys.executable, 'reddit.py',
+                                   '--more', name.encode('utf-8')])
+
+    # Too few matches: add results of searching subreddit via API
+    found = []
+    searchable = not name.startswith('u/') and (
+        not is_feed(name) or len(feed_subreddits(name)) <= FEED_CHUNK_SIZE)
+
+    if text and searchable and len(entries) < SEARCH_FALLBACK_MIN_MATCHES:
+        seen = {post.permalink for post, _ in entries}
+        with wf.span('posts.api-search') as sp:
+            found = [post for post in searched_posts(name, text)
+                     if post.permalink not in seen and
+                     all([f(post) for f in filters])]
+            sp.set(results=len(found))
+        log.debug('%d more post(s) from API search', len(found))
+
+    loading = is_running('more') or is_running('postsearch')
+
+    if not entries and not found:
+        if loading:
+            wf.add_item('Loading more posts …', 'Hang in there')
+        else:
+            wf.add_item('No matching results found',
+                        'Try a different subreddit and/or query',
+                        icon=ICON_WARNING)
 
-    if not posts:
-        wf.add_item('No matching results found',
-                    'Try a different subreddit and/or query',
-                    icon=ICON_WARNING)
+    for _, fragment in entries:
+        wf.add_rendered_item(fragment)
 
-    for post in posts:
-        subtitle = 'Posted {} by {} // {}'.format(post['reltime'],
-                                                  post['author'],
-                                                  post['post_url'])
+    for post in found:
+        wf.add_rendered_item(post_item(post, qlpost, is_feed(name)).json)
 
-        if qlpost:
-            qlurl = post['post_url']
-        else:
-            qlurl = post['comments_url']
+    if loading:
+        wf.rerun = 0.5
 
-        it = wf.add_item(post['title'],
-                         subtitle,
-                         arg=post['post_url'],
-                         largetext=post['title'],
+    elif more:
+        it = wf.add_item('Load more…',
+                         '{} posts loaded. ↩ to fetch the next {}'.format(
+                             len(posts), POST_COUNT),
                          valid=True,
-                         quicklookurl=qlurl,
                          icon=ICON_REDDIT)
-
-        it.setvar('post_url', post['post_url'])
-        it.setvar('comments_url', post['comments_url'])
-        it.setvar('argv', '-p')
-
-        csub = 'View comments on Reddit'
-        cargv = '-c'
-        asub = 'View both article and comments in browser'
-        aargv = '-c -p'
-
-        if post['selfpost']:
-            csub = asub = '[Self post] View on Reddit'
-            aargv = '-c'
-
-        it.add_modifier('cmd', csub, valid=True).setvar('argv', cargv)
-        it.add_modifier('alt', asub, valid=True).setvar('argv', aargv)
+        it.setvar('argv', '--more {} --reopen'.format(name))
+        it.setvar('posts_query', query or '')
 
     wf.send_feedback()
 
-    log.debug('%d hot posts in subreddit `%s`', len(posts), name)
+    log.debug('%d hot posts in subreddit `%s`', len(entries), name)
 
 
 def main(wf):
     """Run workflow."""
     from docopt import docopt
-    args = docopt(__doc__, wf.args)
+    args = docopt(__doc__, wf.args, cachedir=wf.cachedir)
 
     log.debug('args : %r', args)
 
     # Run Script actions
     # ------------------------------------------------------------------
 
+    # Label for run-time metrics
+    wf.metrics.command = 'action'
+
     if args.get('--post'):
         open_url(os.getenv('post_url'))
         return
@@ -620,8 +2225,40 @@ def main(wf):
     # Background tasks
     ####################################################################
 
+    # Append next page to cached posts
+    if args.get('--more'):
+        wf.metrics.command = 'job:more'
+        name = wf.decode(args.get('--more'))
+        log.info('fetching more posts in r/%s ...', name)
+        extend_store(name)
+        if args.get('--reopen'):
+            reopen_alfred(name, wf.decode(os.getenv('posts_query') or ''))
+        return
+
+    # Search subreddit for posts using API and cache results
+    if args.get('--search-posts'):
+        wf.metrics.command = 'job:search-posts'
+        name = wf.decode(args.get('--search-posts'))
+        query = wf.decode(args.get('<query>'))
+        log.info('searching r/%s for %r ...', name, query)
+        posts = search_posts(name, query)
+        if posts is not None:
+            cache_records(post_search_cache_key(name, query), posts)
+            log.info('API returned %d post(s) for %r', len(posts), query)
+        return
+
+    # Import dump of subreddits into local catalog
+    if args.get('--import-catalog'):
+        wf.metrics.command = 'job:import-catalog'
+        path = wf.decode(args.get('--import-catalog'))
+        log.info('importing subreddits from %r ...', path)
+        n = import_catalog(path)
+        log.info('%d subreddit(s) in catalog', n)
+        return
+
     # Update cached list of top subreddits
     if args.get('--update'):
+        wf.metrics.command = 'job:update'
         log.info('updating list of top subreddits ...')
         update_top_subreddits()
         log.info('updated list of top subreddits.')
@@ -629,12 +2266,13 @@ def main(wf):
 
     # Search using API and cache results
     if args.get('--search'):
+        wf.metrics.command = 'job:search'
         name = wf.decode(args.get('--search'))
         nsfw = 'nsfw-' if NSFW else ''
         key = '--search-{}{}'.format(nsfw, cache_key(name))
         log.info('searching API for %r ...', name)
         subreddits = search_subreddits(name)
-        wf.cache_data(key, subreddits)
+        cache_records(key, subreddits)
         log.info('API returned %d subreddit(s) for %r', len(subreddits), name)
         # Tidy up cache in a background task to keep things snappy
         clear_cache()
@@ -642,13 +2280,15 @@ def main(wf):
 
     # Update cached list of top subreddits
     if not is_running('top') and \
-            not wf.cached_data_fresh('__top', TOP_CACHE_MAX_AGE):
-        run_in_background('top', ['/usr/bin/python', 'reddit.py', '--update'])
+            not top_catalog_fresh():
+        run_in_background('top', [sys.executable, 'reddit.py', '--update'])
 
     ####################################################################
     # Script Filter
     ####################################################################
 
+    wf.metrics.command = 'filter'
+
     # Workflow updates
     # ------------------------------------------------------------------
     if wf.update_available:
@@ -663,6 +2303,7 @@ def main(wf):
     log.debug('query=%r', query)
 
     if query == '':
+        wf.metrics.command = 'top'
         return show_top()
 
     # Show subreddit or posts
@@ -676,13 +2317,21 @@ def main(wf):
         wf.send_feedback()
         return 0
 
+    # Search posts in all cached subreddits
+    # ------------------------------------------------------------------
+    if name == SEARCH_ALL:
+        wf.metrics.command = 'index'
+        return show_indexed(query)
+
     # Search for matching subreddit
     # ------------------------------------------------------------------
     if not slash:
+        wf.metrics.command = 'search'
         return show_search(name)
 
     # Browse/search within subreddit
     # ------------------------------------------------------------------
+    wf.metrics.command = 'posts'
     return show_posts(name, query)
 
 
@@ -52,6 +52,7 @@ from .workflow import (
     MATCH_ALLCHARS,
     MATCH_ATOM,
     MATCH_CAPITALS,
+    MATCH_FUZZY,
     MATCH_INITIALS,
     MATCH_INITIALS_CONTAIN,
     MATCH_INITIALS_STARTSWITH,
@@ -100,6 +101,7 @@ __all__ = [
     'MATCH_ALLCHARS',
     'MATCH_ATOM',
     'MATCH_CAPITALS',
+    'MATCH_FUZZY',
     'MATCH_INITIALS',
     'MATCH_INITIALS_CONTAIN',
     'MATCH_INITIALS_STARTSWITH',
@@ -19,11 +19,10 @@ and examples.
 
 from __future__ import print_function, unicode_literals
 
+import logging
 import signal
 import sys
 import os
-import subprocess
-import pickle
 
 from workflow import Workflow
 
@@ -137,6 +136,11 @@ def _background(pidfile, stdin='/dev/null', stdout='/dev/null',
     :type stderr: filepath
 
     """
+    # Write buffered log messages while they can still reach the
+    # caller's stderr
+    for handler in logging.getLogger().handlers:
+        handler.flush()
+
     def _fork_and_exit_parent(errmsg, wait=False, write=False):
         try:
             pid = os.fork()
@@ -227,13 +231,16 @@ def run_in_background(name, args, **kwargs):
 
     argcache = _arg_cache(name)
 
+    import pickle
+    import subprocess
+
     # Cache arguments
     with open(argcache, 'wb') as fp:
         pickle.dump({'args': args, 'kwargs': kwargs}, fp)
         _log().debug('[%s] command cached: %s', name, argcache)
 
     # Call this script
-    cmd = ['/usr/bin/python', __file__, name]
+    cmd = [sys.executable, __file__, name]
     _log().debug('[%s] passing job to background runner: %r', name, cmd)
     retcode = subprocess.call(cmd)
 
@@ -252,8 +259,13 @@ def main(wf):  # pragma: no cover
     :meth:`subprocess.call` with cached arguments.
 
     """
+    import pickle
+    import subprocess
+
     log = wf.logger
     name = wf.args[0]
+    # Time whole job, including start-up of command
+    wf.metrics.command = 'background:' + name
     argcache = _arg_cache(name)
     if not os.path.exists(argcache):
         msg = '[{0}] command cache not found: {1}'.format(name, argcache)
@@ -290,4 +302,6 @@ def main(wf):  # pragma: no cover
 
 
 if __name__ == '__main__':  # pragma: no cover
+    # Only the command is worth profiling, not the runner waiting for it
+    wf().allow_profiling = False
     wf().run(main)
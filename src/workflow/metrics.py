@@ -0,0 +1,683 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright (c) 2026 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2026-10-19
+#
+
+"""Operational metrics that persist across runs.
+
+.. versionadded:: 1.37
+
+Each run collects counters, latency histograms and gauges in memory,
+and :meth:`Workflow.run() <workflow.Workflow.run>` appends them as a
+line of JSON to ``metrics.log`` in the workflow's cache directory
+when it finishes. That's one small write, so runs don't pay for
+keeping the metrics. The log is merged into the store,
+``metrics.json``, by :func:`aggregate` when ``workflow:stats`` is
+used, when the Prometheus textfile is written, and when the log grows
+larger than :const:`COMPACT_SIZE`. Appends and merges lock the log
+with :func:`fcntl.flock`, so concurrent runs and background jobs don't
+lose each other's data.
+
+The library records:
+
+``run_duration_ms{command}``
+    Histogram of how long :meth:`Workflow.run()` took. ``command`` is
+    :attr:`Metrics.command`, which the workflow should set to what the
+    run does (default ``main``).
+
+``cache_lookups_total{family,result}``
+    :meth:`Workflow.cached_data()` calls. ``result`` is ``hit``,
+    ``miss`` (no cache) or ``stale`` (cache too old). ``family`` is
+    the first word of the cache key, e.g. ``subreddit`` for
+    ``--subreddit-python``.
+
+``http_requests_total{endpoint,status}``
+    Requests made with :mod:`workflow.web`. ``endpoint`` is the host
+    and path with the variable middle of the path replaced by ``*``,
+    e.g. ``www.reddit.com/r/*/hot.json``. ``status`` is ``error`` if
+    the server couldn't be reached.
+
+``http_duration_ms{endpoint}``
+    Histogram of how long servers took to respond.
+
+``http_response_bytes_total{endpoint}``
+    Bytes received (before decompression).
+
+Workflows add their own with :meth:`Metrics.incr`,
+:meth:`Metrics.observe` and :meth:`Metrics.gauge`::
+
+    wf.metrics.incr('retries_total', endpoint='search')
+    wf.metrics.gauge('ratelimit_remaining', 42)
+
+Histograms are HDR-style: values are counted in buckets whose width
+grows with the value (four per doubling, i.e. about 19% wide), so they
+are small, precise enough for percentiles and can be merged by adding
+up the buckets.
+
+Counters and histograms are kept both as running totals and per day.
+``workflow:stats`` shows the last :const:`DAYS` days, and days older
+than that are dropped. Gauges keep the latest value.
+
+Set ``WF_METRICS`` to ``0`` to turn metrics off. Set
+``WF_METRICS_TEXTFILE`` to a path (ending in ``.prom``) to also write
+the running totals in Prometheus' text format after each run, e.g. for
+node_exporter's textfile collector.
+
+"""
+
+from __future__ import print_function, unicode_literals
+
+from contextlib import contextmanager
+import fcntl
+import json
+import math
+import os
+import re
+import time
+
+from util import LockFile, atomic_writer
+
+#: Variable that turns metrics off if set to ``0``
+ENV_VAR = 'WF_METRICS'
+
+#: Variable with path of Prometheus textfile to write
+TEXTFILE_VAR = 'WF_METRICS_TEXTFILE'
+
+#: Name of metrics store in cache directory
+FILENAME = 'metrics.json'
+
+#: Name of log of runs' metrics in cache directory
+LOGNAME = 'metrics.log'
+
+#: Size of log (in bytes) at which runs merge it into the store
+COMPACT_SIZE = 256 * 1024
+
+#: Number of days of per-day metrics to keep
+DAYS = 7
+
+#: Histogram buckets per doubling of value
+SUB_BUCKETS = 4
+
+#: Prefix of exported metric names
+PREFIX = 'alfred_workflow_'
+
+# Active `Metrics`
+_metrics = None
+
+# Parses "name{a="1",b="2"}"
+_series_rx = re.compile(r'^([^{]+)(?:\{(.*)\})?$')
+_label_rx = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+# Session prefix of Workflow3 cache keys
+_session_rx = re.compile(r'^_wfsess-[0-9a-f]+-')
+_family_rx = re.compile(r'[-_]*([^-_.]+)')
+
+
+def series(name, labels=None):
+    """Return key of time series ``name`` with ``labels``.
+
+    Args:
+        name (str): Metric name.
+        labels (dict, optional): Label names and values.
+
+    Returns:
+        unicode: Series key in Prometheus format, e.g.
+            ``http_requests_total{endpoint="x",status="200"}``.
+
+    """
+    if not labels:
+        return name
+
+    pairs = []
+    for k in sorted(labels):
+        v = '{}'.format(labels[k])
+        v = v.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+        pairs.append('{}="{}"'.format(k, v))
+
+    return '{}{{{}}}'.format(name, ','.join(pairs))
+
+
+def parse_series(key):
+    """Split series key into name and labels.
+
+    Args:
+        key (unicode): Series key as returned by `series()`.
+
+    Returns:
+        tuple: ``(name, labels)``
+
+    """
+    name, labels = _series_rx.match(key).groups()
+    labels = dict((k, re.sub(r'\\(.)', lambda m: {'n': '\n'}.get(
+                   m.group(1), m.group(1)), v))
+                  for k, v in _label_rx.findall(labels or ''))
+    return name, labels
+
+
+def key_family(key):
+    """Family of cache key ``key``, e.g. ``subreddit`` for
+    ``--subreddit-python``.
+    """
+    m = _family_rx.match(_session_rx.sub('', key))
+    return m.group(1) if m else key
+
+
+def endpoint(url):
+    """Endpoint of ``url``: host and path with variable parts
+    replaced by ``*``, e.g. ``www.reddit.com/r/*/hot.json``.
+    """
+    import urlparse
+    parts = urlparse.urlsplit(url)
+    segments = [s for s in parts.path.split('/') if s]
+    if len(segments) > 2:
+        segments = [segments[0], '*', segments[-1]]
+
+    return parts.netloc + '/' + '/'.join(segments)
+
+
+# Histograms are dicts: n = number of values, sum = total of values,
+# max = largest value, b = {bucket index (str): count}
+
+def _bucket(value):
+    """Index of histogram bucket for ``value``."""
+    return int(math.floor(math.log(max(value, 0.001), 2) * SUB_BUCKETS))
+
+
+def bucket_bound(index):
+    """Upper bound of histogram bucket ``index``."""
+    return 2 ** ((int(index) + 1) / float(SUB_BUCKETS))
+
+
+def new_histogram():
+    """Return empty histogram."""
+    return {'n': 0, 'sum': 0, 'max': 0, 'b': {}}
+
+
+def merge_histogram(h, other):
+    """Add values of histogram ``other`` to histogram ``h``."""
+    h['n'] += other['n']
+    h['sum'] += other['sum']
+    h['max'] = max(h['max'], other['max'])
+    for i, n in other['b'].items():
+        h['b'][i] = h['b'].get(i, 0) + n
+
+
+def percentile(h, p):
+    """Return ``p``-th percentile of histogram ``h``.
+
+    The result is the upper bound of the bucket the percentile falls
+    in (but no more than the largest value), so it may be up to one
+    bucket width too high.
+
+    Args:
+        h (dict): Histogram.
+        p (float): Percentile between 0 and 100.
+
+    Returns:
+        float: Value or ``None`` if histogram is empty.
+
+    """
+    if not h['n']:
+        return None
+
+    rank = max(int(math.ceil(p / 100.0 * h['n'])), 1)
+    seen = 0
+    for i in sorted(h['b'], key=int):
+        seen += h['b'][i]
+        if seen >= rank:
+            return min(bucket_bound(i), h['max'])
+
+    return h['max']  # pragma: no cover
+
+
+class Metrics(object):
+    """Metrics collected during one run.
+
+    Attributes:
+        command (str): Name of what the run does. Used as label
+            ``command`` of ``run_duration_ms``.
+        counters (dict): Series key: value.
+        enabled (bool): Whether metrics are recorded.
+        gauges (dict): Series key: ``[value, timestamp]``.
+        histograms (dict): Series key: histogram.
+
+    """
+
+    def __init__(self, enabled=True):
+        """Create new `Metrics`."""
+        self.enabled = enabled
+        self.command = 'main'
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def __nonzero__(self):
+        """Whether anything has been recorded."""
+        return bool(self.counters or self.histograms or self.gauges)
+
+    def incr(self, name, value=1, **labels):
+        """Add ``value`` to counter ``name``.
+
+        Args:
+            name (str): Name of counter. Should end in ``_total``.
+            value (int, optional): Amount to add.
+            **labels: Labels of counter.
+
+        """
+        if self.enabled:
+            key = series(name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Add ``value`` to histogram ``name``.
+
+        Args:
+            name (str): Name of histogram, e.g. ``search_duration_ms``.
+            value (float): Value to add.
+            **labels: Labels of histogram.
+
+        """
+        if not self.enabled:
+            return
+
+        key = series(name, labels)
+        h = self.histograms.get(key)
+        if h is None:
+            h = self.histograms[key] = new_histogram()
+
+        i = str(_bucket(value))
+        h['n'] += 1
+        h['sum'] += value
+        h['max'] = max(h['max'], value)
+        h['b'][i] = h['b'].get(i, 0) + 1
+
+    def gauge(self, name, value, **labels):
+        """Set gauge ``name`` to ``value``.
+
+        Args:
+            name (str): Name of gauge.
+            value (float): Current value.
+            **labels: Labels of gauge.
+
+        """
+        if self.enabled:
+            self.gauges[series(name, labels)] = [value,
+                                                 round(time.time(), 3)]
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Context manager that adds its duration (in milliseconds)
+        to histogram ``name``.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.time() - start) * 1000, **labels)
+
+    def cache_lookup(self, key, result):
+        """Count a lookup of cache ``key`` with ``result``.
+
+        Args:
+            key (unicode): Cache key.
+            result (str): ``hit``, ``miss``, ``stale`` etc.
+
+        """
+        if self.enabled:
+            self.incr('cache_lookups_total', family=key_family(key),
+                      result=result)
+
+    def save(self, path):
+        """Append metrics to log ``path`` and reset them.
+
+        Args:
+            path (unicode): Path of metrics log.
+
+        Returns:
+            int: Size of log in bytes.
+
+        """
+        line = json.dumps({'t': round(time.time(), 3), 'c': self.counters,
+                           'h': self.histograms, 'g': self.gauges},
+                          separators=(',', ':'), sort_keys=True)
+        with open(path, 'ab') as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            fp.write(line.encode('utf-8') + b'\n')
+            fp.flush()
+            size = fp.tell()
+
+        self.counters, self.histograms, self.gauges = {}, {}, {}
+        return size
+
+
+def _read_log(data):
+    """Generate ``(timestamp, Metrics)`` from log contents ``data``."""
+    for line in data.splitlines():
+        try:
+            d = json.loads(line)
+            m = Metrics()
+            m.counters, m.histograms, m.gauges = d['c'], d['h'], d['g']
+            yield d['t'], m
+        except (ValueError, KeyError, TypeError):  # torn line
+            continue
+
+
+def aggregate(path, logpath):
+    """Merge the metrics in log ``logpath`` into store ``path``.
+
+    The log is emptied.
+
+    Args:
+        path (unicode): Path of metrics store.
+        logpath (unicode): Path of metrics log.
+
+    Returns:
+        dict: Updated store.
+
+    """
+    with LockFile(path):
+        store = load(path)
+        if not os.path.exists(logpath):
+            return store
+
+        with open(logpath, 'r+b') as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            for ts, m in _read_log(fp.read()):
+                merge(store, m, ts)
+            with atomic_writer(path, 'wb') as out:
+                json.dump(store, out, separators=(',', ':'), sort_keys=True)
+            fp.truncate(0)
+
+    return store
+
+
+def _empty_section():
+    return {'counters': {}, 'histograms': {}}
+
+
+def new_store():
+    """Return empty metrics store."""
+    return {'version': 1, 'since': round(time.time(), 3), 'updated': None,
+            'total': _empty_section(), 'days': {}, 'gauges': {}}
+
+
+def load(path):
+    """Load metrics store ``path``.
+
+    Returns:
+        dict: Store. Empty if ``path`` doesn't exist or is invalid.
+
+    """
+    try:
+        with open(path, 'rb') as fp:
+            store = json.load(fp)
+    except (IOError, ValueError):
+        return new_store()
+
+    if not isinstance(store, dict) or store.get('version') != 1:
+        return new_store()
+
+    return store
+
+
+def _merge_section(section, metrics):
+    counters = section['counters']
+    for key, value in metrics.counters.items():
+        counters[key] = counters.get(key, 0) + value
+
+    histograms = section['histograms']
+    for key, h in metrics.histograms.items():
+        if key not in histograms:
+            histograms[key] = new_histogram()
+        merge_histogram(histograms[key], h)
+
+
+def merge(store, metrics, now=None):
+    """Add ``metrics`` to ``store`` and drop old days.
+
+    Args:
+        store (dict): Metrics store.
+        metrics (Metrics): Metrics of a run.
+        now (float, optional): Time of run. Default is now.
+
+    """
+    now = now or time.time()
+    today = time.strftime('%Y-%m-%d', time.localtime(now))
+    if today not in store['days']:
+        store['days'][today] = _empty_section()
+
+    _merge_section(store['total'], metrics)
+    _merge_section(store['days'][today], metrics)
+
+    gauges = store['gauges']
+    for key, (value, ts) in metrics.gauges.items():
+        if key not in gauges or gauges[key][1] <= ts:
+            gauges[key] = [value, ts]
+
+    oldest = time.strftime('%Y-%m-%d',
+                           time.localtime(now - (DAYS - 1) * 86400))
+    for day in store['days'].keys():
+        if day < oldest:
+            del store['days'][day]
+
+    store['updated'] = round(now, 3)
+
+
+def window(store, days=DAYS):
+    """Sum counters and histograms of the last ``days`` days.
+
+    Returns:
+        dict: ``{'counters': {...}, 'histograms': {...}}``
+
+    """
+    total = _empty_section()
+    for day in sorted(store['days'])[-days:]:
+        section = store['days'][day]
+        for key, value in section['counters'].items():
+            total['counters'][key] = total['counters'].get(key, 0) + value
+        for key, h in section['histograms'].items():
+            if key not in total['histograms']:
+                total['histograms'][key] = new_histogram()
+            merge_histogram(total['histograms'][key], h)
+
+    return total
+
+
+def _ms(value):
+    if value is None:
+        return '-'
+    if value >= 1000:
+        return '{:.1f}s'.format(value / 1000.0)
+    if value >= 10:
+        return '{:.0f}ms'.format(value)
+    return '{:.1f}ms'.format(value)
+
+
+def _size(n):
+    for unit in ('B', 'KB', 'MB'):
+        if n < 1024:
+            return '{:.0f}{}'.format(n, unit)
+        n /= 1024.0
+    return '{:.1f}GB'.format(n)
+
+
+def _ago(ts, now):
+    secs = max(now - ts, 0)
+    if secs < 120:
+        return '{:.0f}s ago'.format(secs)
+    if secs < 7200:
+        return '{:.0f}m ago'.format(secs / 60)
+    return '{:.0f}h ago'.format(secs / 3600)
+
+
+def _plural(n, word):
+    return '{:,} {}{}'.format(n, word, '' if n == 1 else 's')
+
+
+def _latency(h):
+    return 'p50 {} · p95 {} · p99 {} · max {}'.format(
+        _ms(percentile(h, 50)), _ms(percentile(h, 95)),
+        _ms(percentile(h, 99)), _ms(h['max']))
+
+
+def report(store, days=DAYS, now=None):
+    """Summarise the last ``days`` days of ``store`` for humans.
+
+    Args:
+        store (dict): Metrics store.
+        days (int, optional): Number of days to summarise.
+        now (float, optional): Current time.
+
+    Returns:
+        list: ``(title, subtitle)`` tuples.
+
+    """
+    now = now or time.time()
+    section = window(store, days)
+    counters, histograms = section['counters'], section['histograms']
+    lines = []
+
+    # Collect series by name and group them
+    runs, cache, http, other = {}, {}, {}, []
+    for key, h in histograms.items():
+        name, labels = parse_series(key)
+        if name == 'run_duration_ms':
+            runs[labels.get('command', '')] = h
+        elif name == 'http_duration_ms':
+            http.setdefault(labels.get('endpoint', ''), {})['ms'] = h
+        else:
+            other.append((key, '{} · {}'.format(_plural(h['n'], 'value'),
+                                                 _latency(h))))
+
+    for key, value in counters.items():
+        name, labels = parse_series(key)
+        if name == 'cache_lookups_total':
+            results = cache.setdefault(labels.get('family', ''), {})
+            results[labels.get('result', '')] = value
+        elif name == 'http_requests_total':
+            d = http.setdefault(labels.get('endpoint', ''), {})
+            d.setdefault('status', {})[labels.get('status', '')] = value
+        elif name == 'http_response_bytes_total':
+            http.setdefault(labels.get('endpoint', ''), {})['bytes'] = value
+        else:
+            other.append((key, '{:,}'.format(value)))
+
+    lines.append(('Metrics of the last {} days'.format(days),
+                  'Recorded since {} · updated {}'.format(
+                      time.strftime('%Y-%m-%d %H:%M',
+                                    time.localtime(store['since'])),
+                      _ago(store['updated'], now) if store['updated']
+                      else 'never')))
+
+    for command, h in sorted(runs.items(), key=lambda t: -t[1]['n']):
+        lines.append(('Run: {}'.format(command),
+                      '{} · {}'.format(_plural(h['n'], 'run'), _latency(h))))
+
+    for ep, d in sorted(http.items(),
+                        key=lambda t: -sum(t[1].get('status', {}).values())):
+        status = d.get('status', {})
+        parts = [_plural(sum(status.values()), 'request')]
+        parts.append(', '.join(['{}×{}'.format(s, n) for s, n in
+                                 sorted(status.items())]))
+        if d.get('bytes'):
+            parts.append(_size(d['bytes']))
+        if d.get('ms'):
+            parts.append('p50 {} · p95 {}'.format(
+                _ms(percentile(d['ms'], 50)), _ms(percentile(d['ms'], 95))))
+        lines.append(('HTTP: {}'.format(ep), ' · '.join(parts)))
+
+    for family, results in sorted(cache.items(),
+                                  key=lambda t: -sum(t[1].values())):
+        total = sum(results.values())
+        parts = ['{} {}'.format(results[r], r)
+                 for r in ('hit', 'stale', 'miss') if r in results]
+        parts.extend(['{} {}'.format(n, r) for r, n in
+                      sorted(results.items())
+                      if r not in ('hit', 'stale', 'miss')])
+        parts.append('{:.0%} hits'.format(
+            results.get('hit', 0) / float(total)))
+        lines.append(('Cache: {}'.format(family), ' · '.join(parts)))
+
+    for key, (value, ts) in sorted(store['gauges'].items()):
+        lines.append((key, '{:g} · {}'.format(value, _ago(ts, now))))
+
+    lines.extend(sorted(other))
+    return lines
+
+
+def _labelled(key, extra):
+    """Add labels ``extra`` to series ``key``."""
+    name, labels = parse_series(key)
+    labels.update(extra)
+    return series(PREFIX + name, labels)
+
+
+def prometheus(store, labels=None):
+    """Running totals and gauges of ``store`` in Prometheus' text
+    format.
+
+    Args:
+        store (dict): Metrics store.
+        labels (dict, optional): Labels to add to all series, e.g.
+            ``{'workflow': 'net.deanishe.alfred-reddit'}``.
+
+    Returns:
+        unicode: Exposition text.
+
+    """
+    labels = labels or {}
+    out = []
+    typed = set()
+
+    def add(key, kind, suffix, value, extra=None):
+        name = parse_series(key)[0]
+        if name not in typed:
+            typed.add(name)
+            out.append('# TYPE {}{} {}'.format(PREFIX, name, kind))
+        d = dict(labels)
+        d.update(extra or {})
+        name, own = parse_series(_labelled(key, d))
+        out.append('{} {}'.format(series(name + suffix, own),
+                                   repr(float(value))))
+
+    for key, value in sorted(store['total']['counters'].items()):
+        add(key, 'counter', '', value)
+
+    for key, h in sorted(store['total']['histograms'].items()):
+        seen = 0
+        for i in sorted(h['b'], key=int):
+            seen += h['b'][i]
+            add(key, 'histogram', '_bucket', seen,
+                {'le': '{:.6g}'.format(bucket_bound(i))})
+        add(key, 'histogram', '_bucket', h['n'], {'le': '+Inf'})
+        add(key, 'histogram', '_sum', h['sum'])
+        add(key, 'histogram', '_count', h['n'])
+
+    for key, (value, _) in sorted(store['gauges'].items()):
+        add(key, 'gauge', '', value)
+
+    return '\n'.join(out) + '\n'
+
+
+def write_textfile(path, store, labels=None):
+    """Write ``store`` to Prometheus textfile ``path``."""
+    with atomic_writer(path, 'wb') as fp:
+        fp.write(prometheus(store, labels).encode('utf-8'))
+
+
+def enabled():
+    """Whether ``WF_METRICS`` allows metrics."""
+    value = os.getenv(ENV_VAR, '').strip().lower()
+    return value not in ('0', 'false', 'no', 'off')
+
+
+def current():
+    """Return `Metrics` of this process."""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics(enabled())
+    return _metrics
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright (c) 2026 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2026-10-19
+#
+
+"""Profile workflow runs with :mod:`cProfile`.
+
+.. versionadded:: 1.37
+
+To find out why a workflow is slow on somebody else's machine, ask
+them to enter ``workflow:profile`` and then use the workflow as usual.
+The next :const:`RUNS` runs (including background jobs started with
+:func:`~workflow.background.run_in_background`) are profiled, and
+their stats saved to ``profiles/`` in the workflow's cache directory
+as ``.pstats`` files, which can be loaded with :mod:`pstats` or a
+viewer such as SnakeViz. ``workflow:profiles`` shows the functions
+that took the most time.
+
+Setting the ``WF_PROFILE`` environment/workflow variable to ``1``
+profiles every run while it is set.
+
+Only the :const:`KEEP` newest profiles are kept.
+
+"""
+
+from __future__ import print_function
+
+import marshal
+import os
+import re
+import time
+
+from util import LockFile, atomic_writer
+
+#: Variable that turns profiling on
+ENV_VAR = 'WF_PROFILE'
+
+#: Name of profile directory in cache directory
+DIRNAME = 'profiles'
+
+#: File in cache directory with number of runs left to profile
+COUNTER = 'profile.runs'
+
+#: Number of runs ``workflow:profile`` profiles
+RUNS = 10
+
+#: Number of profiles to keep
+KEEP = 20
+
+
+def _counter(cachedir):
+    return os.path.join(cachedir, COUNTER)
+
+
+def arm(cachedir, runs=RUNS):
+    """Profile the next ``runs`` runs."""
+    path = _counter(cachedir)
+    with LockFile(path):
+        with atomic_writer(path, 'wb') as fp:
+            fp.write(str(runs))
+
+
+def wanted(cachedir):
+    """Whether to profile this run.
+
+    Uses up one of the runs set with :func:`arm`.
+
+    """
+    value = os.getenv(ENV_VAR, '').strip().lower()
+    if value and value not in ('0', 'false', 'no', 'off'):
+        return True
+
+    path = _counter(cachedir)
+    if not os.path.exists(path):
+        return False
+
+    with LockFile(path):
+        try:
+            with open(path, 'rb') as fp:
+                runs = int(fp.read() or 0)
+        except (IOError, ValueError):
+            runs = 0
+
+        if runs > 1:
+            with atomic_writer(path, 'wb') as fp:
+                fp.write(str(runs - 1))
+        else:
+            os.unlink(path)
+
+    return runs > 0
+
+
+def start():
+    """Start and return a new :class:`cProfile.Profile`."""
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def profile_dir(cachedir):
+    """Return directory profiles are saved in, creating it if needed."""
+    dirpath = os.path.join(cachedir, DIRNAME)
+    if not os.path.exists(dirpath):
+        try:
+            os.makedirs(dirpath)
+        except OSError:  # created by another process
+            pass
+    return dirpath
+
+
+def save(profiler, cachedir, label='run'):
+    """Stop ``profiler`` and save its stats.
+
+    Args:
+        profiler (cProfile.Profile): Profiler returned by `start()`.
+        cachedir (unicode): Workflow's cache directory.
+        label (unicode, optional): What was profiled, e.g. the name of
+            a background job. Used in the filename.
+
+    Returns:
+        unicode: Path of ``.pstats`` file.
+
+    """
+    profiler.disable()
+    dirpath = profile_dir(cachedir)
+    label = re.sub(r'[^\w.-]+', '_', label)
+    name = '{}-{}-{}.pstats'.format(time.strftime('%Y%m%d-%H%M%S'),
+                                    os.getpid(), label)
+    path = os.path.join(dirpath, name)
+    with atomic_writer(path, 'wb') as fp:
+        profiler.create_stats()
+        marshal.dump(profiler.stats, fp)
+
+    for old in profiles(cachedir)[:-KEEP]:
+        try:
+            os.unlink(old)
+        except OSError:  # deleted by another process
+            pass
+
+    return path
+
+
+def profiles(cachedir):
+    """Return paths of saved profiles, oldest first."""
+    dirpath = os.path.join(cachedir, DIRNAME)
+    if not os.path.exists(dirpath):
+        return []
+
+    return [os.path.join(dirpath, n) for n in sorted(os.listdir(dirpath))
+            if n.endswith('.pstats')]
+
+
+def _name(func):
+    """Readable name of ``pstats`` function key."""
+    filename, line, name = func
+    if filename == '~':  # built-in
+        return name, ''
+    return name, '{}:{}'.format(os.path.basename(filename), line)
+
+
+def summary(paths, limit=15):
+    """Functions that took the most time in profiles ``paths``.
+
+    Args:
+        paths (list): Paths of ``.pstats`` files.
+        limit (int, optional): Number of functions to return.
+
+    Returns:
+        tuple: ``(total, rows)`` where ``total`` is the time (in
+            seconds) of all profiled runs and ``rows`` is a list of
+            ``(name, location, calls, own time, cumulative time)``
+            tuples, sorted by own time.
+
+    """
+    import pstats
+
+    stats = pstats.Stats(*paths)
+    rows = []
+    for func, (_, calls, own, cumulative, _) in stats.stats.items():
+        name, location = _name(func)
+        rows.append((name, location, calls, own, cumulative))
+
+    rows.sort(key=lambda r: -r[3])
+    return stats.total_tt, rows[:limit]
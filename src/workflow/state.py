@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright (c) 2026 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2026-10-19
+#
+
+"""Snapshot of workflow metadata and state that's cheap to read.
+
+.. versionadded:: 1.37
+
+Every run needs the workflow's name, bundle ID and version, a few of
+its settings and whether an update is available. Reading them from
+their sources means parsing ``info.plist``, locking and parsing
+``settings.json`` and unpickling the update status on every run.
+
+A :class:`Snapshot` keeps copies of these values in one file
+(:const:`FILENAME` in the workflow's cache directory), which is read
+the first time a value is needed. Each value is stored with the
+signature (mtime, size and inode) of the file it was read from, and
+is only used if the file's signature is still the same. Otherwise the
+file is read again and the snapshot rewritten by :meth:`Snapshot.save`
+when the run finishes. Values that aren't asked for aren't checked.
+
+"""
+
+from __future__ import print_function
+
+import cPickle
+import os
+
+from util import atomic_writer
+
+#: Name of snapshot file in cache directory
+FILENAME = 'state.cpickle'
+
+#: Increase when the format of the snapshot changes
+VERSION = 1
+
+
+def signature(path):
+    """Return ``(mtime, size, inode)`` of ``path`` or ``None``.
+
+    Files written with :func:`~workflow.util.atomic_writer` get a new
+    inode, so rewrites are noticed even if mtime and size don't
+    change.
+
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size, st.st_ino)
+
+
+class Snapshot(object):
+    """Copies of values read from files.
+
+    Args:
+        path (unicode): Path of snapshot file. If ``None``, the
+            snapshot isn't saved, and values are cached for the
+            lifetime of the object only.
+
+    """
+
+    def __init__(self, path=None):
+        """Create new `Snapshot`."""
+        self.path = path
+        self._entries = None
+        self._checked = {}
+        self._dirty = False
+
+    def _load(self):
+        if self._entries is not None:
+            return self._entries
+
+        self._entries = {}
+        if self.path:
+            try:
+                with open(self.path, 'rb') as fp:
+                    data = cPickle.load(fp)
+                if data.get('version') == VERSION:
+                    self._entries = data['entries']
+            except Exception:  # missing, corrupt or written by old code
+                pass
+
+        return self._entries
+
+    def get(self, key, source, load):
+        """Value of ``key``, read with ``load(source)`` if it's changed.
+
+        Args:
+            key (str): Name of value.
+            source (unicode): Path of file the value is read from.
+            load (callable): Function that reads the value from
+                ``source``. Not called if ``source`` doesn't exist.
+
+        Returns:
+            object: Value returned by ``load``, or ``None`` if
+                ``source`` doesn't exist.
+
+        """
+        if key in self._checked:
+            return self._checked[key][1]
+
+        sig = signature(source)
+        entry = self._load().get(key)
+        if entry and entry[0] == source and entry[1] == sig:
+            value = entry[2]
+        else:
+            value = load(source) if sig else None
+            self._entries[key] = (source, sig, value)
+            self._dirty = True
+
+        self._checked[key] = (sig, value)
+        return value
+
+    def mtime(self, key):
+        """Modification time of the source of ``key``.
+
+        Returns:
+            float: Timestamp, or ``None`` if ``key`` hasn't been
+                read with :meth:`get` or its source doesn't exist.
+
+        """
+        sig = self._checked.get(key, (None, None))[0]
+        return sig[0] if sig else None
+
+    def save(self):
+        """Write snapshot to :attr:`path` if any values were re-read."""
+        if not (self.path and self._dirty):
+            return
+
+        data = {'version': VERSION, 'entries': self._entries}
+        with atomic_writer(self.path, 'wb') as fp:
+            cPickle.dump(data, fp, cPickle.HIGHEST_PROTOCOL)
+        self._dirty = False
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright (c) 2026 Dean Jackson <deanishe@deanishe.net>
+#
+# MIT Licence. See http://opensource.org/licenses/MIT
+#
+# Created on 2026-10-19
+#
+
+"""Timing spans of workflow runs, written to a trace log.
+
+.. versionadded:: 1.37
+
+Set the ``WF_TRACE`` environment/workflow variable to ``1`` to record
+how long each phase of a run takes. :meth:`Workflow.run()
+<workflow.Workflow.run>` appends one line of JSON per run to
+``trace.jsonl`` in the workflow's cache directory (or to the file
+``WF_TRACE`` is set to, if it's a path)::
+
+    {"ts": 1539900000.123, "pid": 123, "argv": ["python/asy"],
+     "ms": 87.4, "spans": [["imports", null, 0.0, 41.2],
+                           ["main", null, 41.9, 44.8],
+                           ["cache.load", 1, 42.0, 3.1,
+                            {"key": "--hot-python", "bytes": 51234}]]}
+
+Each span is ``[name, parent, start, duration]`` plus attributes if
+it has any. ``parent`` is the index of the enclosing span in
+``spans`` (or ``null``), and ``start`` and ``duration`` are
+milliseconds from the start of the run. The ``imports`` span starts
+when this module is imported, not when Python starts.
+
+Spans are added with :func:`span` or :meth:`Workflow.span()
+<workflow.Workflow.span>`::
+
+    with wf.span('filter', items=len(items)) as sp:
+        results = wf.filter(query, items)
+        sp.set(results=len(results))
+
+Spans may be opened in several threads. Each thread nests its own
+spans, and a thread's outermost spans are children of the span open
+in the main thread at the time (e.g. the one that started the
+threads).
+
+When tracing is off, :func:`span` returns a shared do-nothing span,
+so spans cost next to nothing. The span is falsy then, so attributes
+that are expensive to compute can be skipped with ``if sp:``.
+
+The log is rotated when it grows larger than :const:`MAX_SIZE`.
+
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import sys
+import threading
+import time
+
+from util import LockFile
+
+#: Variable that turns tracing on
+ENV_VAR = 'WF_TRACE'
+
+#: Name of trace log in cache directory
+FILENAME = 'trace.jsonl'
+
+#: Size at which trace log is rotated
+MAX_SIZE = 1024 * 1024
+
+#: Number of rotated logs to keep (``trace.jsonl.1`` etc.)
+BACKUPS = 2
+
+# When this module was imported (start of "imports" span)
+_imported = time.time()
+
+# Active `Tracer`
+_tracer = None
+
+
+def _monotonic_clock():
+    """Return a monotonic clock or `time.time` if there's none."""
+    try:
+        import ctypes
+
+        class timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+        clock_gettime = ctypes.CDLL(None).clock_gettime
+    except (ImportError, OSError, AttributeError):  # pragma: no cover
+        return time.time
+
+    # CLOCK_MONOTONIC
+    clock_id = 6 if sys.platform == 'darwin' else 1
+    ts = timespec()
+
+    def monotonic():
+        if clock_gettime(clock_id, ctypes.byref(ts)):  # pragma: no cover
+            return time.time()
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+
+    return monotonic
+
+
+class NullSpan(object):
+    """Span that records nothing. Returned when tracing is off."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        """Do nothing."""
+        return self
+
+    def __exit__(self, typ, value, traceback):
+        """Do nothing."""
+        return False
+
+    def __nonzero__(self):
+        """Always false."""
+        return False
+
+    def set(self, **attrs):
+        """Ignore ``attrs``."""
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span(object):
+    """Timed section of a run.
+
+    Use as a context manager. Spans opened inside it are its children.
+
+    Args:
+        tracer (Tracer): Tracer to record span in.
+        name (str): Name of span.
+        attrs (dict): Attributes of span.
+
+    """
+
+    __slots__ = ('tracer', 'name', 'attrs', 'index')
+
+    def __init__(self, tracer, name, attrs):
+        """Create new `Span`."""
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.index = None
+
+    def __enter__(self):
+        """Start span."""
+        self.index = self.tracer._open(self)
+        return self
+
+    def __exit__(self, typ, value, traceback):
+        """End span. Exceptions are recorded as attribute ``error``."""
+        if typ is not None:
+            self.attrs['error'] = typ.__name__
+        self.tracer._close(self)
+        return False
+
+    def __nonzero__(self):
+        """Always true."""
+        return True
+
+    def set(self, **attrs):
+        """Add ``attrs`` to span's attributes."""
+        self.attrs.update(attrs)
+
+
+class Tracer(object):
+    """Record spans of one run.
+
+    Attributes:
+        attrs (dict): Attributes of the run, e.g. ``argv``.
+        spans (list): Recorded spans. See module docs for format.
+
+    """
+
+    def __init__(self, started=None):
+        """Create new `Tracer`.
+
+        Args:
+            started (float, optional): Start of run as returned by
+                `time.time`. Default is now.
+
+        """
+        self.clock = _monotonic_clock()
+        now = time.time()
+        self.started = started or now
+        self._start = self.clock() - (now - self.started)
+        self.attrs = {}
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._main = self._stack()
+
+    def _stack(self):
+        """Indices of the calling thread's open spans."""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _ms(self, t):
+        """Milliseconds between start of run and clock time ``t``."""
+        return round((t - self._start) * 1000, 3)
+
+    def span(self, name, **attrs):
+        """Return new `Span` ``name`` with attributes ``attrs``."""
+        return Span(self, name, attrs)
+
+    def add(self, name, started, **attrs):
+        """Record span that started at ``started`` and ends now.
+
+        Args:
+            name (str): Name of span.
+            started (float): Start of span as returned by `time.time`.
+            **attrs: Attributes of span.
+
+        """
+        start = self._start + (started - self.started)
+        self._record(name, self._ms(start), self._ms(self.clock()), attrs)
+
+    def _record(self, name, start, end, attrs):
+        stack = self._stack() or self._main
+        with self._lock:
+            parent = stack[-1] if stack else None
+            s = [name, parent, start, round(end - start, 3)]
+            if attrs:
+                s.append(attrs)
+            self.spans.append(s)
+            return len(self.spans) - 1
+
+    def _open(self, span):
+        i = self._record(span.name, self._ms(self.clock()), 0, None)
+        self._stack().append(i)
+        return i
+
+    def _close(self, span):
+        s = self.spans[span.index]
+        s[3] = round(self._ms(self.clock()) - s[2], 3)
+        if span.attrs:
+            s.append(span.attrs)
+        stack = self._stack()
+        if span.index in stack:  # also drop children left open
+            del stack[stack.index(span.index):]
+
+    def record(self):
+        """Return run as :class:`dict`."""
+        data = {'ts': round(self.started, 3), 'pid': os.getpid(),
+                'ms': self._ms(self.clock()), 'spans': self.spans}
+        data.update(self.attrs)
+        return data
+
+    def write(self, path):
+        """Append run to trace log ``path``, rotating it if necessary."""
+        line = json.dumps(self.record(), separators=(',', ':'),
+                          default=repr) + '\n'
+        try:
+            if os.path.getsize(path) + len(line) > MAX_SIZE:
+                _rotate(path)
+        except OSError:
+            pass
+
+        with open(path, 'ab') as fp:
+            fp.write(line)
+
+
+def _rotate(path):
+    """Move trace log ``path`` to ``path.1`` etc."""
+    with LockFile(path):
+        # Another process may have rotated it already
+        if os.path.getsize(path) <= MAX_SIZE // 2:
+            return
+
+        for i in range(BACKUPS - 1, 0, -1):
+            src = '{}.{}'.format(path, i)
+            if os.path.exists(src):
+                os.rename(src, '{}.{}'.format(path, i + 1))
+
+        os.rename(path, path + '.1')
+
+
+def enabled():
+    """Whether ``WF_TRACE`` turns tracing on."""
+    value = os.getenv(ENV_VAR, '').strip()
+    return bool(value) and value.lower() not in ('0', 'false', 'no', 'off')
+
+
+def trace_path(cachedir):
+    """Path of trace log: ``WF_TRACE`` if it's a path, else in
+    ``cachedir``.
+    """
+    value = os.getenv(ENV_VAR, '')
+    if os.sep in value:
+        return os.path.expanduser(value)
+    return os.path.join(cachedir, FILENAME)
+
+
+def start():
+    """Start tracing (once per process) and return active `Tracer`.
+
+    The run starts when this module was imported, and the time until
+    now is recorded as span ``imports``.
+
+    """
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(_imported)
+        _tracer.add('imports', _imported)
+    return _tracer
+
+
+def current():
+    """Return active `Tracer` or ``None``."""
+    return _tracer
+
+
+def span(name, **attrs):
+    """Return `Span` ``name`` of active tracer or `NULL_SPAN`.
+
+    Args:
+        name (str): Name of span.
+        **attrs: Attributes of span, e.g. ``key='cache-key'``.
+
+    """
+    if _tracer is None:
+        return NULL_SPAN
+    return _tracer.span(name, **attrs)
@@ -24,17 +24,21 @@
 from __future__ import print_function, unicode_literals
 
 import os
-import tempfile
 import re
-import subprocess
 
 import workflow
-import web
 
 # __all__ = []
 
 
-RELEASES_BASE = 'https://api.github.com/repos/{0}/releases'
+#: Base URL of GitHub API. Set ``GITHUB_API_URL`` to use a different
+#: server, e.g. a local stand-in for testing.
+#:
+#: .. versionadded:: 1.37
+GITHUB_API_URL = (os.getenv('GITHUB_API_URL') or
+                  'https://api.github.com').rstrip('/')
+
+RELEASES_BASE = GITHUB_API_URL + '/repos/{0}/releases'
 
 
 _wf = None
@@ -206,6 +210,9 @@ def download_workflow(url):
             not filename.endswith('.alfred3workflow')):
         raise ValueError('attachment not a workflow: {0}'.format(filename))
 
+    import tempfile
+    import web
+
     local_path = os.path.join(tempfile.gettempdir(), filename)
 
     wf().logger.debug(
@@ -308,6 +315,7 @@ def get_valid_releases(github_slug, prereleases=False):
     wf().logger.debug('retrieving releases list: %s', api_url)
 
     def retrieve_releases():
+        import web
         wf().logger.info(
             'retrieving releases: %s', github_slug)
         return web.get(api_url).json()
@@ -389,6 +397,7 @@ def install_update():
 
     local_file = download_workflow(update_data['download_url'])
 
+    import subprocess
     wf().logger.info('installing updated workflow ...')
     subprocess.call(['open', local_file])
 
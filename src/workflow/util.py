@@ -20,7 +20,6 @@ import fcntl
 import functools
 import os
 import signal
-import subprocess
 import sys
 from threading import Event
 import time
@@ -161,6 +160,7 @@ def run_command(cmd, **kwargs):
         str: Output returned by ``check_output``.
 
     """
+    import subprocess
     cmd = [utf8ify(s) for s in cmd]
     return subprocess.check_output(cmd, **kwargs)
 
@@ -331,6 +331,10 @@ def atomic_writer(fpath, mode):
 
     .. versionadded:: 1.12
 
+    .. versionchanged:: 1.37
+       The temporary file is closed before it replaces ``fpath``, so
+       readers never see a partly written file.
+
     Context manager that ensures the file is only written if the write
     succeeds. The data is first written to a temporary file.
 
@@ -342,15 +346,15 @@ def atomic_writer(fpath, mode):
     """
     suffix = '.{}.tmp'.format(os.getpid())
     temppath = fpath + suffix
-    with open(temppath, mode) as fp:
-        try:
+    try:
+        with open(temppath, mode) as fp:
             yield fp
-            os.rename(temppath, fpath)
-        finally:
-            try:
-                os.remove(temppath)
-            except (OSError, IOError):
-                pass
+        os.rename(temppath, fpath)
+    finally:
+        try:
+            os.remove(temppath)
+        except (OSError, IOError):
+            pass
 
 
 class LockFile(object):
@@ -358,6 +362,11 @@ class LockFile(object):
 
     .. versionadded:: 1.13
 
+    .. versionchanged:: 1.37
+       A lock taken on a lockfile that has since been deleted is
+       dropped and acquired again, so two processes can't hold the
+       lock at the same time.
+
     Creates a lockfile alongside ``protected_path``. Other ``LockFile``
     instances will refuse to lock the same path.
 
@@ -428,6 +437,12 @@ class LockFile(object):
             # Try to acquire the lock
             try:
                 fcntl.lockf(self._lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                # The holder deletes the lockfile before releasing it,
+                # so the lock may be on a file that's gone
+                if not self._current():
+                    self._lockfile.close()
+                    self._lockfile = None
+                    continue
                 self._lock.set()
                 break
             except IOError as err:  # pragma: no cover
@@ -443,22 +458,36 @@ class LockFile(object):
 
         return True
 
+    def _current(self):
+        """Whether open lockfile is still at `self.lockfile`."""
+        try:
+            st = os.stat(self.lockfile)
+        except OSError:
+            return False
+
+        fst = os.fstat(self._lockfile.fileno())
+        return (st.st_dev, st.st_ino) == (fst.st_dev, fst.st_ino)
+
     def release(self):
         """Release the lock by deleting `self.lockfile`."""
         if not self._lock.is_set():
             return False
 
+        # Delete lockfile while still holding the lock, so no other
+        # process can lock it after it's been released
+        try:
+            os.unlink(self.lockfile)
+        except (IOError, OSError):  # pragma: no cover
+            pass
+
         try:
             fcntl.lockf(self._lockfile, fcntl.LOCK_UN)
         except IOError:  # pragma: no cover
             pass
         finally:
             self._lock.clear()
+            self._lockfile.close()
             self._lockfile = None
-            try:
-                os.unlink(self.lockfile)
-            except (IOError, OSError):  # pragma: no cover
-                pass
 
             return True
 
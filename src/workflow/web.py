@@ -11,7 +11,6 @@
 
 import codecs
 import json
-import mimetypes
 import os
 import random
 import re
@@ -21,8 +20,12 @@ import unicodedata
 import urllib
 import urllib2
 import urlparse
+import time
 import zlib
 
+import metrics
+import tracing
+
 
 USER_AGENT = u'Alfred-Workflow/1.19 (+http://www.deanishe.net/alfred-workflow)'
 
@@ -293,13 +296,16 @@ class Response(object):
         """
         if not self._content:
 
+            data = self.raw.read()
+            self._count_bytes(len(data))
+
             # Decompress gzipped content
             if self._gzipped:
                 decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
-                self._content = decoder.decompress(self.raw.read())
+                self._content = decoder.decompress(data)
 
             else:
-                self._content = self.raw.read()
+                self._content = data
 
             self._content_loaded = True
 
@@ -365,6 +371,7 @@ class Response(object):
                 if not chunk:
                     break
 
+                self._count_bytes(len(chunk))
                 if self._gzipped:
                     chunk = decoder.decompress(chunk)
 
@@ -377,6 +384,13 @@ class Response(object):
 
         return chunks
 
+    def _count_bytes(self, n):
+        """Add ``n`` bytes read to ``http_response_bytes_total``."""
+        stats = metrics.current()
+        if stats.enabled:
+            stats.incr('http_response_bytes_total', n,
+                       endpoint=metrics.endpoint(self.request.get_full_url()))
+
     def save_to_path(self, filepath):
         """Save retrieved data to file at ``filepath``.
 
@@ -568,7 +582,22 @@ def request(method, url, params=None, data=None, headers=None, cookies=None,
         url = urlparse.urlunsplit((scheme, netloc, path, query, fragment))
 
     req = urllib2.Request(url, data, headers)
-    return Response(req, stream)
+    stats = metrics.current()
+    start = time.time()
+    status = 'error'
+    try:
+        with tracing.span('http', method=method, url=url) as sp:
+            r = Response(req, stream)
+            status = r.status_code
+            if sp:
+                sp.set(status=status)
+    finally:
+        if stats.enabled:
+            ep = metrics.endpoint(url)
+            stats.observe('http_duration_ms', (time.time() - start) * 1000,
+                          endpoint=ep)
+            stats.incr('http_requests_total', endpoint=ep, status=status)
+    return r
 
 
 def get(url, params=None, headers=None, cookies=None, auth=None,
@@ -628,7 +657,7 @@ def encode_multipart_formdata(fields, files):
         :rtype: str
 
         """
-
+        import mimetypes
         return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
 
     boundary = '-----' + ''.join(random.choice(BOUNDARY_CHARS)
@@ -21,34 +21,32 @@ up your Python script to best utilise the :class:`Workflow` object.
 
 from __future__ import print_function, unicode_literals
 
-import binascii
+# Modules only some runs need (XML feedback, Keychain, multiprocessing,
+# ``info.plist`` etc.) are imported where they are used to keep
+# start-up fast.
 import cPickle
 from copy import deepcopy
+import heapq
+from itertools import chain
 import json
 import logging
-import logging.handlers
 import os
-import pickle
-import plistlib
 import re
-import shutil
 import string
-import subprocess
 import sys
 import time
 import unicodedata
 
-try:
-    import xml.etree.cElementTree as ET
-except ImportError:  # pragma: no cover
-    import xml.etree.ElementTree as ET
-
 from util import (
     AcquisitionError,  # imported to maintain API
     atomic_writer,
     LockFile,
     uninterruptible,
 )
+import metrics
+import profiling
+import state
+import tracing
 
 #: Sentinel for properties that haven't been set yet (that might
 #: correctly have the value ``None``)
@@ -434,6 +432,28 @@ MATCH_SUBSTRING = 32
 MATCH_ALLCHARS = 64
 #: Combination of all other ``MATCH_*`` constants
 MATCH_ALL = 127
+#: Match items if all characters in ``query`` appear in the item in order,
+#: scored by the best alignment (see :func:`fuzzy_score`). Not part of
+#: :const:`MATCH_ALL`.
+MATCH_FUZZY = 128
+
+# Scores and bonuses used by :func:`fuzzy_score`
+FUZZY_SCORE_MATCH = 16
+FUZZY_PENALTY_GAP_START = 3
+FUZZY_PENALTY_GAP_EXTENSION = 1
+#: Bonus for match at start of a word
+FUZZY_BONUS_BOUNDARY = 8
+#: Bonus for match at a CamelCase or letter-to-number transition
+FUZZY_BONUS_CAMEL = 7
+#: Min. bonus for a match directly after another match
+FUZZY_BONUS_CONSECUTIVE = 4
+#: Bonus multiplier for the first character of the query
+FUZZY_BONUS_FIRST_CHAR_MULTIPLIER = 2
+
+#: Number of items :meth:`Workflow.filter` sends to each worker process
+#: (see :attr:`Workflow.filter_processes`). Lists no longer than this
+#: are always filtered in the calling process.
+FILTER_CHUNK_SIZE = 20000
 
 
 ####################################################################
@@ -482,6 +502,38 @@ class PasswordExists(KeychainError):
 # Helper functions
 ####################################################################
 
+def _etree():
+    """Import and return ElementTree (only XML feedback needs it)."""
+    try:
+        import xml.etree.cElementTree as ET
+    except ImportError:  # pragma: no cover
+        import xml.etree.ElementTree as ET
+    return ET
+
+
+def _read_file(path):
+    """Return contents of file ``path``."""
+    with open(path, 'rb') as fp:
+        return fp.read()
+
+
+def _read_json(path):
+    """Load JSON file ``path``.
+
+    Not locked: :class:`Settings` replaces the file atomically, so it's
+    never read half-written.
+
+    """
+    with open(path, 'rb') as fp:
+        return json.load(fp)
+
+
+def _read_pickle(path):
+    """Load pickle file ``path``."""
+    with open(path, 'rb') as fp:
+        return cPickle.load(fp)
+
+
 def isascii(text):
     """Test if ``text`` contains only ASCII characters.
 
@@ -498,6 +550,178 @@ def isascii(text):
     return True
 
 
+def _char_class(c):
+    """Class of character: 0 = other, 1 = lower, 2 = upper, 3 = digit."""
+    if c.isdigit():
+        return 3
+    if c.isupper():
+        return 2
+    if c.isalpha():
+        return 1
+    return 0
+
+
+def fuzzy_score(query, value):
+    """Score the best alignment of ``query`` within ``value``.
+
+    .. versionadded:: 1.37
+
+    A Smith-Waterman-style local alignment (like fzf's): each character
+    of ``query`` must match a character of ``value`` in the same order
+    (case-insensitive). Matches at the start of words and at CamelCase
+    transitions and runs of consecutive matches earn bonuses; gaps
+    between matches are penalised. Unlike a ``.*?a.*?b`` regex, the
+    cost is at most ``len(query) * len(value)`` steps, and the score
+    reflects the best alignment, not the leftmost one.
+
+    :param query: lowercase query
+    :type query: ``unicode``
+    :param value: search key to test
+    :type value: ``unicode``
+    :returns: score between 0 (no match) and 100 (``query`` is a word
+        at the start of ``value``)
+    :rtype: ``float``
+
+    """
+    m = len(query)
+    lower = value.lower()
+
+    # Find window from first possible match of the first character
+    # to last match of the last character. Reject if ``query`` isn't
+    # a subsequence of ``value``.
+    start = i = lower.find(query[0])
+    if start < 0:
+        return 0
+    for c in query:
+        i = lower.find(c, i)
+        if i < 0:
+            return 0
+        i += 1
+    end = lower.rfind(query[-1]) + 1
+
+    # Bonuses for each position in window
+    bonus = []
+    prev = _char_class(value[start - 1]) if start else 0
+    for c in value[start:end]:
+        cls = _char_class(c)
+        if cls and not prev:
+            b = FUZZY_BONUS_BOUNDARY
+        elif (prev == 1 and cls == 2) or (prev != 3 and cls == 3):
+            b = FUZZY_BONUS_CAMEL
+        else:
+            b = 0
+        bonus.append(b)
+        prev = cls
+
+    text = lower[start:end]
+    n = len(text)
+    gap_start = -FUZZY_PENALTY_GAP_START
+    gap_ext = -FUZZY_PENALTY_GAP_EXTENSION
+
+    # Row ``i`` holds the best score of an alignment of ``query[:i+1]``
+    # that ends at or before each position. ``chunk`` holds the bonus
+    # of the first match of a run of consecutive matches ending there
+    # (or -1 if the alignment doesn't end with a match there).
+    prev_row = prev_chunk = None
+    for i, qc in enumerate(query):
+        row = [0] * n
+        chunk = [-1] * n
+        in_gap = False
+        for j in xrange(i, n):
+            left = row[j - 1] + (gap_ext if in_gap else gap_start) if j else 0
+            score = 0
+            if text[j] == qc:
+                if i == 0:
+                    b = bonus[j]
+                    score = (FUZZY_SCORE_MATCH +
+                             b * FUZZY_BONUS_FIRST_CHAR_MULTIPLIER)
+                elif prev_row[j - 1] > 0:
+                    b = bonus[j]
+                    if prev_chunk[j - 1] >= 0:  # consecutive
+                        b = max(b, prev_chunk[j - 1], FUZZY_BONUS_CONSECUTIVE)
+                    score = prev_row[j - 1] + FUZZY_SCORE_MATCH + b
+
+            if score and score >= left:
+                row[j] = score
+                chunk[j] = b
+                in_gap = False
+            else:
+                row[j] = max(left, 0)
+                in_gap = True
+
+        prev_row, prev_chunk = row, chunk
+
+    best = max(max(prev_row), 1)
+    perfect = (FUZZY_SCORE_MATCH +
+               FUZZY_BONUS_BOUNDARY * FUZZY_BONUS_FIRST_CHAR_MULTIPLIER +
+               (m - 1) * (FUZZY_SCORE_MATCH + FUZZY_BONUS_BOUNDARY))
+    return min(100.0 * best / perfect, 100.0)
+
+
+def _score_values(filter_item, words, values, match_on, fold_diacritics,
+                  min_score):
+    """Generate results for ``(index, value)`` pairs matching ``words``.
+
+    Results are ``(sort_key, index, score, rule)`` tuples. Values
+    scoring ``min_score`` or less are dropped.
+
+    """
+    for i, value in values:
+        if not value:
+            continue
+
+        score = 0
+        for word in words:
+            s, rule = filter_item(value, word, match_on, fold_diacritics)
+            if not s:  # Skip items that don't match part of the query
+                break
+            score += s
+        else:
+            if score > min_score:
+                # use "reversed" `score` (i.e. highest becomes lowest) and
+                # `value` as sort key. This means items with the same score
+                # will be sorted in alphabetical not reverse alphabetical
+                # order. `index` keeps the sort stable.
+                yield ((100.0 / score, value.lower(), score), i, score, rule)
+
+
+def _select(results, ascending, max_results):
+    """Sort ``results`` or select the ``max_results`` best from them.
+
+    Selecting the top results via a heap needs memory proportional to
+    ``max_results``, not to the number of results.
+
+    """
+    if not max_results:
+        return sorted(results, reverse=ascending)
+
+    if ascending:
+        return heapq.nlargest(max_results, results)
+
+    return heapq.nsmallest(max_results, results)
+
+
+# ``(index, value)`` pairs being filtered by worker processes. Set
+# before the workers are forked, so they inherit it instead of
+# receiving the values via pickle.
+_filter_values = None
+
+
+def _filter_chunk(args):
+    """Filter a slice of :data:`_filter_values` in a worker process.
+
+    Called by :meth:`Workflow.filter` via :mod:`multiprocessing`.
+
+    """
+    (words, start, end, match_on, fold_diacritics, min_score, max_results,
+     ascending) = args
+    wf = Workflow(capture_args=False)
+    results = _score_values(wf._filter_item, words,
+                            _filter_values[start:end], match_on,
+                            fold_diacritics, min_score)
+    return _select(results, ascending, max_results)
+
+
 ####################################################################
 # Implementation classes
 ####################################################################
@@ -681,6 +905,7 @@ class PickleSerializer(object):
         :rtype: object
 
         """
+        import pickle
         return pickle.load(file_obj)
 
     @classmethod
@@ -695,6 +920,7 @@ class PickleSerializer(object):
         :type file_obj: ``file`` object
 
         """
+        import pickle
         return pickle.dump(obj, file_obj, protocol=-1)
 
 
@@ -761,6 +987,7 @@ class Item(object):
             if value:
                 attr[name] = value
 
+        ET = _etree()
         root = ET.Element('item', attr)
         ET.SubElement(root, 'title').text = self.title
         ET.SubElement(root, 'subtitle').text = self.subtitle
@@ -814,6 +1041,10 @@ class Settings(dict):
     An appropriate instance is provided by :class:`Workflow` instances at
     :attr:`Workflow.settings`.
 
+    .. versionchanged:: 1.37
+       Saving only writes the keys changed by this object and keeps
+       changes other processes have saved since the file was loaded.
+
     """
 
     def __init__(self, filepath, defaults=None):
@@ -832,9 +1063,9 @@ class Settings(dict):
     def _load(self):
         """Load cached settings from JSON file `self._filepath`."""
         data = {}
-        with LockFile(self._filepath, 0.5):
-            with open(self._filepath, 'rb') as fp:
-                data.update(json.load(fp))
+        # No lock needed: `save()` replaces the file atomically
+        with open(self._filepath, 'rb') as fp:
+            data.update(json.load(fp))
 
         self._original = deepcopy(data)
 
@@ -854,13 +1085,30 @@ class Settings(dict):
             return
 
         data = {}
-        data.update(self)
-
         with LockFile(self._filepath, 0.5):
+            # Merge own changes into current file, not the one loaded
+            if os.path.exists(self._filepath):
+                try:
+                    with open(self._filepath, 'rb') as fp:
+                        data.update(json.load(fp))
+                except ValueError:  # corrupt file: overwrite
+                    pass
+
+            for key in set(self._original) - set(self):
+                data.pop(key, None)
+
+            for key, value in self.items():
+                if key not in self._original or self._original[key] != value:
+                    data[key] = value
+
             with atomic_writer(self._filepath, 'wb') as fp:
                 json.dump(data, fp, sort_keys=True, indent=2,
                           encoding='utf-8')
 
+        self._original = deepcopy(data)
+        super(Settings, self).clear()
+        super(Settings, self).update(data)
+
     # dict methods
     def __setitem__(self, key, value):
         """Implement :class:`dict` interface."""
@@ -885,6 +1133,115 @@ class Settings(dict):
         return ret
 
 
+class BufferedLogHandler(logging.Handler):
+    """Log handler that keeps records in memory and writes them in one go.
+
+    .. versionadded:: 1.37
+
+    Records are only formatted when the handler is flushed, and are
+    then appended to ``logfile`` and written to ``stderr`` with one
+    write each. The handler is flushed when a record of level
+    ``flush_level`` or higher is logged, when ``capacity`` records
+    are buffered or ``flush_interval`` seconds have passed, and when
+    the program exits (by :func:`logging.shutdown`).
+
+    ``DEBUG`` records logged by the same line of code (e.g. one per
+    item in a loop) are capped at ``max_repeats`` per flush. The
+    number of dropped records is logged instead.
+
+    :param logfile: path to log file
+    :param max_bytes: size at which log file is rotated (to
+        ``logfile.1``)
+    :param capacity: maximum number of records to buffer
+    :param flush_level: level of records that are written immediately
+    :param flush_interval: maximum number of seconds to buffer records
+    :param max_repeats: maximum number of ``DEBUG`` records per line
+        of code
+
+    """
+
+    def __init__(self, logfile, max_bytes=1024 * 1024, capacity=1000,
+                 flush_level=logging.ERROR, flush_interval=5,
+                 max_repeats=10):
+        """Create new handler."""
+        logging.Handler.__init__(self)
+        self.logfile = logfile
+        self.max_bytes = max_bytes
+        self.capacity = capacity
+        self.flush_level = flush_level
+        self.flush_interval = flush_interval
+        self.max_repeats = max_repeats
+        self.buffer = []
+        self._repeats = {}
+        self._flushed = time.time()
+
+    def emit(self, record):
+        """Add ``record`` to buffer and flush if necessary."""
+        if record.levelno <= logging.DEBUG:
+            site = (record.pathname, record.lineno)
+            n = self._repeats[site] = self._repeats.get(site, 0) + 1
+            if n > self.max_repeats:
+                return
+
+        self.buffer.append(record)
+        if (record.levelno >= self.flush_level or
+                len(self.buffer) >= self.capacity or
+                record.created - self._flushed >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Write buffered records to log file and ``stderr``."""
+        self.acquire()
+        try:
+            records, self.buffer = self.buffer, []
+            for (path, lineno), n in sorted(self._repeats.items()):
+                if n > self.max_repeats:
+                    records.append(logging.LogRecord(
+                        'workflow', logging.DEBUG, path, lineno,
+                        '(%d more messages from this line not logged)',
+                        (n - self.max_repeats,), None))
+            self._repeats = {}
+            self._flushed = time.time()
+            if not records:
+                return
+
+            lines = []
+            for record in records:
+                try:
+                    line = self.format(record)
+                except Exception:
+                    self.handleError(record)
+                    continue
+                if isinstance(line, unicode):
+                    line = line.encode('utf-8', 'replace')
+                lines.append(line + b'\n')
+
+            data = b''.join(lines)
+            try:
+                self._write(data)
+            except (IOError, OSError):
+                self.handleError(records[-1])
+            sys.stderr.write(data)
+        finally:
+            self.release()
+
+    def _write(self, data):
+        """Append ``data`` to log file, rotating it if it's too big."""
+        try:
+            size = os.path.getsize(self.logfile)
+        except OSError:
+            size = 0
+
+        if size and size + len(data) > self.max_bytes:
+            try:
+                os.rename(self.logfile, self.logfile + '.1')
+            except OSError:  # rotated by another process
+                pass
+
+        with open(self.logfile, 'ab') as fp:
+            fp.write(data)
+
+
 class Workflow(object):
     """The ``Workflow`` object is the main interface to Alfred-Workflow.
 
@@ -956,6 +1313,8 @@ class Workflow(object):
         self._data_serializer = 'cpickle'
         self._info = None
         self._info_loaded = False
+        # Snapshot of info.plist, settings etc. (see workflow.state)
+        self._state = None
         self._logger = None
         self._items = []
         self._alfred_env = None
@@ -965,6 +1324,21 @@ class Workflow(object):
         self._last_version_run = UNSET
         # Cache for regex patterns created for filter keys
         self._search_pattern_cache = {}
+        # Spans of this run if tracing is on
+        self._tracer = tracing.start() if tracing.enabled() else None
+        #: :class:`~workflow.metrics.Metrics` of this run. Appended to
+        #: the metrics log when :meth:`run` finishes.
+        #:
+        #: .. versionadded:: 1.37
+        self.metrics = metrics.current()
+        #: Whether runs may be profiled (see :mod:`workflow.profiling`).
+        #:
+        #: .. versionadded:: 1.37
+        self.allow_profiling = True
+        #: Number of worker processes :meth:`filter` may use to filter
+        #: more than :const:`FILTER_CHUNK_SIZE` items. ``0`` (the
+        #: default) or ``1`` filters all items in the calling process.
+        self.filter_processes = 0
         # Magic arguments
         #: The prefix for all magic arguments. Default is ``workflow:``
         self.magic_prefix = 'workflow:'
@@ -1099,7 +1473,8 @@ class Workflow(object):
             if self.alfred_env.get('workflow_bundleid'):
                 self._bundleid = self.alfred_env.get('workflow_bundleid')
             else:
-                self._bundleid = unicode(self.info['bundleid'], 'utf-8')
+                self._bundleid = unicode(self._info_summary()['bundleid'],
+                                         'utf-8')
 
         return self._bundleid
 
@@ -1130,7 +1505,7 @@ class Workflow(object):
             if self.alfred_env.get('workflow_name'):
                 self._name = self.decode(self.alfred_env.get('workflow_name'))
             else:
-                self._name = self.decode(self.info['name'])
+                self._name = self.decode(self._info_summary()['name'])
 
         return self._name
 
@@ -1164,15 +1539,13 @@ class Workflow(object):
 
             # `version` file
             if not version:
-                filepath = self.workflowfile('version')
-
-                if os.path.exists(filepath):
-                    with open(filepath, 'rb') as fileobj:
-                        version = fileobj.read()
+                version = self._snapshot.get('version',
+                                             self.workflowfile('version'),
+                                             _read_file)
 
             # info.plist
             if not version:
-                version = self.info.get('version')
+                version = self._info_summary().get('version')
 
             if version:
                 from update import Version
@@ -1381,6 +1754,12 @@ class Workflow(object):
 
         Use :meth:`open_log` to open the log file in Console.
 
+        .. versionchanged:: 1.37
+           Log messages are buffered by a :class:`BufferedLogHandler`
+           and written when the workflow exits. Set the ``WF_LOG_BUFFER``
+           environment/workflow variable to ``0`` to write them
+           immediately.
+
         :returns: an initialised :class:`~logging.Logger`
 
         """
@@ -1400,16 +1779,22 @@ class Workflow(object):
                 ' %(levelname)-8s %(message)s',
                 datefmt='%H:%M:%S')
 
-            logfile = logging.handlers.RotatingFileHandler(
-                self.logfile,
-                maxBytes=1024 * 1024,
-                backupCount=1)
-            logfile.setFormatter(fmt)
-            logger.addHandler(logfile)
-
-            console = logging.StreamHandler()
-            console.setFormatter(fmt)
-            logger.addHandler(console)
+            if os.getenv('WF_LOG_BUFFER', '').strip() == '0':
+                from logging.handlers import RotatingFileHandler
+                logfile = RotatingFileHandler(
+                    self.logfile,
+                    maxBytes=1024 * 1024,
+                    backupCount=1)
+                logfile.setFormatter(fmt)
+                logger.addHandler(logfile)
+
+                console = logging.StreamHandler()
+                console.setFormatter(fmt)
+                logger.addHandler(console)
+            else:
+                buffered = BufferedLogHandler(self.logfile)
+                buffered.setFormatter(fmt)
+                logger.addHandler(buffered)
 
         if self.debugging:
             logger.setLevel(logging.DEBUG)
@@ -1460,10 +1845,26 @@ class Workflow(object):
         """
         if not self._settings:
             self.logger.debug('reading settings from %s', self.settings_path)
-            self._settings = Settings(self.settings_path,
-                                      self._default_settings)
+            with self.span('settings'):
+                self._settings = Settings(self.settings_path,
+                                          self._default_settings)
         return self._settings
 
+    def _setting(self, key, default=None):
+        """Return setting ``key`` without loading :attr:`settings`.
+
+        Values are read from the state snapshot (see :mod:`workflow.state`)
+        unless :attr:`settings` has already been loaded.
+
+        """
+        if self._settings is not None:
+            return self._settings.get(key, default)
+
+        data = self._snapshot.get('settings', self.settings_path, _read_json)
+        if data is None:
+            data = self._default_settings
+        return data.get(key, default)
+
     @property
     def cache_serializer(self):
         """Name of default cache serializer.
@@ -1685,10 +2086,15 @@ class Workflow(object):
 
         if (age < max_age or max_age == 0) and os.path.exists(cache_path):
 
-            with open(cache_path, 'rb') as file_obj:
-                self.logger.debug('loading cached data: %s', cache_path)
-                return serializer.load(file_obj)
+            self.metrics.cache_lookup(name, 'hit')
+            with self.span('cache.load', key=name) as sp:
+                with open(cache_path, 'rb') as file_obj:
+                    self.logger.debug('loading cached data: %s', cache_path)
+                    if sp:
+                        sp.set(bytes=os.fstat(file_obj.fileno()).st_size)
+                    return serializer.load(file_obj)
 
+        self.metrics.cache_lookup(name, 'stale' if age else 'miss')
         if not data_func:
             return None
 
@@ -1718,8 +2124,11 @@ class Workflow(object):
                 self.logger.debug('deleted cache file: %s', cache_path)
             return
 
-        with atomic_writer(cache_path, 'wb') as file_obj:
-            serializer.dump(data, file_obj)
+        with self.span('cache.save', key=name) as sp:
+            with atomic_writer(cache_path, 'wb') as file_obj:
+                serializer.dump(data, file_obj)
+                if sp:
+                    sp.set(bytes=file_obj.tell())
 
         self.logger.debug('cached data: %s', cache_path)
 
@@ -1782,9 +2191,11 @@ class Workflow(object):
             ``(item, score, rule)``.
         :type include_score: ``Boolean``
         :param min_score: If non-zero, ignore results with a score lower
-            than this.
+            than this. Items are dropped as soon as they're scored.
         :type min_score: ``int``
         :param max_results: If non-zero, prune results list to this length.
+            Only the best ``max_results`` results are kept while
+            filtering, so this is much cheaper than slicing the results.
         :type max_results: ``int``
         :param match_on: Filter option flags. Bitwise-combined list of
             ``MATCH_*`` constants (see below).
@@ -1821,16 +2232,28 @@ class Workflow(object):
             Combination of (4) and (5).
         7. :const:`MATCH_SUBSTRING`
             ``query`` is a substring of item search key (case-insensitive).
-        8. :const:`MATCH_ALLCHARS`
+        8. :const:`MATCH_FUZZY`
+            All characters in ``query`` appear in item search key in
+            the same order (case-insensitive), scored by how well they
+            align with words in the item (see :func:`fuzzy_score`).
+            Not included in :const:`MATCH_ALL`.
+        9. :const:`MATCH_ALLCHARS`
             All characters in ``query`` appear in item search key in
             the same order (case-insensitive).
-        9. :const:`MATCH_ALL`
-            Combination of all the above.
+        10. :const:`MATCH_ALL`
+            Combination of all the above except :const:`MATCH_FUZZY`.
 
 
         :const:`MATCH_ALLCHARS` is considerably slower than the other
         tests and provides much less accurate results.
 
+        :const:`MATCH_FUZZY` matches the same items as
+        :const:`MATCH_ALLCHARS`, but ranks them by the best alignment
+        and has bounded cost. To use it instead, pass
+        ``match_on=MATCH_ALL ^ MATCH_ALLCHARS | MATCH_FUZZY``.
+        Its scores (at most 80) are lower than those of the other
+        rules.
+
         **Examples:**
 
         To ignore :const:`MATCH_ALLCHARS` (tends to provide the worst
@@ -1856,6 +2279,17 @@ class Workflow(object):
         If ``query`` contains non-ASCII characters, search keys will not be
         altered.
 
+        **Large lists**
+
+        .. versionadded:: 1.37
+
+        Set :attr:`filter_processes` to filter lists of more than
+        :const:`FILTER_CHUNK_SIZE` items in chunks in that many worker
+        processes. Search keys are generated in the calling process,
+        so ``key`` and ``items`` needn't be picklable. Starting the
+        workers takes time, so this is only worth it for lists of
+        100,000s of items.
+
         """
         if not query:
             return items
@@ -1867,47 +2301,41 @@ class Workflow(object):
             return items
 
         # Use user override if there is one
-        fold_diacritics = self.settings.get('__workflow_diacritic_folding',
-                                            fold_diacritics)
-
-        results = []
-
-        for item in items:
-            skip = False
-            score = 0
-            words = [s.strip() for s in query.split(' ')]
-            value = key(item).strip()
-            if value == '':
-                continue
-            for word in words:
-                if word == '':
-                    continue
-                s, rule = self._filter_item(value, word, match_on,
-                                            fold_diacritics)
-
-                if not s:  # Skip items that don't match part of the query
-                    skip = True
-                score += s
-
-            if skip:
-                continue
-
-            if score:
-                # use "reversed" `score` (i.e. highest becomes lowest) and
-                # `value` as sort key. This means items with the same score
-                # will be sorted in alphabetical not reverse alphabetical order
-                results.append(((100.0 / score, value.lower(), score),
-                                (item, score, rule)))
+        fold_diacritics = self._setting('__workflow_diacritic_folding',
+                                        fold_diacritics)
+
+        with self.span('filter', query=query) as sp:
+            words = [w for w in (s.strip() for s in query.split(' ')) if w]
+            items = list(items)
+            values = [(i, key(item).strip()) for i, item in enumerate(items)]
+
+            if self.filter_processes > 1 and len(values) > FILTER_CHUNK_SIZE:
+                global _filter_values
+                chunks = [(words, i, i + FILTER_CHUNK_SIZE, match_on,
+                           fold_diacritics, min_score, max_results, ascending)
+                          for i in range(0, len(values), FILTER_CHUNK_SIZE)]
+                _filter_values = values
+                import multiprocessing
+                pool = multiprocessing.Pool(self.filter_processes)
+                try:
+                    results = pool.map(_filter_chunk, chunks)
+                finally:
+                    pool.close()
+                    pool.join()
+                    _filter_values = None
+
+                # merge top results of each chunk
+                results = _select(chain(*results), ascending, max_results)
 
-        # sort on keys, then discard the keys
-        results.sort(reverse=ascending)
-        results = [t[1] for t in results]
+            else:
+                scored = _score_values(self._filter_item, words, values,
+                                       match_on, fold_diacritics, min_score)
+                results = _select(scored, ascending, max_results)
 
-        if min_score:
-            results = [r for r in results if r[1] > min_score]
+            if sp:
+                sp.set(items=len(items), results=len(results))
 
-        if max_results and len(results) > max_results:
-            results = results[:max_results]
+        results = [(items[i], score, rule) for _, i, score, rule in results]
 
         # return list of ``(item, score, rule)``
         if include_score:
@@ -1993,6 +2421,14 @@ class Workflow(object):
 
             return (score, MATCH_SUBSTRING)
 
+        # assign a score based on the best alignment of the
+        # characters in `query` with item (scaled below other rules)
+        if match_on & MATCH_FUZZY:
+            score = fuzzy_score(query, value) * 0.8
+            if score:
+
+                return (score, MATCH_FUZZY)
+
         # finally, assign a score based on how close together the
         # characters in `query` are in item.
         if match_on & MATCH_ALLCHARS:
@@ -2025,6 +2461,10 @@ class Workflow(object):
     def run(self, func, text_errors=False):
         """Call ``func`` to run your workflow.
 
+        .. versionchanged:: 1.37
+           Records how long ``func`` takes in :attr:`metrics` and appends
+           them to the metrics log.
+
         :param func: Callable to call with ``self`` (i.e. the :class:`Workflow`
             instance) as first argument.
         :param text_errors: Emit error messages in plain text, not in
@@ -2058,13 +2498,18 @@ class Workflow(object):
 
             # Run update check if configured for self-updates.
             # This call has to go in the `run` try-except block, as it will
-            # initialise `self.settings`, which will raise an exception
-            # if `settings.json` isn't valid.
+            # read the settings, which will raise an exception if
+            # `settings.json` isn't valid.
             if self._update_settings:
-                self.check_update()
+                with self.span('update-check'):
+                    self.check_update()
 
             # Run workflow's entry function/method
-            func(self)
+            with self.span('main'):
+                if self.allow_profiling and profiling.wanted(self.cachedir):
+                    self._run_profiled(func)
+                else:
+                    func(self)
 
             # Set last version run to current version after a successful
             # run
@@ -2095,9 +2540,107 @@ class Workflow(object):
         finally:
             self.logger.debug('---------- finished in %0.3fs ----------',
                               time.time() - start)
+            if self._tracer:
+                self._write_trace()
+            if self.metrics.enabled:
+                self.metrics.observe('run_duration_ms',
+                                     (time.time() - start) * 1000,
+                                     command=self.metrics.command)
+                self._save_metrics()
+            if self._state:
+                try:
+                    self._state.save()
+                except (IOError, OSError) as err:
+                    self.logger.warning('could not save state: %s', err)
 
         return 0
 
+    def span(self, name, **attrs):
+        """Time a section of the run if tracing is on.
+
+        .. versionadded:: 1.37
+
+        Use as a context manager. If the ``WF_TRACE`` variable is set,
+        the timings of all spans of the run are appended to a trace
+        log when :meth:`run` finishes. See :mod:`workflow.tracing` for
+        details.
+
+        :param name: name of section, e.g. ``filter``
+        :type name: ``str``
+        :param attrs: attributes of the section, e.g. ``items=100``.
+            More can be added with the returned span's ``set()``
+            method.
+        :returns: :class:`~workflow.tracing.Span` (or a falsy dummy span
+            if tracing is off)
+
+        """
+        return tracing.span(name, **attrs)
+
+    def _write_trace(self):
+        """Append spans of this run to the trace log."""
+        self._tracer.attrs.update(argv=sys.argv[1:], version=unicode(
+                                  self.version or ''))
+        try:
+            self._tracer.write(tracing.trace_path(self.cachedir))
+        except (IOError, OSError) as err:
+            self.logger.warning('could not write trace: %s', err)
+
+    def _run_profiled(self, func):
+        """Call ``func`` under :mod:`cProfile` and save its stats."""
+        profiler = profiling.start()
+        try:
+            func(self)
+        finally:
+            path = profiling.save(profiler, self.cachedir,
+                                  self.metrics.command)
+            self.logger.info('saved profile to %s', path)
+
+    @property
+    def _snapshot(self):
+        """:class:`~workflow.state.Snapshot` of metadata and state.
+
+        Only saved if Alfred has set the cache directory, as finding
+        the default one needs the bundle ID from the snapshot.
+
+        """
+        if self._state is None:
+            path = None
+            if self.alfred_env.get('workflow_cache'):
+                path = self.cachefile(state.FILENAME)
+            self._state = state.Snapshot(path)
+        return self._state
+
+    def _info_summary(self):
+        """``bundleid``, ``name`` and ``version`` from ``info.plist``."""
+        if self._info_loaded:
+            return self._info
+
+        return self._snapshot.get('info', self.workflowfile('info.plist'),
+                                  self._read_info_summary) or {}
+
+    def _read_info_summary(self, path):
+        """Read keys used by :meth:`_info_summary` from ``path``."""
+        import plistlib
+        with self.span('info.plist'):
+            info = plistlib.readPlist(path)
+        return dict((k, info[k]) for k in ('bundleid', 'name', 'version')
+                    if k in info)
+
+    def _save_metrics(self):
+        """Append metrics of this run to the metrics log."""
+        try:
+            logpath = self.cachefile(metrics.LOGNAME)
+            size = self.metrics.save(logpath)
+            path = os.getenv(metrics.TEXTFILE_VAR)
+            if path or size > metrics.COMPACT_SIZE:
+                store = metrics.aggregate(self.cachefile(metrics.FILENAME),
+                                          logpath)
+                if path:
+                    metrics.write_textfile(os.path.expanduser(path), store,
+                                           {'workflow': self.bundleid})
+        except (IOError, OSError) as err:
+            self.logger.warning('could not save metrics: %s', err)
+
     # Alfred feedback methods ------------------------------------------
 
     def add_item(self, title, subtitle='', modifier_subtitles=None, arg=None,
@@ -2169,12 +2712,14 @@ class Workflow(object):
 
     def send_feedback(self):
         """Print stored items to console/Alfred as XML."""
-        root = ET.Element('items')
-        for item in self._items:
-            root.append(item.elem)
-        sys.stdout.write('<?xml version="1.0" encoding="utf-8"?>\n')
-        sys.stdout.write(ET.tostring(root).encode('utf-8'))
-        sys.stdout.flush()
+        with self.span('feedback', items=len(self._items)):
+            ET = _etree()
+            root = ET.Element('items')
+            for item in self._items:
+                root.append(item.elem)
+            sys.stdout.write('<?xml version="1.0" encoding="utf-8"?>\n')
+            sys.stdout.write(ET.tostring(root).encode('utf-8'))
+            sys.stdout.flush()
 
     ####################################################################
     # Updating methods
@@ -2209,7 +2754,7 @@ class Workflow(object):
         """
         if self._last_version_run is UNSET:
 
-            version = self.settings.get('__workflow_last_version')
+            version = self._setting('__workflow_last_version')
             if version:
                 from update import Version
                 version = Version(version)
@@ -2243,7 +2788,9 @@ class Workflow(object):
             from update import Version
             version = Version(version)
 
-        self.settings['__workflow_last_version'] = str(version)
+        version = str(version)
+        if self._setting('__workflow_last_version') != version:
+            self.settings['__workflow_last_version'] = version
 
         self.logger.debug('set last run version: %s', version)
 
@@ -2255,16 +2802,17 @@ class Workflow(object):
 
         .. versionadded:: 1.9
 
+        .. versionchanged:: 1.37
+           The update status is read from the state snapshot (see
+           :mod:`workflow.state`) and only unpickled when it changes.
+
         See :ref:`guide-updates` in the :ref:`user-manual` for detailed
         information on how to enable your workflow to update itself.
 
         :returns: ``True`` if an update is available, else ``False``
 
         """
-        # Create a new workflow object to ensure standard serialiser
-        # is used (update.py is called without the user's settings)
-        update_data = Workflow().cached_data('__workflow_update_status',
-                                             max_age=0)
+        update_data = self._update_status()
 
         self.logger.debug('update_data: %r', update_data)
 
@@ -2287,7 +2835,7 @@ class Workflow(object):
         if self._update_settings.get('prereleases'):
             return True
 
-        return self.settings.get('__workflow_prereleases') or False
+        return self._setting('__workflow_prereleases') or False
 
     def check_update(self, force=False):
         """Call update script if it's time to check for a new release.
@@ -2307,13 +2855,15 @@ class Workflow(object):
         frequency = self._update_settings.get('frequency',
                                               DEFAULT_UPDATE_FREQUENCY)
 
-        if not force and not self.settings.get('__workflow_autoupdate', True):
+        if not force and not self._setting('__workflow_autoupdate', True):
             self.logger.debug('Auto update turned off by user')
             return
 
         # Check for new version if it's time
-        if (force or not self.cached_data_fresh(
-                '__workflow_update_status', frequency * 86400)):
+        self._update_status()
+        checked = self._snapshot.mtime('update')
+        if (force or not checked or
+                time.time() - checked >= frequency * 86400):
 
             github_slug = self._update_settings['github_slug']
             # version = self._update_settings['version']
@@ -2325,7 +2875,7 @@ class Workflow(object):
             update_script = os.path.join(os.path.dirname(__file__),
                                          b'update.py')
 
-            cmd = ['/usr/bin/python', update_script, 'check', github_slug,
+            cmd = [sys.executable, update_script, 'check', github_slug,
                    version]
 
             if self.prereleases:
@@ -2338,6 +2888,14 @@ class Workflow(object):
         else:
             self.logger.debug('update check not due')
 
+    def _update_status(self):
+        """Return result of last update check (or ``None``)."""
+        # Always the standard serialiser: update.py is called without
+        # the user's settings
+        return self._snapshot.get(
+            'update', self.cachefile('__workflow_update_status.cpickle'),
+            _read_pickle)
+
     def start_update(self):
         """Check for update and download and install new workflow file.
 
@@ -2365,7 +2923,7 @@ class Workflow(object):
         update_script = os.path.join(os.path.dirname(__file__),
                                      b'update.py')
 
-        cmd = ['/usr/bin/python', update_script, 'install', github_slug,
+        cmd = [sys.executable, update_script, 'install', github_slug,
                version]
 
         if self.prereleases:
@@ -2453,6 +3011,7 @@ class Workflow(object):
             h = groups.get('hex')
             password = groups.get('pw')
             if h:
+                import binascii
                 password = unicode(binascii.unhexlify(h), 'utf-8')
 
         self.logger.debug('got password : %s:%s', service, account)
@@ -2589,9 +3148,63 @@ class Workflow(object):
             if not isatty:
                 self.send_feedback()
 
+        # Metrics
+        def show_stats():
+            """Display metrics of the last few days in Alfred."""
+            store = metrics.aggregate(self.cachefile(metrics.FILENAME),
+                                      self.cachefile(metrics.LOGNAME))
+            isatty = sys.stderr.isatty()
+            for title, subtitle in metrics.report(store):
+                self.logger.info('%s: %s', title, subtitle)
+                if not isatty:
+                    self.add_item(title, subtitle, icon=ICON_INFO)
+
+            if not isatty:
+                self.send_feedback()
+
+            # Don't run the workflow
+            sys.exit(0)
+
+        # Profiling
+        def profile_on():
+            profiling.arm(self.cachedir)
+            return 'Profiling the next {0} runs'.format(profiling.RUNS)
+
+        def show_profiles():
+            """Display slowest functions of saved profiles in Alfred."""
+            isatty = sys.stderr.isatty()
+            paths = profiling.profiles(self.cachedir)
+            if not paths:
+                return 'No profiles. Use workflow:profile to make some'
+
+            total, rows = profiling.summary(paths)
+            lines = [('Slowest functions in {0} profiled runs'.format(
+                      len(paths)), '{0:0.0f}ms in total · {1}'.format(
+                      total * 1000, os.path.dirname(paths[0])))]
+            for name, location, calls, own, cumulative in rows:
+                lines.append(('{0}  {1}'.format(name, location),
+                              '{0:0.1f}ms own · {1:0.1f}ms with callees · '
+                              '{2} calls · {3:0.0%} of time'.format(
+                                  own * 1000, cumulative * 1000, calls,
+                                  own / total if total else 0)))
+
+            for title, subtitle in lines:
+                self.logger.info('%s: %s', title, subtitle)
+                if not isatty:
+                    self.add_item(title, subtitle, icon=ICON_INFO)
+
+            if not isatty:
+                self.send_feedback()
+
+            # Don't run the workflow
+            sys.exit(0)
+
         self.magic_arguments['help'] = do_help
         self.magic_arguments['magic'] = list_magic
         self.magic_arguments['version'] = show_version
+        self.magic_arguments['stats'] = show_stats
+        self.magic_arguments['profile'] = profile_on
+        self.magic_arguments['profiles'] = show_profiles
 
     def clear_cache(self, filter_func=lambda f: True):
         """Delete all files in workflow's :attr:`cachedir`.
@@ -2636,27 +3249,33 @@ class Workflow(object):
 
     def open_log(self):
         """Open :attr:`logfile` in default app (usually Console.app)."""
+        import subprocess
         subprocess.call(['open', self.logfile])
 
     def open_cachedir(self):
         """Open the workflow's :attr:`cachedir` in Finder."""
+        import subprocess
         subprocess.call(['open', self.cachedir])
 
     def open_datadir(self):
         """Open the workflow's :attr:`datadir` in Finder."""
+        import subprocess
         subprocess.call(['open', self.datadir])
 
     def open_workflowdir(self):
         """Open the workflow's :attr:`workflowdir` in Finder."""
+        import subprocess
         subprocess.call(['open', self.workflowdir])
 
     def open_terminal(self):
         """Open a Terminal window at workflow's :attr:`workflowdir`."""
+        import subprocess
         subprocess.call(['open', '-a', 'Terminal',
                         self.workflowdir])
 
     def open_help(self):
         """Open :attr:`help_url` in default browser."""
+        import subprocess
         subprocess.call(['open', self.help_url])
 
         return 'Opening workflow help URL in browser'
@@ -2755,6 +3374,7 @@ class Workflow(object):
                     continue
                 path = os.path.join(dirpath, filename)
                 if os.path.isdir(path):
+                    import shutil
                     shutil.rmtree(path)
                 else:
                     os.unlink(path)
@@ -2763,7 +3383,9 @@ class Workflow(object):
     def _load_info_plist(self):
         """Load workflow info from ``info.plist``."""
         # info.plist should be in the directory above this one
-        self._info = plistlib.readPlist(self.workflowfile('info.plist'))
+        import plistlib
+        with self.span('info.plist'):
+            self._info = plistlib.readPlist(self.workflowfile('info.plist'))
         self._info_loaded = True
 
     def _create(self, dirpath):
@@ -2804,6 +3426,7 @@ class Workflow(object):
 
         """
         cmd = ['security', action, '-s', service, '-a', account] + list(args)
+        import subprocess
         p = subprocess.Popen(cmd, stdout=subprocess.PIPE,
                              stderr=subprocess.STDOUT)
         stdout, _ = p.communicate()
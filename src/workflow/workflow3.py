@@ -397,6 +397,22 @@ class Item3(object):
 
         return o
 
+    @property
+    def json(self):
+        """Item serialized as a JSON object.
+
+        .. versionadded:: 1.37
+
+        The returned fragment may be cached and passed to
+        :meth:`Workflow3.add_rendered_item()` on a later run to avoid
+        building the item again.
+
+        Returns:
+            str: JSON object for this item.
+
+        """
+        return json.dumps(self.obj)
+
     def _icon(self):
         """Return `icon` object for item.
 
@@ -446,6 +462,37 @@ class Item3(object):
         return None
 
 
+class RenderedItem(object):
+    """A feedback item that has already been serialized to JSON.
+
+    .. versionadded:: 1.37
+
+    Don't use this class directly, but rather use
+    :meth:`Workflow3.add_rendered_item()`.
+
+    Args:
+        json (str): JSON object as returned by :attr:`Item3.json`.
+
+    Attributes:
+        json (str): JSON object for this item.
+
+    """
+
+    def __init__(self, json):
+        """Create a new :class:`RenderedItem`."""
+        self.json = json
+
+    @property
+    def obj(self):
+        """Item formatted for JSON serialization.
+
+        Returns:
+            dict: Data suitable for Alfred 3 feedback.
+
+        """
+        return json.loads(self.json)
+
+
 class Workflow3(Workflow):
     """Workflow class that generates Alfred 3 feedback.
 
@@ -469,6 +516,7 @@ class Workflow3(Workflow):
         Workflow.__init__(self, **kwargs)
         self.variables = {}
         self._rerun = 0
+        self._cache = None
         # Get session ID from environment if present
         self._session_id = os.getenv('_WF_SESSION_ID') or None
         if self._session_id:
@@ -504,6 +552,43 @@ class Workflow3(Workflow):
         """
         self._rerun = seconds
 
+    def cache_output(self, seconds, loose_reload=False):
+        """Tell Alfred to cache the feedback for ``seconds``.
+
+        .. versionadded:: 1.37
+
+        Alfred 4.5+ re-uses cached feedback instead of running the
+        Script Filter again until the cache expires. With
+        ``loose_reload``, Alfred shows the cached feedback immediately
+        but still runs the script to refresh it.
+
+        Alfred's cache ignores the query, so only use it in Script
+        Filters whose output doesn't depend on the query, i.e. ones
+        with "Alfred filters results" turned on.
+
+        The cache directive is not sent if :attr:`rerun` is set, as
+        that means the feedback isn't final (e.g. a background job is
+        still running).
+
+        Args:
+            seconds (int): How long Alfred should cache the feedback.
+                Alfred accepts values from 5 to 86400 (1 day), so
+                ``seconds`` is clamped to that range. If ``seconds``
+                is 0 or negative (e.g. the data has already expired),
+                caching is turned off.
+            loose_reload (bool, optional): Show stale results while
+                re-running the Script Filter.
+
+        """
+        if seconds <= 0:
+            self._cache = None
+            return
+
+        seconds = min(max(int(seconds), 5), 86400)
+        self._cache = {'seconds': seconds}
+        if loose_reload:
+            self._cache['loosereload'] = True
+
     @property
     def session_id(self):
         """A unique session ID every time the user uses the workflow.
@@ -589,6 +674,31 @@ class Workflow3(Workflow):
         self._items.append(item)
         return item
 
+    def add_rendered_item(self, json):
+        """Add a pre-rendered item to be output to Alfred.
+
+        .. versionadded:: 1.37
+
+        ``json`` is the JSON object of an :class:`Item3`, as returned
+        by its :attr:`~Item3.json` property. Cache these fragments to
+        send large result sets to Alfred without building every
+        :class:`Item3` on every run.
+
+        Unlike :meth:`add_item()`, workflow variables are not copied
+        to the item. They are still passed to downstream objects via
+        the top-level ``variables`` of the feedback.
+
+        Args:
+            json (str): JSON object for the item.
+
+        Returns:
+            RenderedItem: Alfred feedback item.
+
+        """
+        item = RenderedItem(json)
+        self._items.append(item)
+        return item
+
     @property
     def _session_prefix(self):
         """Filename prefix for current session."""
@@ -682,11 +792,25 @@ class Workflow3(Workflow):
         for item in self._items:
             items.append(item.obj)
 
-        o = {'items': items}
+        o = self._envelope()
+        o['items'] = items
+        return o
+
+    def _envelope(self):
+        """Top-level feedback values other than ``items``.
+
+        Returns:
+            dict: Feedback options, e.g. ``variables``, ``rerun``
+                and ``cache``.
+
+        """
+        o = {}
         if self.variables:
             o['variables'] = self.variables
         if self.rerun:
             o['rerun'] = self.rerun
+        elif self._cache:
+            o['cache'] = self._cache
         return o
 
     def warn_empty(self, title, subtitle=u'', icon=None):
@@ -715,6 +839,24 @@ class Workflow3(Workflow):
         return self.add_item(title, subtitle, icon=icon)
 
     def send_feedback(self):
-        """Print stored items to console/Alfred as JSON."""
-        json.dump(self.obj, sys.stdout)
-        sys.stdout.flush()
+        """Print stored items to console/Alfred as JSON.
+
+        .. versionchanged:: 1.37
+
+        Items are serialized individually, so pre-rendered items (see
+        :meth:`add_rendered_item()`) are written out as-is.
+
+        """
+        with self.span('feedback', items=len(self._items)) as sp:
+            items = ', '.join([item.json for item in self._items])
+            output = '{"items": [' + items + ']'
+
+            envelope = self._envelope()
+            if envelope:
+                output += ', ' + json.dumps(envelope)[1:-1]
+
+            output = (output + '}').encode('utf-8')
+            sys.stdout.write(output)
+            sys.stdout.flush()
+            if sp:
+                sp.set(bytes=len(output))